@@ -0,0 +1,715 @@
+#!/usr/bin/env python3
+"""
+NarrAider benchmark suite
+Created by Andreas "Uriel1339" Lopez
+
+Micro and end-to-end benchmarks for NarrAider's generation pipeline.
+Run `python benchmark.py --help` to list the available benchmarks.
+MIT License - Free to use, modify, and distribute.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import narraider
+from narraider import clean_output, StreamSanitizer, LEAKED_INSTRUCTION_MARKERS, ModelPrewarmer
+
+
+# ============================================================================
+# OUTPUT SANITIZER
+# ============================================================================
+
+def legacy_clean_output(text, output_format):
+    """Reference copy of the original multi-pass regex clean_output()."""
+    instruction_patterns = [
+        r'^.*?FORMAT REQUIREMENT:.*?\n',
+        r'^.*?IMPORTANT:.*?\n',
+        r'^.*?Do not include these instructions.*?\n',
+        r'^.*?The scene must follow all requirements.*?\n',
+        r'^.*?Each sentence should be clear and concise.*?\n',
+        r'^.*?demonstrate a skilled understanding.*?\n',
+        r'^.*?Target length:.*?\n',
+        r'^.*?Requirements:.*?\n\n',
+    ]
+
+    cleaned = text
+    for pattern in instruction_patterns:
+        cleaned = re.sub(pattern, '', cleaned, flags=re.IGNORECASE | re.MULTILINE)
+
+    return cleaned.strip()
+
+# Hand-picked cases covering the edge cases of the original regexes
+REGRESSION_CORPUS = [
+    "",
+    "   \n\n  ",
+    "Plain prose with no leaked instructions.",
+    "FORMAT REQUIREMENT: Plain text only.\nThe story begins.",
+    "The story begins.\nFORMAT REQUIREMENT: Plain text only.",
+    "The story begins.\nFORMAT REQUIREMENT: Plain text only.\n",
+    "  important: lowercase marker\nKept line\n",
+    "Intro\nRequirements:\n\n- Length: 500 words\nBody",
+    "Intro\nRequirements:\n- Length: 500 words\n\nBody",
+    "Requirements: a\nRequirements: b\n\nBody",
+    "Requirements: a\nTarget length: 800 words\n\nBody",
+    "Requirements: a\n\n\n\nBody",
+    "Requirements: at the very end\n\n",
+    "Requirements: at the very end\n",
+    "Mid-line mention of Target length: 900 words is still removed\nNext",
+    "ſcene text with a long s\nDo not include these instructions\nEnd",
+    "Carriage\r\nIMPORTANT: windows line\r\nendings\r\n",
+    "**BASIC INFORMATION**\n- Full Name: Elara\n\nEach sentence should be clear and concise.\n",
+    "Line one\n\nThe scene must follow all requirements listed.\n\nLine three",
+    "She wanted to demonstrate a skilled understanding of the blade.\nShe did.",
+]
+
+_FUZZ_FRAGMENTS = [
+    "She gasped.", "The rain fell on the tower.", "", " ", "\t",
+    "FORMAT REQUIREMENT: Use markdown.", "important: keep it short",
+    "Requirements:", "requirements: none", "Target length: 500-800 words",
+    "Do not include these instructions in your output.",
+    "**PERSONALITY**", "- Brave but reckless", "élève", "Kelvin",
+]
+
+def _random_document(rng, lines):
+    """Build a random document from fragments that exercise every pattern."""
+    text = "\n".join(rng.choice(_FUZZ_FRAGMENTS) for _ in range(lines))
+    if rng.random() < 0.5:
+        text += "\n" * rng.randint(1, 3)
+    return text
+
+def _stream_clean(text, rng):
+    """Sanitize text fed to a StreamSanitizer in random token-sized chunks."""
+    sanitizer = StreamSanitizer()
+    out = []
+    pos = 0
+    while pos < len(text):
+        step = rng.randint(1, 12)
+        out.append(sanitizer.feed(text[pos:pos + step]))
+        pos += step
+    out.append(sanitizer.finish())
+    return "".join(out)
+
+def check_sanitizer_regressions(fuzz_cases=2000, seed=1339):
+    """Compare clean_output and streamed sanitizing against the legacy regexes."""
+    rng = random.Random(seed)
+    corpus = list(REGRESSION_CORPUS)
+    corpus += [_random_document(rng, rng.randint(1, 40)) for _ in range(fuzz_cases)]
+
+    failures = 0
+    for text in corpus:
+        expected = legacy_clean_output(text, ".md")
+        if clean_output(text, ".md") != expected or _stream_clean(text, rng) != expected:
+            failures += 1
+            if failures <= 5:
+                print(f"   [X] Mismatch for input: {text[:80]!r}")
+    return len(corpus), failures
+
+def _large_document(size_mb, seed=1339):
+    """Build a multi-megabyte concept-like document with a few leaked lines."""
+    rng = random.Random(seed)
+    paragraph = ("The caravan crossed the salt flats at dusk, its lanterns swaying "
+                 "like a string of captured stars. ") * 6
+    lines = []
+    size = 0
+    while size < size_mb * 1024 * 1024:
+        if rng.random() < 0.02:
+            line = rng.choice(LEAKED_INSTRUCTION_MARKERS) + " leaked instruction text"
+        else:
+            line = paragraph
+        lines.append(line)
+        lines.append("")
+        size += len(line) + 2
+    return "\n".join(lines)
+
+def bench_sanitizer(args):
+    """Regression check and throughput comparison for the output sanitizer."""
+    print("=" * 60)
+    print("Output sanitizer benchmark")
+    print("=" * 60)
+
+    print("\n1. Regression corpus (legacy regexes vs. new sanitizer)...")
+    total, failures = check_sanitizer_regressions(args.fuzz_cases)
+    if failures:
+        print(f"   [X] {failures} of {total} cases differ")
+    else:
+        print(f"   [OK] {total} cases byte-identical (batch and streamed)")
+
+    print("\n2. Throughput...")
+    for size_mb in args.sizes:
+        text = _large_document(size_mb)
+
+        start = time.perf_counter()
+        legacy_clean_output(text, ".md")
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        clean_output(text, ".md")
+        new_time = time.perf_counter() - start
+
+        sanitizer = StreamSanitizer()
+        start = time.perf_counter()
+        for pos in range(0, len(text), 16):
+            sanitizer.feed(text[pos:pos + 16])
+        sanitizer.finish()
+        stream_time = time.perf_counter() - start
+
+        print(f"   {size_mb:>3} MB: legacy {legacy_time * 1000:8.1f} ms | "
+              f"clean_output {new_time * 1000:8.1f} ms | "
+              f"streamed (16-char chunks) {stream_time * 1000:8.1f} ms | "
+              f"speedup {legacy_time / new_time:.1f}x")
+
+    return 1 if failures else 0
+
+
+# ============================================================================
+# MODEL PREWARM
+# ============================================================================
+
+def _evict_from_page_cache(path):
+    """Drop a file's cached pages so the next load is cold. Returns False if unsupported."""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    with open(path, 'rb') as f:
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    return True
+
+def _time_to_ready(model_path, model_type):
+    """Seconds from launching llama-server until /health reports ready."""
+    start = time.perf_counter()
+    ready = narraider.start_server(model_path, model_type)
+    elapsed = time.perf_counter() - start
+    narraider.kill_server()
+    return elapsed if ready else None
+
+def bench_prewarm(args):
+    """Compare server time-to-ready from a cold file cache with and without prewarm."""
+    print("=" * 60)
+    print("Model prewarm benchmark")
+    print("=" * 60)
+
+    narraider.load_config()
+    model_path = narraider.get_model_path(args.model)
+    if not model_path or not os.path.exists(model_path):
+        print(f"ERROR: No model file configured for '{args.model}'")
+        return 1
+
+    size_gb = os.path.getsize(model_path) / (1024 ** 3)
+    print(f"\nModel: {model_path} ({size_gb:.1f} GB)")
+    if not _evict_from_page_cache(model_path):
+        print("WARNING: This platform cannot evict files from the page cache; "
+              "cold runs are only cold after a reboot.")
+
+    results = {"cold": [], "prewarm, then start": [], "prewarm with start": []}
+    prewarm_times = []
+    for run in range(1, args.runs + 1):
+        print(f"\nRun {run}/{args.runs}")
+
+        _evict_from_page_cache(model_path)
+        results["cold"].append(_time_to_ready(model_path, args.model))
+
+        # Prewarm finished before the server starts (user still typing)
+        _evict_from_page_cache(model_path)
+        prewarmer = ModelPrewarmer(model_path).start()
+        prewarmer.wait()
+        prewarm_times.append(prewarmer.seconds)
+        results["prewarm, then start"].append(_time_to_ready(model_path, args.model))
+
+        # Prewarm started together with the server (no head start)
+        _evict_from_page_cache(model_path)
+        prewarmer = ModelPrewarmer(model_path).start()
+        results["prewarm with start"].append(_time_to_ready(model_path, args.model))
+        prewarmer.stop()
+        prewarmer.wait()
+
+    print("\nMedian time-to-ready:")
+    for name, times in results.items():
+        times = [t for t in times if t is not None]
+        if times:
+            print(f"   {name:<22} {statistics.median(times):7.1f} s")
+        else:
+            print(f"   {name:<22} failed")
+    prewarm_times = [t for t in prewarm_times if t]
+    if prewarm_times:
+        print(f"   (prewarm itself took {statistics.median(prewarm_times):.1f} s, "
+              f"{size_gb / statistics.median(prewarm_times):.2f} GB/s)")
+    return 0
+
+# ============================================================================
+# MODEL ROUTING
+# ============================================================================
+
+# Mix of short and long jobs, interleaved the way a writing session would be
+ROUTING_WORKLOAD = [
+    ("image-prompt", "Elven ranger in a rain-soaked forest, hooded cloak"),
+    ("character", "Retired smuggler who now runs an orphanage"),
+    ("image-prompt", "Dwarven smith at the forge, sparks flying"),
+    ("scene-dialogue", "Two rivals forced to share a lifeboat"),
+    ("artifact", "A compass that points to what you fear most"),
+    ("image-prompt", "Clockwork owl perched on a wizard's shoulder"),
+]
+
+def _run_workload(workload, model_type=None):
+    """Generate every job in the workload; returns per-job (content type, seconds, words)."""
+    jobs = []
+    for content_type, prompt in workload:
+        start = time.perf_counter()
+        result = narraider.generate_content(content_type, prompt, model_type)
+        jobs.append((content_type, time.perf_counter() - start, len(result.split()) if result else 0))
+    return jobs
+
+def bench_routing(args):
+    """Compare a mixed workload on a single model role against the routing table."""
+    print("=" * 60)
+    print("Model routing throughput benchmark")
+    print("=" * 60)
+
+    narraider.load_config()
+    # Keep servers loaded between jobs so only real model switches cost a load
+    narraider.CONFIG["keep_server_loaded"] = True
+    workload = ROUTING_WORKLOAD * args.repeat
+
+    print("\nRouting table:")
+    for content_type in sorted({c for c, _ in workload}):
+        print(f"   {content_type:<16} -> {narraider.route_model(content_type)}")
+
+    scenarios = [(f"all on {args.model}", args.model), ("routed", None)]
+    for name, model_type in scenarios:
+        print(f"\nScenario: {name} ({len(workload)} jobs)")
+        narraider.kill_server()
+        start = time.perf_counter()
+        jobs = _run_workload(workload, model_type)
+        total = time.perf_counter() - start
+        narraider.kill_server()
+
+        words = sum(w for _, _, w in jobs)
+        failed = sum(1 for _, _, w in jobs if not w)
+        print(f"   Total:      {total:7.1f} s ({len(jobs) / total * 60:.1f} jobs/min, {words / total:.1f} words/s)")
+        if failed:
+            print(f"   Failed:     {failed} job(s)")
+        for content_type in sorted({c for c, _, _ in jobs}):
+            times = [t for c, t, w in jobs if c == content_type and w]
+            if times:
+                print(f"   {content_type:<16} median {statistics.median(times):6.1f} s")
+    return 0
+
+# ============================================================================
+# SPECULATIVE DECODING
+# ============================================================================
+
+def _metric_events(event, since):
+    """Metrics events of one kind recorded after the first `since` events."""
+    return [e for e in list(narraider.METRIC_EVENTS)[since:] if e["event"] == event]
+
+def bench_speculative(args):
+    """Compare decode speed of a model role with and without its draft model."""
+    print("=" * 60)
+    print("Speculative decoding benchmark")
+    print("=" * 60)
+
+    narraider.load_config()
+    role = narraider.get_model_role(args.model)
+    if not role:
+        print(f"ERROR: Unknown model role '{args.model}'")
+        return 1
+    draft = args.draft or role["draft"]
+    if not draft:
+        print(f"ERROR: '{args.model}' has no draft model; configure one or pass --draft")
+        return 1
+
+    print(f"\nModel: {role['base']}")
+    print(f"Draft: {draft}")
+    narraider.CONFIG["keep_server_loaded"] = True
+
+    for name, draft_path in (("without draft", None), ("with draft", draft)):
+        # Only this role, so no other role's draft applies to the same base model
+        narraider.CONFIG["models"] = {args.model: {**role, "draft": draft_path}}
+        narraider.kill_server()
+        print(f"\nScenario: {name}")
+
+        since = len(narraider.METRIC_EVENTS)
+        for run in range(args.runs):
+            narraider.generate_content(args.type, args.prompt, args.model)
+        narraider.kill_server()
+
+        speeds = [e["tokens_per_second"] for e in _metric_events("generation", since) if e.get("tokens_per_second")]
+        if not speeds:
+            print("   failed")
+            continue
+        print(f"   Median speed: {statistics.median(speeds):7.1f} tokens/s")
+        drafts = _metric_events("speculative", since)
+        if drafts:
+            drafted = sum(e["draft_tokens"] for e in drafts)
+            accepted = sum(e["accepted_tokens"] for e in drafts)
+            print(f"   Acceptance:   {accepted / drafted:7.1%} ({accepted}/{drafted} drafted tokens)")
+        elif draft_path:
+            print("   WARNING: No draft statistics reported (was the draft model rejected?)")
+    return 0
+
+# ============================================================================
+# CHAT VERSUS COMPLETION REQUESTS
+# ============================================================================
+
+def bench_chat(args):
+    """Prompt-cache reuse and latency of the completion and chat request styles."""
+    print("=" * 60)
+    print("Request style benchmark (completion vs chat)")
+    print("=" * 60)
+
+    narraider.load_config()
+    narraider.CONFIG["keep_server_loaded"] = True
+    # Generations stopped at a word target end before the server reports cache statistics
+    narraider.CONFIG["enforce_length_targets"] = False
+    workload = ROUTING_WORKLOAD * args.repeat
+    print(f"\n{len(workload)} jobs on {args.model} with the '{args.system}' system prompt")
+
+    for style in ("completion", "chat"):
+        narraider.CONFIG["request_style"] = {"default": style, "roles": {}}
+        narraider.kill_server()
+        print(f"\nScenario: {style}")
+
+        since = len(narraider.METRIC_EVENTS)
+        for content_type, prompt in workload:
+            narraider.generate_content(content_type, prompt, args.model, system_prompt=args.system,
+                                       on_text=lambda text: None)
+        narraider.kill_server()
+
+        runs = _metric_events("generation", since)
+        if not runs:
+            print("   failed")
+            continue
+        first_tokens = [e["time_to_first_token"] for e in runs if e.get("time_to_first_token") is not None]
+        print(f"   Median total:        {statistics.median(e['seconds'] for e in runs):7.2f} s")
+        if first_tokens:
+            print(f"   Median first token:  {statistics.median(first_tokens):7.3f} s")
+        cached = [e for e in runs if e.get("prompt_tokens")]
+        if cached:
+            prompt_tokens = sum(e["prompt_tokens"] for e in cached)
+            hits = sum(e["cached_prompt_tokens"] for e in cached)
+            print(f"   Prompt cache hits:   {hits / prompt_tokens:7.1%} ({hits}/{prompt_tokens} prompt tokens)")
+        else:
+            print("   Prompt cache hits:   not reported by the server")
+    return 0
+
+# ============================================================================
+# BACKEND LOAD BALANCING
+# ============================================================================
+
+class FakeBackend:
+    """In-process stand-in for a llama-server with a fixed decode speed.
+
+    Each of its slots streams tokens_per_second tokens per second; requests
+    beyond the slots wait for one, as they would on a real server.
+    """
+
+    def __init__(self, slots=1, tokens=200, tokens_per_second=100):
+        self.slots = threading.Semaphore(slots)
+        self.tokens = tokens
+        self.delay = 1 / tokens_per_second
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _handler(self):
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.send_response(200 if self.path == "/health" else 404)
+                self.end_headers()
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                tokens = min(backend.tokens, payload.get("max_tokens", backend.tokens))
+                with backend.slots:
+                    self.send_response(200)
+                    if not payload.get("stream"):
+                        time.sleep(backend.delay * tokens)
+                        body = {"content": " ".join(f"w{i}" for i in range(tokens)), "stop": True,
+                                "tokens_predicted": tokens}
+                        self.send_header("Content-Type", "application/json")
+                        self.end_headers()
+                        self.wfile.write(json.dumps(body).encode())
+                        return
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    try:
+                        for i in range(tokens):
+                            time.sleep(backend.delay)
+                            self.wfile.write(f"data: {json.dumps({'content': f' w{i}'})}\n\n".encode())
+                        final = {"content": "", "stop": True, "tokens_predicted": tokens}
+                        self.wfile.write(f"data: {json.dumps(final)}\n\n".encode())
+                    except OSError:
+                        pass  # Client went away
+
+        return Handler
+
+    def stop(self):
+        """Stop answering, like a crashed or unreachable server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+def bench_backends(args):
+    """Batch throughput over one, two, four... simulated backends, with optional failover."""
+    print("=" * 60)
+    print("Backend load balancing benchmark")
+    print("=" * 60)
+
+    narraider.load_config()
+    narraider.CONFIG["degeneration_guard"] = {**narraider.CONFIG.get("degeneration_guard", {}), "enabled": False}
+    jobs = [{"content_type": args.type, "user_prompt": f"Batch job {i}", "model_type": args.model}
+            for i in range(args.jobs)]
+    print(f"\n{args.jobs} jobs of {args.tokens} tokens; each backend: {args.slots} slot(s) "
+          f"at {args.speed} tokens/s")
+
+    baseline = None
+    for count in args.fake:
+        fakes = [FakeBackend(args.slots, args.tokens, args.speed) for _ in range(count)]
+        narraider.CONFIG["backends"] = [{"url": f.url, "model": args.model, "slots": args.slots} for f in fakes]
+        if args.fail and count > 1:
+            # Take one backend down while the batch runs
+            threading.Timer(args.tokens / args.speed / 2, fakes[0].stop).start()
+
+        start = time.perf_counter()
+        results = narraider.generate_many(jobs)
+        total = time.perf_counter() - start
+        for fake in fakes[1:] if args.fail and count > 1 else fakes:
+            fake.stop()
+
+        rate = len(jobs) / total
+        baseline = baseline or rate / count
+        failed = sum(1 for r in results if not r)
+        print(f"\n{count} backend(s): {total:6.1f} s, {rate * 60:6.1f} jobs/min "
+              f"(scaling {rate / baseline:4.1f}x, ideal {count}x)")
+        if failed:
+            print(f"   Failed: {failed} job(s)")
+        for status in narraider._backend_pool().status():
+            print(f"   {status['url']}: {status['completed']} completed, {status['state']}")
+    return 0
+
+# ============================================================================
+# LORE INDEX
+# ============================================================================
+
+def _lore_corpus(folder, count, seed=1339):
+    """Write count character-profile-like documents with made-up names and words.
+
+    Words follow a Zipf distribution like real prose; every document is
+    about a character with a name of its own, mentioned here and there.
+    """
+    rng = random.Random(seed)
+    syllables = ["ka", "ro", "mir", "tha", "el", "dun", "vor", "ith", "sa", "gren", "ul", "bek", "no", "fae"]
+    vocabulary = list({"".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(30000)})
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    names = []
+    for i in range(count):
+        name = f"{''.join(rng.choice(syllables) for _ in range(3)).title()} {i:05d}"
+        names.append(name)
+        sections = [f"# {name}"]
+        for heading in ("Appearance", "Personality", "Background", "Secrets"):
+            words = rng.choices(vocabulary, weights, k=rng.randint(60, 140))
+            words[rng.randrange(len(words))] = name
+            sections.append(f"## {heading}\n{' '.join(words)}.")
+        subfolder = folder / ("characters", "magic_systems", "cultures", "scenes")[i % 4]
+        subfolder.mkdir(parents=True, exist_ok=True)
+        (subfolder / f"doc_{i:06d}.md").write_text("\n\n".join(sections), encoding="utf-8")
+    return names
+
+def bench_lore(args):
+    """Index build, incremental update and retrieval latency of the lore index."""
+    import tempfile
+    from narraider_lore import LoreIndex
+
+    print("=" * 60)
+    print("Lore index benchmark")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as temp:
+        folder = Path(temp)
+        start = time.perf_counter()
+        names = _lore_corpus(folder, args.documents)
+        print(f"\nWrote {args.documents} documents in {time.perf_counter() - start:.1f} s")
+
+        index = LoreIndex(folder)
+        start = time.perf_counter()
+        index.rebuild()
+        stats = index.stats()
+        size = sum(f.stat().st_size for f in folder.glob(".lore_index.sqlite*"))
+        print(f"Full index:          {time.perf_counter() - start:8.1f} s  "
+              f"({stats['passages']} passages, {size / 1024 / 1024:.0f} MB)")
+
+        start = time.perf_counter()
+        index.update()
+        print(f"Update, no changes:  {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+        path = folder / "characters" / "doc_new.md"
+        path.write_text(f"# New Hero\n\nSworn enemy of {names[0]}.", encoding="utf-8")
+        timings = []
+        for _ in range(20):
+            start = time.perf_counter()
+            index.add(path)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"Add one file:        {statistics.median(timings):8.1f} ms (median)")
+
+        rng = random.Random(7)
+        timings = []
+        found = 0
+        for _ in range(args.queries):
+            name = rng.choice(names)
+            start = time.perf_counter()
+            _, hits = index.context(f"A tense meeting between {name} and a stranger at the harbor", 600)
+            timings.append((time.perf_counter() - start) * 1000)
+            found += any(hit["title"] == name for hit in hits)
+        timings.sort()
+        print(f"Retrieval:           {statistics.median(timings):8.1f} ms median, "
+              f"{timings[int(len(timings) * 0.95)]:.1f} ms p95 over {args.queries} queries")
+        print(f"Named document found: {found}/{args.queries}")
+        index.close()
+    return 0
+
+
+def bench_catalog(args):
+    """Recording, rebuild and search latency of the output catalog."""
+    import tempfile
+    from narraider_catalog import Catalog
+
+    print("=" * 60)
+    print("Output catalog benchmark")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as temp:
+        folder = Path(temp)
+        start = time.perf_counter()
+        names = _lore_corpus(folder, args.documents)
+        print(f"\nWrote {args.documents} documents in {time.perf_counter() - start:.1f} s")
+
+        rng = random.Random(11)
+        catalog = Catalog(folder)
+        paths = sorted(folder.glob("*/doc_*.md"))
+        start = time.perf_counter()
+        timings = []
+        for number, path in enumerate(paths):
+            info = {
+                "prompt": f"{rng.choice(['A gruff', 'A young', 'An exiled', 'A scheming'])} "
+                          f"{rng.choice(['smith', 'envoy', 'healer', 'captain', 'thief'])} called {names[number]}",
+                "model": rng.choice(["worldbuilding", "explicit", "fast"]),
+                "params": {"temperature": 0.8, "seed": number},
+                "timings": {"seconds": round(rng.uniform(20, 120), 1)},
+            }
+            begin = time.perf_counter()
+            catalog.record(path, info=info)
+            timings.append((time.perf_counter() - begin) * 1000)
+        print(f"Record every output: {time.perf_counter() - start:8.1f} s  "
+              f"({statistics.median(timings):.2f} ms median per output)")
+
+        start = time.perf_counter()
+        catalog.rebuild()
+        print(f"Rebuild from journal:{time.perf_counter() - start:8.1f} s")
+
+        queries = {
+            "newest 50": lambda: catalog.search(limit=50),
+            "type filter": lambda: catalog.search(content_type="culture", limit=50),
+            "name": lambda: catalog.search(rng.choice(names), limit=50),
+            "name prefix": lambda: catalog.search(rng.choice(names)[:4], limit=50),
+            "common word": lambda: catalog.search(rng.choice(["gruff", "envoy", "captain"]), limit=50),
+            "word + type": lambda: catalog.search("healer", content_type="scene", limit=50),
+            "common, ranked": lambda: catalog.search(rng.choice(["gruff", "envoy", "captain"]), limit=50, ranked=True),
+        }
+        for label, run in queries.items():
+            timings = []
+            for _ in range(args.queries):
+                begin = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - begin) * 1000)
+            timings.sort()
+            print(f"Search {label + ':':<16}{statistics.median(timings):8.2f} ms median, "
+                  f"{timings[int(len(timings) * 0.95)]:.2f} ms p95")
+
+        catalog.journal.unlink()
+        start = time.perf_counter()
+        catalog.rebuild()
+        print(f"Rebuild from files:  {time.perf_counter() - start:8.1f} s (no journal)")
+        catalog.close()
+    return 0
+
+
+def main():
+    """Benchmark CLI entry point."""
+    parser = argparse.ArgumentParser(description="NarrAider benchmark suite")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    sanitizer = subparsers.add_parser("sanitizer", help="Output sanitizer regression check and microbenchmark")
+    sanitizer.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 16],
+                           help="Input sizes in MB (default: 1 4 16)")
+    sanitizer.add_argument("--fuzz-cases", type=int, default=2000,
+                           help="Number of random documents to compare (default: 2000)")
+    sanitizer.set_defaults(func=bench_sanitizer)
+
+    prewarm = subparsers.add_parser("prewarm", help="Server time-to-ready with and without page-cache prewarm")
+    prewarm.add_argument("--model", default="worldbuilding",
+                         help="Model type from narraider_config.json (default: worldbuilding)")
+    prewarm.add_argument("--runs", type=int, default=3, help="Runs per scenario (default: 3)")
+    prewarm.set_defaults(func=bench_prewarm)
+
+    routing = subparsers.add_parser("routing", help="Mixed workload on one model role versus the routing table")
+    routing.add_argument("--model", default="worldbuilding",
+                         help="Model type for the single-model baseline (default: worldbuilding)")
+    routing.add_argument("--repeat", type=int, default=1, help="Times to repeat the workload (default: 1)")
+    routing.set_defaults(func=bench_routing)
+
+    speculative = subparsers.add_parser("speculative", help="Decode speed with and without a draft model")
+    speculative.add_argument("--model", default="worldbuilding",
+                             help="Model type from narraider_config.json (default: worldbuilding)")
+    speculative.add_argument("--draft", help="Draft model path (default: the role's configured draft)")
+    speculative.add_argument("--type", default="scene-general", help="Content type to generate (default: scene-general)")
+    speculative.add_argument("--prompt", default="A storm rolls over a harbor town at dusk",
+                             help="Prompt to generate from")
+    speculative.add_argument("--runs", type=int, default=3, help="Generations per scenario (default: 3)")
+    speculative.set_defaults(func=bench_speculative)
+
+    chat = subparsers.add_parser("chat", help="Prompt-cache hit rate and latency of completion vs chat requests")
+    chat.add_argument("--model", default="worldbuilding",
+                      help="Model type from narraider_config.json (default: worldbuilding)")
+    chat.add_argument("--system", default="Detailed", help="System prompt to use (default: Detailed)")
+    chat.add_argument("--repeat", type=int, default=1, help="Times to repeat the workload (default: 1)")
+    chat.set_defaults(func=bench_chat)
+
+    backends = subparsers.add_parser("backends", help="Batch throughput over several simulated backends")
+    backends.add_argument("--fake", type=int, nargs="+", default=[1, 2, 4],
+                          help="Numbers of simulated backends to compare (default: 1 2 4)")
+    backends.add_argument("--slots", type=int, default=1, help="Slots per backend (default: 1)")
+    backends.add_argument("--jobs", type=int, default=16, help="Jobs per batch (default: 16)")
+    backends.add_argument("--tokens", type=int, default=200, help="Tokens per job (default: 200)")
+    backends.add_argument("--speed", type=int, default=100, help="Tokens/s per slot (default: 100)")
+    backends.add_argument("--model", default="worldbuilding", help="Model role the backends serve (default: worldbuilding)")
+    backends.add_argument("--type", default="image-prompt", help="Content type to generate (default: image-prompt)")
+    backends.add_argument("--fail", action="store_true", help="Stop one backend halfway through each batch")
+    backends.set_defaults(func=bench_backends)
+
+    lore = subparsers.add_parser("lore", help="Lore index build time and retrieval latency on a synthetic corpus")
+    lore.add_argument("--documents", type=int, default=50000, help="Documents in the corpus (default: 50000)")
+    lore.add_argument("--queries", type=int, default=200, help="Retrieval queries to time (default: 200)")
+    lore.set_defaults(func=bench_lore)
+
+    catalog = subparsers.add_parser("catalog", help="Output catalog recording, rebuild and search latency")
+    catalog.add_argument("--documents", type=int, default=100000, help="Outputs in the corpus (default: 100000)")
+    catalog.add_argument("--queries", type=int, default=200, help="Searches of each kind to time (default: 200)")
+    catalog.set_defaults(func=bench_catalog)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
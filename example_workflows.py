@@ -5,7 +5,7 @@ Example workflows showing how to use NarrAider programmatically
 
 from narraider import (
     load_config, generate_content, save_output,
-    generate_vnpics_json, kill_server
+    generate_vnpics_json, kill_server, prewarm_model_type
 )
 from pathlib import Path
 import json
@@ -21,6 +21,7 @@ def workflow_complete_character(character_prompt):
 
     # Load config
     load_config()
+    prewarm_model_type("worldbuilding")  # Read the model from disk while the batch is set up
 
     try:
         # 1. Generate character profile
@@ -31,9 +32,9 @@ def workflow_complete_character(character_prompt):
             print("Failed to generate profile")
             return
 
-        # 2. Generate image prompt
+        # 2. Generate image prompt (short job: the routing table may send it to a smaller model)
         print("\nGenerating image prompt...\n")
-        image_prompt = generate_content("image-prompt", character_prompt, "worldbuilding")
+        image_prompt = generate_content("image-prompt", character_prompt)
 
         # 3. Save everything
         character_name = character_prompt.split(',')[0].strip()
@@ -72,6 +73,7 @@ def workflow_worldbuilding_package(world_name, setting_description):
     print(f"=== Worldbuilding Package: {world_name} ===\n")
 
     load_config()
+    prewarm_model_type("worldbuilding")  # Read the model from disk while the batch is set up
 
     try:
         # 1. Magic system
@@ -118,6 +120,7 @@ def workflow_scene_sequence(scene_descriptions):
     print("=== Scene Sequence Generation ===\n")
 
     load_config()
+    prewarm_model_type("worldbuilding")  # Read the model from disk while the batch is set up
 
     try:
         for i, (scene_type, description) in enumerate(scene_descriptions, 1):
@@ -11,10 +11,35 @@ import requests
 import subprocess
 import os
 import json
+import random
+import re
 import time
+import socket
+import sqlite3
+import zlib
 import argparse
+import atexit
+import html
+import queue
+import tempfile
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from xml.sax.saxutils import escape as xml_escape
+
+from narraider_gguf import get_model_info, draft_incompatibility, GGUFError
+from narraider_memory import detect_gpu_memory, estimate_memory, DEFAULT_RESERVE_BYTES
+from narraider_backends import BackendPool
+from narraider_lore import LoreIndex
+from narraider_catalog import Catalog, sha256
+from narraider_facts import (FACT_FIELDS, content_type_of, extraction_request, format_card, is_complete,
+                             load_sheet, make_sheet, parse_extraction, parse_facts, save_sheet)
+from narraider_servers import (
+    find_server, register_server, attach_server, release_server, unregister_server,
+    allocate_port, terminate_pid
+)
 
 # Version
 VERSION = "1.0.0"
@@ -63,11 +88,63 @@ def get_default_config():
             "worldbuilding": str(home / "ai-models" / "model-worldbuilding.gguf"),
             "explicit": str(home / "ai-models" / "model-explicit.gguf")
         },
+        "routing": {  # Which model role generates each content type (see route_model)
+            "default": "worldbuilding",
+            "content_types": {"scene-explicit": "explicit"},
+            "length_targets": []  # e.g. [{"max_words": 800, "model": "fast"}] sends short jobs to a small model
+        },
         "server_port": 8081,
         "context_size": 8192,
         "gpu_layers": 99,
+        "cache_type_k": "f16",  # KV cache precision; q8_0 halves KV memory (quantized V needs flash attention)
+        "cache_type_v": "f16",
+        "flash_attn": None,  # None: the build's default; "on"/"off"/"auto" (recent builds), or true for older builds' -fa
+        "parallel": 1,  # Server slots; context_size is shared between them
+        "kv_unified": False,  # One KV cache for all slots, so they share cached prompts (needs a recent llama-server)
+        "speculative": {  # Used for roles with a "draft" model (see get_model_role)
+            "draft_max": 16,  # Tokens drafted per step
+            "draft_min": 0,
+            "draft_p_min": 0.8,  # Minimum draft probability to keep drafting
+            "gpu_layers_draft": 99
+        },
         "output_folder": "outputs",  # Relative to narraider directory
+        "lore": {  # Passages of earlier outputs added to new requests (see lore_context)
+            "enabled": True,
+            "max_tokens": 600,  # Budget for the retrieved passages
+            "content_types": ["relationships", "scene-dialogue", "scene-combat", "scene-explicit",
+                              "scene-general", "concept", "image-prompt"]
+        },
+        "output_writer": {  # Outputs are saved on a background thread (see OutputWriter)
+            "queue_size": 64,  # Saves waiting at most; save_output blocks while the queue is full
+            "fsync": False,  # Flush each file to disk before it is renamed into place
+            "batch_size": 16  # Saves written together, with one directory flush per folder (fsync)
+        },
+        "facts": {  # Fact sheets of character, magic, culture and artifact outputs (see fact_sheet)
+            "enabled": True,  # Written on save; lore then uses a file's card instead of its passages
+            "card_tokens": 100,
+            "model_fallback": True  # One short extraction request for outputs that ignore their template
+        },
         "keep_server_loaded": False,  # If False, kills server after each generation to free VRAM
+        "prewarm_models": True,  # Read the selected model into the OS file cache before the server starts
+        "preload_models": True,  # GUI: start the server for the selected model before Generate is pressed
+        "blue_green_swap": True,  # Load the next model next to the current one when both fit in memory
+        "share_servers": True,  # Use a matching server another NarrAider process (GUI, CLI, script) already runs
+        "backends": [],  # Servers to spread a role over, e.g. [{"url": "http://gpu2:8080", "model": "worldbuilding", "slots": 4}]
+        "attach_only": False,  # Never start or stop llama-server; use the backends (or the server on server_port) as they run
+        "backend_retries": 2,  # Other backends tried when one fails during a generation
+        "request_style": {  # "completion" (raw prompt) or "chat" (messages through the model's chat template)
+            "default": "completion",
+            "roles": {}  # e.g. {"worldbuilding": "chat"}
+        },
+        "watchdog": {
+            "enabled": True,  # Restart llama-server when it crashes or stops answering
+            "interval_seconds": 5,
+            "max_failed_health_checks": 3,  # In a row, before a running server counts as hung
+            "max_restarts": 3,  # Per CRASH_WINDOW; after that the server stays down
+            "backoff_seconds": 2,  # Doubles with every recent crash
+            "reduce_on_oom": True,  # Lower context_size and gpu_layers after an out-of-memory crash
+            "replay_requests": True  # Re-run generations interrupted by a crash
+        },
         "generation_params": {
             "temperature": 0.8,
             "top_p": 0.9,
@@ -75,6 +152,19 @@ def get_default_config():
             "repeat_penalty": 1.1,
             "max_tokens": 2048
         },
+        "continuation_budget": 4096,  # Extra tokens for continuing output cut off at max_tokens (0 = off)
+        "max_continuations": 3,
+        "enforce_length_targets": True,  # Stop near the template's "Length: X-Y words" target
+        "degeneration_guard": {
+            "enabled": True,  # Abort generations that loop or drift into meta-commentary
+            "ngram_size": 3,
+            "window_words": 200,  # Words considered for the n-gram repetition rate
+            "max_repeat_ratio": 0.5,  # Share of repeated n-grams in the window
+            "compression_window": 2000,  # Characters considered for the compression ratio
+            "max_compression_ratio": 4.0,  # Normal prose compresses ~2x, loops far more
+            "max_leaked_lines": 3,  # Leaked instruction lines (see clean_output)
+            "retries": 1  # Retries with adjusted sampling after an abort
+        },
         "custom_system_prompts": {}  # User-defined system prompts
     }
 
@@ -85,12 +175,92 @@ DEFAULT_CONFIG = get_default_config()
 SERVER_PROCESS = None
 CURRENT_MODEL = None
 CONFIG = None
+ACTIVE_PORT = None  # Port of the active server (server_port, or the next free port after a swap)
+SERVER_KEY = None  # (base model, adapters) SERVER_PROCESS was launched with, see _server_key
+LOADING_MODEL = None  # Model type being started by ensure_model_loaded
+STARTING_SERVER = None  # Process launched by start_server that is not serving yet
+DRAINING_SERVERS = []  # Replaced servers finishing their pinned generations
+SERVER_LEASES = {}  # Port -> number of generations pinned to that server
+SERVER_LOCK = threading.RLock()  # Guards the server state above
+SERVER_CHANGED = threading.Condition(SERVER_LOCK)
+_PINNED = threading.local()  # Server port (or backend) and role pinned by acquire_model() for the current thread
+BACKEND_POOL = None  # BackendPool built from CONFIG["backends"], see _backend_pool
+LORE_INDEX = None  # LoreIndex of CONFIG["output_folder"], see _lore_index
+LORE_LOCK = threading.Lock()
+CATALOG = None  # Catalog of CONFIG["output_folder"], see _catalog
+CATALOG_LOCK = threading.Lock()
+GENERATIONS = {}  # SHA-256 of a result -> how generate_content made it (oldest first), until save_output catalogs it
+GENERATIONS_LOCK = threading.Lock()
+_LAST_COMPLETION = threading.local()  # Statistics of the current thread's last finished completion
+OUTPUT_WRITER = None  # OutputWriter started on the first save, see _output_writer
+OUTPUT_WRITER_LOCK = threading.Lock()
+LAST_OUTPUT_STAMP = 0  # Milliseconds of the last unique_stamp()
+WATCHDOG = None  # Thread supervising SERVER_PROCESS, see _watchdog
+CRASH_TIMES = deque()  # When the server crashed or failed to restart, for the restart backoff
+CRASHED_PORTS = {}  # Port -> crash reason, until a new server is ready on that port
+
+# Restart backoff only counts crashes within this many seconds
+CRASH_WINDOW = 600
+
+# Server output goes to a log file per port, so a server handed over to
+# another NarrAider process keeps running after its starter exits
+SERVER_LOG_DIR = Path(__file__).parent / "logs"
+
+# Lines of server output shown for crash diagnostics
+SERVER_OUTPUT_LINES = 40
+
+# Server output that means a crash was caused by running out of (GPU) memory
+OOM_SIGNATURES = [
+    "out of memory",
+    "cudamalloc failed",
+    "failed to allocate",
+    "unable to allocate",
+    "erroroutofdevicememory",
+    "std::bad_alloc",
+]
+
+# Smallest context_size the out-of-memory fallback goes down to
+MIN_CONTEXT_SIZE = 2048
+
+# Generation metrics: event counts plus the most recent events in detail.
+# Every event is also appended to narraider_metrics.jsonl.
+METRICS = {}
+METRIC_EVENTS = deque(maxlen=1000)
+METRICS_LOCK = threading.Lock()
+
+# Continuations of truncated generations: how much of the previous text is
+# compared when removing a duplicated seam, and the shortest overlap removed
+SEAM_WINDOW = 200
+MIN_SEAM_OVERLAP = 16
+
+# Background page-cache prewarm of the next model file (see prewarm_model)
+PREWARMER = None
+PREWARM_LOCK = threading.Lock()
+PREWARM_CHUNK = 16 * 1024 * 1024
+
+# Persistent statistics (narraider_stats.json), e.g. tokens-per-word history
+STATS = None
+DEFAULT_TOKENS_PER_WORD = 1.4
 
 def log(message):
     """Print timestamped log message."""
     timestamp = datetime.now().strftime("%H:%M:%S")
     print(f"[{timestamp}] {message}")
 
+def record_metric(event, **fields):
+    """Count a metrics event and append it to the metrics log."""
+    entry = {"event": event, "time": datetime.now().isoformat(timespec="seconds"), **fields}
+    metrics_path = Path(__file__).parent / "narraider_metrics.jsonl"
+
+    with METRICS_LOCK:
+        METRICS[event] = METRICS.get(event, 0) + 1
+        METRIC_EVENTS.append(entry)
+        try:
+            with open(metrics_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            log(f"WARNING: Could not write metrics: {e}")
+
 def load_config():
     """Load configuration from file or create default."""
     global CONFIG, SYSTEM_PROMPTS
@@ -164,40 +334,320 @@ def is_custom_system_prompt(name):
         return False
     return name in CONFIG.get("custom_system_prompts", {})
 
-def kill_server():
-    """Kill the running llama.cpp server."""
-    global SERVER_PROCESS, CURRENT_MODEL
+def get_model_role(model_type):
+    """Normalized definition of a model role from CONFIG["models"].
+
+    A role is either the path of a GGUF model, or a dict:
+    {"base": path, "adapters": [{"path": ..., "scale": 1.0}], "draft": path}.
+    Adapters make the role a LoRA fine-tune of a shared base model (an
+    adapter may also be given as a plain path); draft is a small model with
+    the same tokenizer used for speculative decoding. Both are optional.
+    Returns None for unknown roles.
+    """
+    entry = CONFIG["models"].get(model_type)
+    if not entry:
+        return None
+    if isinstance(entry, str):
+        return {"base": entry, "adapters": [], "draft": None}
+
+    adapters = []
+    for adapter in entry.get("adapters", []):
+        if isinstance(adapter, str):
+            adapter = {"path": adapter}
+        adapters.append({"path": adapter["path"], "scale": adapter.get("scale", 1.0)})
+    return {"base": entry.get("base", ""), "adapters": adapters, "draft": entry.get("draft")}
+
+def get_model_path(model_type):
+    """Path of the GGUF model (the base model for LoRA roles) of a role."""
+    role = get_model_role(model_type)
+    return role["base"] if role else None
+
+def _backend_entries():
+    """Configured backends; in attach-only mode at least the server on server_port."""
+    entries = CONFIG.get("backends") or []
+    if not entries and CONFIG.get("attach_only", False):
+        entries = [{"url": f"http://127.0.0.1:{CONFIG['server_port']}"}]
+    return entries
+
+def _role_for_model(model):
+    """Role of a model a backend reports serving: the role with that model file, else the file's name."""
+    name = Path(model).name
+    for model_type in CONFIG["models"]:
+        path = get_model_path(model_type)
+        if path and Path(path).name == name:
+            return model_type
+    return Path(model).stem
+
+def _backend_pool():
+    """Pool of the configured "backends", rebuilt when the config changes."""
+    global BACKEND_POOL
+    entries = _backend_entries()
+    pool = BACKEND_POOL
+    if pool is None or pool.entries != entries:
+        # The servers are asked what they serve in the background, so the GUI
+        # thread never waits on them; acquire() waits for the answers
+        pool = BackendPool.from_config(entries, _role_for_model, discover=False)
+        with SERVER_LOCK:
+            if BACKEND_POOL is None or BACKEND_POOL.entries != entries:
+                BACKEND_POOL = pool
+            pool = BACKEND_POOL
+        pool.refresh(wait=False)
+    return pool
+
+def get_request_style(model_type):
+    """Whether model_type is prompted through the completion or the chat API (CONFIG["request_style"])."""
+    styles = CONFIG.get("request_style") or DEFAULT_CONFIG["request_style"]
+    style = styles.get("roles", {}).get(model_type) or styles.get("default", "completion")
+    if style not in ("completion", "chat"):
+        log(f"WARNING: Unknown request style '{style}' for {model_type}; using completion")
+        return "completion"
+    return style
+
+def backend_status(model_type=None):
+    """Health summaries of the configured backends (of one role if given)."""
+    return [status for status in _backend_pool().status() if model_type in (None, status["model"])]
+
+def model_roles():
+    """Names of all model roles: local models first, then roles only served by backends."""
+    roles = list(CONFIG["models"])
+    for backend in _backend_pool().backends:
+        if backend.model and backend.model not in roles:
+            roles.append(backend.model)
+    return roles
+
+def _server_adapters(base_path):
+    """Adapters of every role on base_path, in the order they are loaded (their ids)."""
+    paths = []
+    for model_type in CONFIG["models"]:
+        role = get_model_role(model_type)
+        if role and role["base"] == base_path:
+            paths += [a["path"] for a in role["adapters"] if a["path"] not in paths]
+    return paths
+
+def _server_draft(base_path):
+    """Draft model of the first role on base_path that configures one, or None."""
+    for model_type in CONFIG["models"]:
+        role = get_model_role(model_type)
+        if role and role["base"] == base_path and role["draft"]:
+            return role["draft"]
+    return None
 
-    if SERVER_PROCESS:
-        log("Killing llama server...")
-        SERVER_PROCESS.terminate()
-        try:
-            SERVER_PROCESS.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            SERVER_PROCESS.kill()
+def _server_key(model_type):
+    """What a role needs the server launched with: its base model, all adapters on it and the draft model.
+
+    Roles with the same key share one server process and switch by
+    changing the per-request adapter scales instead of reloading.
+    """
+    base = get_model_path(model_type)
+    return (base, tuple(_server_adapters(base)), _server_draft(base))
+
+def _serves(model_type):
+    """True if the active server can answer requests for model_type."""
+    return CURRENT_MODEL == model_type or (SERVER_KEY is not None and SERVER_KEY == _server_key(model_type))
+
+def _lora_request(model_type):
+    """Per-request "lora" field enabling model_type's adapters and disabling the rest."""
+    role = get_model_role(model_type)
+    scales = {a["path"]: a["scale"] for a in role["adapters"]}
+    return [{"id": i, "scale": scales.get(path, 0.0)} for i, path in enumerate(_server_adapters(role["base"]))]
+
+def server_url(path=""):
+    """URL on the server pinned by this thread, or on the active server."""
+    backend = getattr(_PINNED, "backend", None)
+    if backend:
+        return backend.url + path
+    port = getattr(_PINNED, "port", None) or ACTIVE_PORT or CONFIG["server_port"]
+    return f"http://127.0.0.1:{port}{path}"
+
+def _stop_process(process):
+    """Terminate a server process, killing it if it does not exit in time."""
+    process.terminate()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def _wait_for(condition, cancel_token=None):
+    """Block until condition() holds; it is re-checked whenever the server state changes."""
+    with SERVER_LOCK:
+        while not condition():
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            SERVER_CHANGED.wait(0.5)
+
+def _registry_call(function, *args):
+    """Call a narraider_servers function; if the registry is unusable, only sharing is lost."""
+    try:
+        return function(*args)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        log(f"WARNING: Server registry unavailable: {e}")
+        return None
+
+def _release_process(process):
+    """Stop one of our server processes, unless another NarrAider process took it over."""
+    if _registry_call(release_server, process.port) is False:
+        log(f"Leaving the server on port {process.port} running for another NarrAider process")
+        return
+    _stop_process(process)
+
+def kill_server():
+    """Kill the running llama.cpp server, including one still loading or draining.
+
+    Servers that other NarrAider processes are attached to keep running;
+    one of those processes becomes responsible for them.
+    """
+    global SERVER_PROCESS, CURRENT_MODEL, ACTIVE_PORT, STARTING_SERVER, SERVER_KEY
+
+    with SERVER_LOCK:
+        processes = DRAINING_SERVERS + [p for p in (SERVER_PROCESS, STARTING_SERVER) if p]
+        # Without a process of our own, the active server belongs to another NarrAider process
+        shared_port = ACTIVE_PORT if SERVER_PROCESS is None else None
+        DRAINING_SERVERS.clear()
         SERVER_PROCESS = None
+        STARTING_SERVER = None
         CURRENT_MODEL = None
-        time.sleep(2)
+        ACTIVE_PORT = None
+        SERVER_KEY = None
+        SERVER_CHANGED.notify_all()
+
+    if shared_port:
+        record = _registry_call(release_server, shared_port)
+        if record:
+            # Taken over from a process that exited; it is not our child
+            log("Killing llama server...")
+            terminate_pid(record["server_pid"], record.get("server_started"))
+            log("Server killed")
+
+    if processes:
+        log("Killing llama server...")
+        # wait() returns once the process has exited and released its VRAM and port
+        for process in processes:
+            _release_process(process)
         log("Server killed")
 
-def is_server_healthy():
+def is_server_healthy(port=None):
     """Check if server is responding."""
+    url = f"http://127.0.0.1:{port}/health" if port else server_url("/health")
     try:
-        response = requests.get(
-            f"http://127.0.0.1:{CONFIG['server_port']}/health",
-            timeout=2
-        )
+        response = requests.get(url, timeout=2)
         return response.status_code == 200
     except:
         return False
 
-def start_server(model_path, model_name):
-    """Start llama.cpp server with specified model."""
-    global SERVER_PROCESS, CURRENT_MODEL
+def _can_run_side_by_side(model_path):
+    """True if the active server can keep serving while model_path loads.
 
-    kill_server()
+    Uses the memory planner's estimate for both models with the current
+    settings against the detected VRAM (or RAM for CPU-only setups). When
+    the available memory is unknown, the answer is no.
+    """
+    if not CONFIG.get("blue_green_swap", True) or not CURRENT_MODEL:
+        return False
+    if SERVER_PROCESS is None or SERVER_PROCESS.poll() is not None:
+        return False
 
-    log(f"Starting {model_name}...")
+    try:
+        paths = [get_model_path(CURRENT_MODEL), model_path]
+        paths += [draft for draft in map(_server_draft, list(paths)) if draft]
+        infos = [get_model_info(path) for path in paths]
+        if CONFIG["gpu_layers"] == 0:
+            available = _physical_memory()
+            needed = sum(info["file_size"] for info in infos)
+            return bool(available) and needed <= available * 0.75
+
+        available = detect_gpu_memory()
+        needed = DEFAULT_RESERVE_BYTES + sum(
+            estimate_memory(info, CONFIG["context_size"], CONFIG["gpu_layers"],
+                            CONFIG.get("cache_type_k", "f16"), CONFIG.get("cache_type_v", "f16"))
+            for info in infos
+        )
+    except (KeyError, OSError, GGUFError, ValueError):
+        return False
+    return bool(available) and needed <= available
+
+def _retire_server(process, port):
+    """Stop a replaced server once no generation is pinned to it any more."""
+    with SERVER_LOCK:
+        DRAINING_SERVERS.append(process)
+
+    def drain():
+        _wait_for(lambda: not SERVER_LEASES.get(port) or process not in DRAINING_SERVERS)
+        _release_process(process)
+        with SERVER_LOCK:
+            if process in DRAINING_SERVERS:
+                DRAINING_SERVERS.remove(process)
+            SERVER_CHANGED.notify_all()
+        log(f"Previous server on port {port} drained and stopped")
+
+    thread = threading.Thread(target=drain)
+    thread.daemon = True
+    thread.start()
+
+def start_server(model_path, model_name, cancel_token=None):
+    """Start llama.cpp server with specified model.
+
+    If both models fit in memory (blue_green_swap), the new server starts
+    on the alternate port while the current one keeps serving its model.
+    Traffic cuts over once the new server is healthy, and the old one is
+    stopped after its last pinned generation. Otherwise the current server
+    finishes its pinned generations and is killed before the new one starts.
+
+    If cancel_token is cancelled while the model loads, the half-started
+    server is killed and GenerationCancelled is raised.
+    """
+    global SERVER_PROCESS, CURRENT_MODEL, ACTIVE_PORT, STARTING_SERVER, SERVER_KEY
+
+    # LoRA adapters of every role on this base model are loaded up front
+    server_key = _server_key(model_name)
+    adapters = list(server_key[1])
+    base_arch = None
+    for adapter in adapters:
+        try:
+            adapter_info = get_model_info(adapter)
+            base_arch = base_arch or get_model_info(model_path)["architecture"]
+        except (OSError, GGUFError) as e:
+            log(f"ERROR: Cannot read LoRA adapter {adapter}: {e}")
+            return False
+        if adapter_info["type"] != "adapter":
+            log(f"ERROR: {adapter} is not a LoRA adapter")
+            return False
+        if adapter_info["architecture"] != base_arch:
+            log(f"ERROR: LoRA adapter {Path(adapter).name} is for {adapter_info['architecture']}, "
+                f"but the base model is {base_arch}")
+            return False
+
+    # A draft model that does not match the tokenizer would make llama-server
+    # refuse to start, so fall back to normal decoding instead
+    draft = server_key[2]
+    if draft:
+        try:
+            problem = draft_incompatibility(get_model_info(model_path), get_model_info(draft))
+        except (OSError, GGUFError) as e:
+            problem = str(e)
+        if problem:
+            log(f"WARNING: Not using draft model {Path(draft).name}: {problem}")
+            draft = None
+
+    side_by_side = _can_run_side_by_side(model_path)
+    if side_by_side:
+        preferred = CONFIG["server_port"] + 1 if ACTIVE_PORT == CONFIG["server_port"] else CONFIG["server_port"]
+        # The port may still belong to a server replaced by an earlier swap
+        _wait_for(lambda: not DRAINING_SERVERS, cancel_token)
+    else:
+        active_port = ACTIVE_PORT
+        _wait_for(lambda: not SERVER_LEASES.get(active_port), cancel_token)
+        kill_server()
+        preferred = CONFIG["server_port"]
+
+    # Other NarrAider processes may be running their own servers
+    port = _registry_call(allocate_port, preferred, {ACTIVE_PORT}) or preferred
+    if port != preferred:
+        log(f"Port {preferred} is in use (another NarrAider process?) - using port {port}")
+    if side_by_side:
+        log(f"Starting {model_name} on port {port} ({CURRENT_MODEL} keeps serving meanwhile)...")
+    else:
+        log(f"Starting {model_name}...")
 
     # Convert paths to Path objects and then to strings to handle Windows paths correctly
     server_path_obj = Path(CONFIG["llama_server_path"])
@@ -223,12 +673,44 @@ def start_server(model_path, model_name):
         server_path_str,
         "-m", model_path_str,
         "--host", "127.0.0.1",  # Bind to localhost only for security
-        "--port", str(CONFIG["server_port"]),
+        "--port", str(port),
         "--ctx-size", str(CONFIG["context_size"]),
-        "-ngl", str(CONFIG["gpu_layers"]),
-        "--log-disable"
+        "-ngl", str(CONFIG["gpu_layers"])
     ]
 
+    # Optional memory settings (see narraider_memory.py); omitted at their defaults
+    cache_type_k = CONFIG.get("cache_type_k", "f16")
+    cache_type_v = CONFIG.get("cache_type_v", "f16")
+    if cache_type_k != "f16":
+        cmd += ["--cache-type-k", cache_type_k]
+    if cache_type_v != "f16":
+        cmd += ["--cache-type-v", cache_type_v]
+    # Recent builds use flash attention when available ("auto"); older ones
+    # need a bare -fa for a quantized V cache
+    flash_attn = CONFIG.get("flash_attn")
+    if flash_attn is True:
+        cmd.append("-fa")
+    elif flash_attn:
+        cmd += ["--flash-attn", str(flash_attn)]
+    if CONFIG.get("parallel", 1) > 1:
+        cmd += ["--parallel", str(CONFIG["parallel"])]
+    if CONFIG.get("kv_unified", False):
+        cmd += ["--kv-unified"]
+    for adapter in adapters:
+        cmd += ["--lora", str(Path(adapter))]
+    if adapters:
+        # Adapters start disabled; each request sets the scales for its role
+        cmd.append("--lora-init-without-apply")
+    if draft:
+        speculative = CONFIG.get("speculative", {})
+        cmd += [
+            "-md", str(Path(draft)),
+            "-ngld", str(speculative.get("gpu_layers_draft", CONFIG["gpu_layers"])),
+            "--draft-max", str(speculative.get("draft_max", 16)),
+            "--draft-min", str(speculative.get("draft_min", 0)),
+            "--draft-p-min", str(speculative.get("draft_p_min", 0.8)),
+        ]
+
     log(f"Command: {' '.join(cmd)}")
 
     try:
@@ -236,15 +718,21 @@ def start_server(model_path, model_name):
         # This ensures it can find its DLL dependencies
         server_dir = server_path_obj.parent
 
-        SERVER_PROCESS = subprocess.Popen(
-            cmd,
-            cwd=str(server_dir),
-            creationflags=subprocess.CREATE_NEW_CONSOLE if os.name == 'nt' else 0,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        log(f"Server process started with PID: {SERVER_PROCESS.pid}")
+        SERVER_LOG_DIR.mkdir(exist_ok=True)
+        log_path = SERVER_LOG_DIR / f"llama-server-{port}.log"
+        started = time.time()
+        with open(log_path, 'w') as log_file:
+            process = subprocess.Popen(
+                cmd,
+                cwd=str(server_dir),
+                creationflags=subprocess.CREATE_NEW_CONSOLE if os.name == 'nt' else 0,
+                stdout=log_file,
+                stderr=subprocess.STDOUT
+            )
+        process.port = port
+        process.log_path = log_path
+        STARTING_SERVER = process
+        log(f"Server process started with PID: {process.pid}")
     except Exception as e:
         log(f"ERROR: Failed to start server: {e}")
         import traceback
@@ -252,85 +740,1117 @@ def start_server(model_path, model_name):
         return False
 
     log("Waiting for server to initialize (large models may take up to 3-4 minutes)...")
-    time.sleep(20)
 
-    # Poll for ready (increased timeout for large 27B models)
-    # 180 attempts = 3 minutes after initial 20 second wait = ~3:20 total
-    for attempt in range(180):
-        if is_server_healthy():
+    # Poll for ready right away: a model already in the file cache can load in seconds
+    # 200 attempts = ~3:20 total (increased timeout for large 27B models)
+    for attempt in range(200):
+        if is_server_healthy(port):
+            # Cut over: new generations go to the new server from here on
+            with SERVER_LOCK:
+                old_process, old_port = SERVER_PROCESS, ACTIVE_PORT
+                SERVER_PROCESS, ACTIVE_PORT, CURRENT_MODEL = process, port, model_name
+                SERVER_KEY = server_key
+                STARTING_SERVER = None
+                CRASHED_PORTS.pop(port, None)
+                SERVER_CHANGED.notify_all()
             log(f"{model_name} is ready!")
-            CURRENT_MODEL = model_name
+            _registry_call(register_server, port, process.pid, server_key, model_name,
+                           CONFIG["context_size"], CONFIG.get("parallel", 1))
+            record_metric("server_ready", model=model_name, seconds=round(time.time() - started, 2),
+                          side_by_side=side_by_side)
+            if old_process:
+                _retire_server(old_process, old_port)
+            _start_watchdog()
             return True
+        if process.poll() is not None:
+            break
+        if cancel_token and cancel_token.cancelled:
+            log(f"Loading {model_name} cancelled")
+            STARTING_SERVER = None
+            _stop_process(process)
+            raise GenerationCancelled()
         time.sleep(1)
         # Progress indicator every 30 seconds
         if attempt > 0 and attempt % 30 == 0:
             log(f"Still loading... ({attempt} seconds elapsed)")
 
-    log(f"ERROR: Server failed to start within timeout (~3 minutes)")
-
-    # Try to capture server output for debugging
-    if SERVER_PROCESS.poll() is not None:
+    # Show the server output for debugging
+    if process.poll() is not None:
         # Server crashed
-        log("Server process terminated unexpectedly")
-        try:
-            stdout, stderr = SERVER_PROCESS.communicate(timeout=2)
-            if stdout:
-                log(f"Server stdout:\n{stdout[:1000]}")
-            if stderr:
-                log(f"Server stderr:\n{stderr[:1000]}")
-        except:
-            log("Could not capture server output")
+        log("ERROR: Server process terminated unexpectedly")
+        process.wait()
+        output = _server_output(process)
+        if output:
+            log(f"Server output (full log: {process.log_path}):\n{output}")
+        if _is_out_of_memory(output):
+            _reduce_memory_settings(model_path)
     else:
         # Server still running but not healthy
+        log(f"ERROR: Server failed to start within timeout (~3 minutes)")
         log("Server process is still running but not responding to health checks")
         log("Possible causes:")
         log("  1. Model is too large for available VRAM - try reducing gpu_layers or context_size")
         log("  2. CUDA drivers not installed or incompatible")
         log("  3. Model file is corrupted - verify download completed successfully")
-        log("  4. Port 8081 is blocked by firewall")
-        log("\nCheck the server console window for detailed error messages")
+        log(f"  4. Port {port} is blocked by firewall")
+        log(f"Server output (full log: {process.log_path}):\n{_server_output(process)}")
 
-    kill_server()
+    STARTING_SERVER = None
+    _stop_process(process)
     return False
 
-def ensure_model_loaded(model_type):
-    """Ensure correct model is loaded."""
-    model_path = CONFIG["models"].get(model_type)
+def _server_output(process):
+    """The last lines a server process wrote to its log file."""
+    try:
+        with open(process.log_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 64 * 1024))
+            text = f.read().decode("utf-8", errors="replace")
+    except (AttributeError, OSError):
+        return ""
+    return "\n".join(text.splitlines()[-SERVER_OUTPUT_LINES:])
+
+def _is_out_of_memory(output):
+    """True if server output shows an out-of-memory failure."""
+    output = output.lower()
+    return any(signature in output for signature in OOM_SIGNATURES)
+
+def _reduce_memory_settings(model_path):
+    """Lower context_size and gpu_layers after an out-of-memory crash.
+
+    Only the settings in memory change; narraider_config.json is left
+    alone so a transient shortage (e.g. a game holding VRAM) does not
+    permanently shrink the configuration.
+    """
+    if not CONFIG.get("watchdog", {}).get("reduce_on_oom", True):
+        return
+    try:
+        layers = get_model_info(model_path)["layers"] or 0
+    except (OSError, GGUFError):
+        layers = 0
+
+    context_size = CONFIG["context_size"]
+    gpu_layers = CONFIG["gpu_layers"]
+    new_context = max(MIN_CONTEXT_SIZE, context_size * 3 // 4 // 256 * 256)
+    if layers:
+        # -ngl beyond layers + 1 has no effect, so start from the real count
+        new_layers = max(0, min(gpu_layers, layers + 1) - max(1, layers // 8))
+    else:
+        new_layers = gpu_layers * 3 // 4
+    if (new_context, new_layers) == (context_size, gpu_layers):
+        return
+
+    CONFIG["context_size"] = new_context
+    CONFIG["gpu_layers"] = new_layers
+    log(f"WARNING: Out of memory - reducing context_size {context_size} -> {new_context} "
+        f"and gpu_layers {gpu_layers} -> {new_layers} (not saved to the config)")
+    record_metric("oom_reduction", context_size=new_context, gpu_layers=new_layers)
+
+def _server_crashed(process, reason):
+    """Forget the active server after it died; returns the role it served.
+
+    Returns None if the process is no longer the active server (it was
+    stopped on purpose or already replaced).
+    """
+    global SERVER_PROCESS, CURRENT_MODEL, ACTIVE_PORT, SERVER_KEY
+
+    with SERVER_LOCK:
+        if SERVER_PROCESS is not process:
+            return None
+        model_type = CURRENT_MODEL
+        port = ACTIVE_PORT
+        CRASHED_PORTS[port] = reason
+        SERVER_PROCESS = None
+        CURRENT_MODEL = None
+        ACTIVE_PORT = None
+        SERVER_KEY = None
+        CRASH_TIMES.append(time.time())
+        SERVER_CHANGED.notify_all()
+
+    if process.poll() is None:
+        _stop_process(process)
+    _registry_call(unregister_server, port)
+    output = _server_output(process)
+    oom = _is_out_of_memory(output)
+    log(f"ERROR: llama-server for {model_type} stopped unexpectedly ({reason})")
+    if output:
+        log(f"Server output (full log: {process.log_path}):\n{output}")
+    record_metric("server_crash", model=model_type, reason=reason, out_of_memory=oom)
+    if oom:
+        _reduce_memory_settings(get_model_path(model_type))
+    return model_type
+
+def recover_server(model_type, cancel_token=None):
+    """Restart model_type's server after a crash.
+
+    Each restart waits backoff_seconds, doubled for every other crash within
+    CRASH_WINDOW; after more than max_restarts crashes the server is left
+    down. A failed restart counts as another crash.
+    """
+    settings = CONFIG.get("watchdog", {})
+    while True:
+        with SERVER_LOCK:
+            while CRASH_TIMES and CRASH_TIMES[0] < time.time() - CRASH_WINDOW:
+                CRASH_TIMES.popleft()
+            crashes = len(CRASH_TIMES)
+        if crashes > settings.get("max_restarts", 3):
+            log(f"ERROR: llama-server crashed {crashes} times in {CRASH_WINDOW // 60} minutes - not restarting it again")
+            return False
+
+        if crashes:
+            delay = settings.get("backoff_seconds", 2) * 2 ** (crashes - 1)
+            log(f"Restarting {model_type} in {delay}s...")
+            deadline = time.time() + delay
+            _wait_for(lambda: time.time() >= deadline, cancel_token)
+
+        if ensure_model_loaded(model_type, cancel_token):
+            record_metric("server_restart", model=model_type, recent_crashes=crashes)
+            return True
+        with SERVER_LOCK:
+            CRASH_TIMES.append(time.time())
+
+def _check_server(port):
+    """After a failed request: if the server on port is gone, handle the crash.
+
+    Returns the crash reason, or None if the server is still healthy (the
+    failure was something else) or was stopped on purpose.
+    """
+    global CURRENT_MODEL, ACTIVE_PORT, SERVER_KEY
+
+    if is_server_healthy(port):
+        return None
+    with SERVER_LOCK:
+        if port in CRASHED_PORTS:
+            return CRASHED_PORTS[port]  # The watchdog got there first
+        if ACTIVE_PORT != port:
+            return None
+        process = SERVER_PROCESS
+        if process is None:
+            # The server of another NarrAider process went away; the restart starts our own
+            CURRENT_MODEL = None
+            ACTIVE_PORT = None
+            SERVER_KEY = None
+            SERVER_CHANGED.notify_all()
+    if process is None:
+        _registry_call(release_server, port)
+        return "shared server stopped"
+    if process.poll() is not None:
+        reason = f"exit code {process.returncode}"
+    else:
+        reason = "not responding"
+    _server_crashed(process, reason)
+    return reason
+
+def _start_watchdog():
+    """Start the watchdog thread unless it is disabled or already running."""
+    global WATCHDOG
+    if not CONFIG.get("watchdog", {}).get("enabled", True):
+        return
+    with SERVER_LOCK:
+        if WATCHDOG is None or not WATCHDOG.is_alive():
+            WATCHDOG = threading.Thread(target=_watchdog)
+            WATCHDOG.daemon = True
+            WATCHDOG.start()
+
+def _watchdog():
+    """Restart the active server when its process exits or it stops answering health checks."""
+    settings = CONFIG.get("watchdog", {})
+    watched = None
+    failures = 0
+    while True:
+        time.sleep(settings.get("interval_seconds", 5))
+        with SERVER_LOCK:
+            process, port = SERVER_PROCESS, ACTIVE_PORT
+            loading = LOADING_MODEL is not None
+        if process is not watched:
+            watched, failures = process, 0
+        if process is None or loading:
+            continue
+
+        if process.poll() is not None:
+            reason = f"exit code {process.returncode}"
+        elif is_server_healthy(port):
+            failures = 0
+            continue
+        else:
+            failures += 1
+            if failures < settings.get("max_failed_health_checks", 3):
+                continue
+            reason = f"{failures} failed health checks"
+
+        model_type = _server_crashed(process, reason)
+        if model_type:
+            try:
+                recover_server(model_type)
+            except Exception as e:
+                log(f"ERROR: Restarting {model_type} failed: {e}")
+
+def _physical_memory():
+    """Installed RAM in bytes, or None where it cannot be queried."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+class ModelPrewarmer:
+    """Reads a model file sequentially so the server loads it from the file cache.
+
+    A cold start of a large model is mostly spent on disk reads. Reading the
+    file ahead in large aligned chunks while the user is still choosing
+    settings means llama-server finds the data in the OS page cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.total = os.path.getsize(path)
+        self.done = 0
+        self.seconds = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def progress(self):
+        return self.done / self.total if self.total else 1.0
+
+    @property
+    def finished(self):
+        return not self._thread.is_alive()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+
+    def _run(self):
+        start = time.time()
+        buffer = bytearray(PREWARM_CHUNK)
+        try:
+            with open(self.path, 'rb', buffering=0) as f:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                while not self._stop.is_set():
+                    read = f.readinto(buffer)
+                    if not read:
+                        break
+                    self.done += read
+        except OSError as e:
+            log(f"WARNING: Prewarm of {Path(self.path).name} failed: {e}")
+            return
+
+        self.seconds = time.time() - start
+        if not self._stop.is_set():
+            record_metric("prewarm", model=Path(self.path).name, bytes=self.done,
+                          seconds=round(self.seconds, 2))
+
+def prewarm_model(model_path):
+    """Start reading a model file into the page cache in the background.
+
+    Any prewarm of a different file is stopped. Returns the ModelPrewarmer,
+    or None if prewarming is disabled, pointless (the model is already
+    loaded) or unsafe (the file would not fit in RAM).
+    """
+    global PREWARMER
+
+    if not CONFIG.get("prewarm_models", True) or not model_path or not Path(model_path).exists():
+        return None
+    path = str(Path(model_path).resolve())
+
+    with PREWARM_LOCK:
+        if PREWARMER and PREWARMER.path == path:
+            return PREWARMER
+
+        if CURRENT_MODEL and str(Path(get_model_path(CURRENT_MODEL) or "").resolve()) == path:
+            return None
+
+        # A file larger than RAM would evict its own beginning
+        memory = _physical_memory()
+        if memory and os.path.getsize(path) > memory * 0.75:
+            return None
+
+        if PREWARMER:
+            PREWARMER.stop()
+        PREWARMER = ModelPrewarmer(path).start()
+        return PREWARMER
+
+def prewarm_model_type(model_type):
+    """Prewarm the model configured for model_type (see prewarm_model)."""
+    if _backend_pool().serves(model_type):
+        return None  # Loaded by the backends, not by us
+    return prewarm_model(get_model_path(model_type))
+
+def ensure_model_loaded(model_type, cancel_token=None):
+    """Ensure correct model is loaded.
+
+    Only one model loads at a time. A caller that arrives during a load
+    (e.g. a GUI preload) waits for it, and reuses the server if it is the
+    same model. Callers for the model that is currently being served are
+    answered right away, even while another model loads next to it.
+    """
+    global LOADING_MODEL, CURRENT_MODEL
+
+    if _backend_pool().serves(model_type):
+        return True  # Served by the configured backends, nothing to load here
+    if CONFIG.get("attach_only", False):
+        log(f"ERROR: No running server serves '{model_type}' (attach_only is set, so none is started)")
+        return False
+
+    model_path = get_model_path(model_type)
     if not model_path:
         log(f"ERROR: No model configured for type '{model_type}'")
         return False
 
-    if CURRENT_MODEL == model_type and is_server_healthy():
+    with SERVER_LOCK:
+        while True:
+            if _serves(model_type) and is_server_healthy(ACTIVE_PORT):
+                if CURRENT_MODEL != model_type:
+                    # LoRA roles on the same base model: only the adapter scales change
+                    log(f"Switched to {model_type} (LoRA adapters on the loaded base model)")
+                    CURRENT_MODEL = model_type
+                return True
+            if LOADING_MODEL is None:
+                break
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            SERVER_CHANGED.wait(0.5)
+        LOADING_MODEL = model_type
+
+    try:
+        if _attach_shared_server(model_type, cancel_token):
+            return True
+        return start_server(model_path, model_type, cancel_token)
+    finally:
+        with SERVER_LOCK:
+            LOADING_MODEL = None
+            SERVER_CHANGED.notify_all()
+
+def _attach_shared_server(model_type, cancel_token=None):
+    """Use a server for model_type that another NarrAider process is running.
+
+    The server must have been launched with the same model, adapters and
+    draft, and at least our context size. Returns False if there is none.
+    """
+    global CURRENT_MODEL, ACTIVE_PORT, SERVER_KEY
+
+    if not CONFIG.get("share_servers", True):
+        return False
+    server_key = _server_key(model_type)
+    record = _registry_call(find_server, server_key, CONFIG["context_size"], os.getpid())
+    if not record or not is_server_healthy(record["port"]):
+        return False
+
+    # Our own server (if any) makes way, as it would for a model switch
+    active_port = ACTIVE_PORT
+    _wait_for(lambda: not SERVER_LEASES.get(active_port), cancel_token)
+    kill_server()
+    if not _registry_call(attach_server, record["port"]):
+        return False
+
+    with SERVER_LOCK:
+        ACTIVE_PORT, CURRENT_MODEL, SERVER_KEY = record["port"], model_type, server_key
+        SERVER_CHANGED.notify_all()
+    log(f"Using the {model_type} server of NarrAider process {record['owner_pid']} on port {record['port']}")
+    record_metric("server_attached", model=model_type, port=record["port"])
+    return True
+
+def acquire_model(model_type, cancel_token=None, exclude=()):
+    """Load model_type if needed and pin its server to the calling thread.
+
+    Requests made by this thread go to the pinned server until
+    release_model() is called, even if another thread swaps the active
+    model in the meantime; a replaced server is only stopped once every
+    pin on it has been released. Roles with configured backends get a slot
+    on the least busy backend instead, avoiding the backends in exclude
+    where possible.
+    """
+    pool = _backend_pool()
+    if pool.serves(model_type, wait=True):
+        _PINNED.backend = pool.acquire(
+            model_type, exclude, cancel_token.raise_if_cancelled if cancel_token else None
+        )
+        _PINNED.backend_failed = False
+        _PINNED.model = model_type
         return True
 
-    return start_server(model_path, model_type)
+    while True:
+        if not ensure_model_loaded(model_type, cancel_token):
+            return False
+        with SERVER_LOCK:
+            if _serves(model_type):
+                _PINNED.port = ACTIVE_PORT
+                _PINNED.model = model_type
+                SERVER_LEASES[ACTIVE_PORT] = SERVER_LEASES.get(ACTIVE_PORT, 0) + 1
+                return True
+        # Another thread swapped the model between the check and the pin
+
+def release_model():
+    """Release the server pinned by acquire_model() in this thread."""
+    backend = getattr(_PINNED, "backend", None)
+    if backend:
+        _PINNED.backend = None
+        _PINNED.model = None
+        _backend_pool().release(backend, not _PINNED.backend_failed)
+        return
+    port = getattr(_PINNED, "port", None)
+    if port is None:
+        return
+    _PINNED.port = None
+    _PINNED.model = None
+    with SERVER_LOCK:
+        SERVER_LEASES[port] -= 1
+        if not SERVER_LEASES[port]:
+            del SERVER_LEASES[port]
+        SERVER_CHANGED.notify_all()
+
+class GenerationCancelled(Exception):
+    """Raised when a generation is stopped through its CancellationToken."""
+
+class ServerCrashed(Exception):
+    """Raised by generate_completion when llama-server died during the request."""
+
+class BackendFailed(ServerCrashed):
+    """Raised by generate_completion when a configured backend failed the request."""
+
+    def __init__(self, reason, backend):
+        super().__init__(reason)
+        self.backend = backend
+
+class CancellationToken:
+    """Lets another thread (e.g. a Cancel button) stop a running generation.
+
+    Cancelling shuts down the streaming connection, which wakes up the
+    generating thread immediately and makes llama-server cancel the task
+    and free its slot. The server process itself keeps running, so the
+    next request starts without a reload.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._response = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Request cancellation and close the active connection, if any."""
+        with self._lock:
+            self._event.set()
+            self._disconnect()
+
+    def raise_if_cancelled(self):
+        """Raise GenerationCancelled if cancellation was requested."""
+        if self.cancelled:
+            raise GenerationCancelled()
+
+    def attach(self, response):
+        """Register the streaming response that cancel() should close."""
+        with self._lock:
+            self._response = response
+            if self.cancelled:
+                self._disconnect()
+
+    def detach(self):
+        with self._lock:
+            self._response = None
+
+    def _disconnect(self):
+        if self._response is None:
+            return
+        # Closing the response would wait for the reading thread; shutting
+        # the socket down makes the blocked read return right away.
+        try:
+            self._response.raw._connection.sock.shutdown(socket.SHUT_RDWR)
+        except (AttributeError, OSError):
+            pass
 
-def generate_completion(prompt, max_tokens=None, system_prompt=""):
-    """Generate completion from loaded model."""
+def _iter_stream_events(response, cancel_token=None):
+    """Yield the JSON events of a llama-server server-sent event stream."""
+    try:
+        for raw_line in response.iter_lines():
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            # Decode ourselves: requests assumes ISO-8859-1 for text/event-stream
+            line = raw_line.decode("utf-8", errors="replace")
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            yield json.loads(data)
+    except Exception:
+        # A connection torn down by cancel() surfaces as a read error
+        if cancel_token and cancel_token.cancelled:
+            raise GenerationCancelled()
+        raise
+
+def _load_stats():
+    """Load persistent generation statistics (cached after the first call)."""
+    global STATS
+    if STATS is None:
+        stats_path = Path(__file__).parent / "narraider_stats.json"
+        try:
+            with open(stats_path, 'r', encoding='utf-8') as f:
+                STATS = json.load(f)
+        except (OSError, ValueError):
+            STATS = {}
+    return STATS
+
+def get_tokens_per_word(model_type):
+    """Return the observed tokens-per-word ratio for a model role."""
+    return _load_stats().get("tokens_per_word", {}).get(model_type, DEFAULT_TOKENS_PER_WORD)
+
+def update_tokens_per_word(model_type, tokens, words):
+    """Fold a finished generation into the tokens-per-word history."""
+    if not model_type or not tokens or words < 50:
+        return
+
+    with METRICS_LOCK:
+        history = _load_stats().setdefault("tokens_per_word", {})
+        previous = history.get(model_type)
+        ratio = tokens / words
+        # Exponential moving average so the estimate follows the current model
+        history[model_type] = round(ratio if previous is None else 0.8 * previous + 0.2 * ratio, 3)
+        try:
+            with open(Path(__file__).parent / "narraider_stats.json", 'w', encoding='utf-8') as f:
+                json.dump(STATS, f, indent=2)
+        except OSError as e:
+            log(f"WARNING: Could not write stats: {e}")
+
+def get_degeneration_guard():
+    """Return the degeneration guard settings, filling in defaults."""
+    settings = DEFAULT_CONFIG["degeneration_guard"].copy()
+    settings.update(CONFIG.get("degeneration_guard", {}))
+    return settings
+
+def _repeat_start(items, size, run):
+    """Index in items (words or text) where its repeated tail begins.
+
+    Walks back from the end over spans of size items that also occur
+    elsewhere in items; run spans in a row that occur nowhere else are
+    the text written before the loop. Returns len(items) if the tail does
+    not repeat.
+    """
+    spans = [items[i:i + size] for i in range(len(items) - size + 1)]
+    counts = Counter(spans)
+    start = len(items)
+    unique = 0
+    for i in range(len(spans) - 1, -1, -1):
+        if counts[spans[i]] > 1:
+            start = i
+            unique = 0
+        else:
+            unique += 1
+            if unique >= run:
+                break
+    return start
+
+class DegenerationDetector:
+    """Online detector for runaway generations.
+
+    Watches the token stream for three signs that the output will be thrown
+    away: a high share of repeated word n-grams ("she gasped. she gasped."),
+    recent text that compresses far better than prose does, and instruction
+    lines leaking into the output (the markers clean_output removes).
+
+    After an abort, cut is the length of the text before the degenerate
+    part: where the repeated tail of the judged window begins, or the
+    first leaked line.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.cut = None
+        self._fed = 0  # Characters fed before the current piece
+        self._words = deque(maxlen=settings["window_words"])
+        self._word_starts = deque(maxlen=settings["window_words"])
+        self._partial_word = ""
+        self._new_words = 0
+        self._recent = ""
+        self._new_chars = 0
+        self._line = ""
+        self._line_start = 0
+        self._first_leak = None
+        self._leaked_lines = 0
+
+    def feed(self, piece):
+        """Add streamed text; return the abort reason, or None to continue."""
+        reason = self._check_leaks(piece) or self._check_repetition(piece) or self._check_compression(piece)
+        self._fed += len(piece)
+        return reason
+
+    def _check_leaks(self, piece):
+        lines = (self._line + piece).split("\n")
+        self._line = lines.pop()
+        for line in lines:
+            if _LEAKED_INSTRUCTION_RE.search(line):
+                self._leaked_lines += 1
+                if self._first_leak is None:
+                    self._first_leak = self._line_start
+            self._line_start += len(line) + 1
+        if self._leaked_lines >= self.settings["max_leaked_lines"]:
+            self.cut = self._first_leak
+            return f"{self._leaked_lines} leaked instruction lines"
+        return None
+
+    def _check_repetition(self, piece):
+        start = self._fed - len(self._partial_word)
+        words = list(re.finditer(r"\S+", self._partial_word + piece))
+        if piece and not piece[-1].isspace() and words:
+            self._partial_word = words.pop().group()
+        else:
+            self._partial_word = ""
+        self._words.extend(word.group().lower() for word in words)
+        self._word_starts.extend(start + word.start() for word in words)
+        self._new_words += len(words)
+
+        # Checking every few words keeps the cost per token negligible
+        n = self.settings["ngram_size"]
+        if self._new_words < 20 or len(self._words) < self._words.maxlen // 2:
+            return None
+        self._new_words = 0
+
+        window = list(self._words)
+        ngrams = [tuple(window[i:i + n]) for i in range(len(window) - n + 1)]
+        repeat_ratio = 1 - len(set(ngrams)) / len(ngrams)
+        if repeat_ratio > self.settings["max_repeat_ratio"]:
+            start = _repeat_start(tuple(window), n, 2 * n)
+            self.cut = self._word_starts[start] if start < len(window) else self._word_starts[0]
+            return f"{repeat_ratio:.0%} repeated {n}-grams"
+        return None
+
+    def _check_compression(self, piece):
+        window = self.settings["compression_window"]
+        self._recent = (self._recent + piece)[-window:]
+        self._new_chars += len(piece)
+        if self._new_chars < window // 4 or len(self._recent) < window:
+            return None
+        self._new_chars = 0
+
+        data = self._recent.encode("utf-8")
+        ratio = len(data) / len(zlib.compress(data, 6))
+        if ratio > self.settings["max_compression_ratio"]:
+            start = _repeat_start(self._recent, 32, 64)
+            self.cut = self._fed + len(piece) - len(self._recent) + min(start, len(self._recent))
+            return f"compression ratio {ratio:.1f}"
+        return None
+
+def _http():
+    """Session of the pinned backend (pooled keep-alive connections), else plain requests."""
+    backend = getattr(_PINNED, "backend", None)
+    return backend.session if backend else requests
+
+def _completion_request(payload):
+    """URL and body of a completion request to the pinned server or backend.
+
+    Payloads with "messages" go to the chat endpoint, others to the raw
+    completion endpoint. OpenAI-compatible backends get the standard
+    fields only; llama-server extras (top_k, repeat_penalty, cache_prompt)
+    are left out.
+    """
+    kind = "chat" if "messages" in payload else "completion"
+    backend = getattr(_PINNED, "backend", None)
+    if not backend or backend.api == "llama":
+        return server_url("/v1/chat/completions" if kind == "chat" else "/completion"), payload
+    fields = ("messages" if kind == "chat" else "prompt", "max_tokens", "temperature", "top_p", "seed", "stream")
+    body = {key: payload[key] for key in fields if key in payload}
+    if backend.served_model:
+        body["model"] = backend.served_model
+    return backend.path(kind), body
+
+def _completion_event(event):
+    """Translate an OpenAI (chat) completion or stream chunk into llama-server /completion fields.
+
+    Current llama-server builds report the token limit as stop_type
+    "limit" instead of stopped_limit; both come out as stopped_limit.
+    """
+    if "choices" not in event:
+        if event.get("stop_type") == "limit":
+            return {**event, "stopped_limit": True}
+        return event
+    choice = (event["choices"] or [{}])[0]
+    message = choice.get("delta") or choice.get("message") or {}
+    finish_reason = choice.get("finish_reason")
+    result = {
+        "content": choice.get("text") or message.get("content") or "",
+        "stop": finish_reason is not None,
+        "stopped_limit": finish_reason == "length"
+    }
+    usage = event.get("usage") or {}
+    if "completion_tokens" in usage:
+        result["tokens_predicted"] = usage["completion_tokens"]
+        result["tokens_evaluated"] = usage.get("prompt_tokens", 0)
+    if "timings" in event:
+        result["timings"] = event["timings"]  # llama-server adds them to the last chunk
+    return result
+
+def _continuation_payload(payload, text, max_tokens):
+    """payload for continuing a generation that produced text so far.
+
+    Completion prompts get the text appended; chat requests get it as a
+    partial assistant message, which llama-server continues (prefill). A
+    json_schema is dropped: its grammar can only start at the beginning.
+    """
+    payload = {key: value for key, value in payload.items() if key != "json_schema"}
+    if "messages" in payload:
+        return {**payload, "messages": payload["messages"] + [{"role": "assistant", "content": text}],
+                "max_tokens": max_tokens}
+    return {**payload, "prompt": payload["prompt"] + text, "max_tokens": max_tokens}
+
+def _prompt_cache_stats(final):
+    """(prompt tokens, of those reused from the KV cache) of a finished request, or None.
+
+    llama-server reports the newly processed prompt tokens as timings.prompt_n
+    and, in newer builds, the reused ones as timings.cache_n.
+    """
+    timings = final.get("timings") or {}
+    if "prompt_n" not in timings:
+        return None
+    if "cache_n" in timings:
+        return timings["prompt_n"] + timings["cache_n"], timings["cache_n"]
+    total = final.get("tokens_evaluated")
+    if not total:
+        return None
+    return total, max(total - timings["prompt_n"], 0)
+
+def _stream_completion(payload, on_token=None, detector=None, stop_after_words=None, cancel_token=None):
+    """Stream a /completion request.
+
+    Returns (text, final_event, abort_reason). Returning early closes the
+    connection, which makes llama-server cancel the task and free its slot.
+    If stop_after_words is set, generation ends at the first paragraph
+    break after that many words (final_event["stopped_word_target"]).
+    Raises GenerationCancelled if cancel_token is cancelled.
+    """
+    pieces = []
+    tokens = 0
+    words = 0
+    in_word = False
+    tail = None  # Text since the word target was reached
+    url, body = _completion_request({**payload, "stream": True})
+    with _http().post(url, json=body, stream=True, timeout=120) as response:
+        if cancel_token:
+            cancel_token.attach(response)
+        try:
+            response.raise_for_status()
+            for event in _iter_stream_events(response, cancel_token):
+                event = _completion_event(event)
+                piece = event.get("content", "")
+                if piece:
+                    tokens += 1
+                    if tail is not None:
+                        # Stop cleanly at the next paragraph boundary
+                        boundary = (tail + piece).find("\n\n")
+                        if boundary != -1:
+                            piece = piece[:max(boundary - len(tail), 0)]
+                            pieces.append(piece)
+                            if on_token and piece:
+                                on_token(piece)
+                            return "".join(pieces), {"stopped_word_target": True, "tokens_predicted": tokens}, None
+                        tail = (tail + piece)[-1:]
+                    elif stop_after_words:
+                        words += len(piece.split())
+                        if in_word and not piece[0].isspace():
+                            words -= 1  # Word continued from the previous piece
+                        in_word = not piece[-1].isspace()
+                        if words > stop_after_words:
+                            tail = piece[-1:]
+
+                    pieces.append(piece)
+                    if on_token:
+                        on_token(piece)
+                    if detector:
+                        reason = detector.feed(piece)
+                        if reason:
+                            return "".join(pieces), event, reason
+                if event.get("stop"):
+                    event.setdefault("tokens_predicted", tokens)
+                    _record_draft_stats(event)
+                    return "".join(pieces), event, None
+        finally:
+            if cancel_token:
+                cancel_token.detach()
+    return "".join(pieces), {"tokens_predicted": tokens}, None
+
+def _record_draft_stats(event):
+    """Record speculative decoding statistics from a finished completion.
+
+    llama-server reports how many tokens the draft model proposed and how
+    many the target model accepted; tokens_per_second is the effective
+    decode speed including rejected drafts.
+    """
+    timings = event.get("timings") or {}
+    drafted = timings.get("draft_n")
+    if not drafted:
+        return
+    accepted = timings.get("draft_n_accepted", 0)
+    record_metric(
+        "speculative",
+        model=getattr(_PINNED, "model", None) or CURRENT_MODEL,
+        draft_tokens=drafted,
+        accepted_tokens=accepted,
+        acceptance_rate=round(accepted / drafted, 3),
+        tokens_per_second=round(timings.get("predicted_per_second", 0), 1)
+    )
+
+class _SeamJoiner:
+    """Streams a continuation, dropping text that repeats the previous part.
+
+    The start of the continuation is held back until it is long enough to
+    compare against the end of the text it continues.
+    """
+
+    def __init__(self, previous, on_token=None):
+        self.previous_tail = previous[-SEAM_WINDOW:]
+        self.on_token = on_token
+        self.head = ""
+        self.pieces = None
+
+    def feed(self, piece):
+        if self.pieces is None:
+            self.head += piece
+            if len(self.head) >= SEAM_WINDOW:
+                self._resolve()
+        else:
+            self._emit(piece)
+
+    def finish(self):
+        """Return the continuation text with any duplicated seam removed."""
+        if self.pieces is None:
+            self._resolve()
+        return "".join(self.pieces)
+
+    def _resolve(self):
+        self.pieces = []
+        overlap = 0
+        for size in range(min(len(self.previous_tail), len(self.head)), MIN_SEAM_OVERLAP - 1, -1):
+            if self.previous_tail.endswith(self.head[:size]):
+                overlap = size
+                break
+        self._emit(self.head[overlap:])
+
+    def _emit(self, piece):
+        if piece:
+            self.pieces.append(piece)
+            if self.on_token:
+                self.on_token(piece)
+
+def _continue_generation(payload, text, final, model_type, on_token=None, detector=None, stop_after_words=None, cancel_token=None):
+    """Continue a generation that stopped at max_tokens.
+
+    Each continuation re-sends the prompt plus the text so far (see
+    _continuation_payload) with cache_prompt, so llama-server reuses the
+    cached KV prefix and only decodes new tokens. Continuations stop at the configured token budget
+    or when the context is full. model_type is the role the generation
+    is pinned to, for the metrics. Returns (text, total_tokens, final_event).
+    """
+    budget = CONFIG.get("continuation_budget", 4096)
+    backend = getattr(_PINNED, "backend", None)
+    context_size = (backend and backend.context_size) or CONFIG["context_size"]
+    tokens = final.get("tokens_predicted", 0)
+    spent = 0
+
+    for _ in range(CONFIG.get("max_continuations", 3)):
+        context_used = final.get("tokens_evaluated", 0) + final.get("tokens_predicted", 0)
+        max_new = min(payload.get("max_tokens", 2048), budget - spent, context_size - context_used)
+        if max_new < 64:
+            break
+
+        log(f"Output hit the token limit - continuing (up to {max_new} more tokens)...")
+        words_left = None
+        if stop_after_words:
+            words_left = max(stop_after_words - len(text.split()), 1)
+
+        joiner = _SeamJoiner(text, on_token)
+        _, final, reason = _stream_completion(
+            _continuation_payload(payload, text, max_new),
+            joiner.feed, detector, words_left, cancel_token
+        )
+        if reason:
+            log(f"WARNING: Continuation aborted ({reason}); keeping the text so far")
+            record_metric("generation_aborted", reason=reason, model=model_type, continuation=True)
+            return text, tokens, {}
+
+        text += joiner.finish()
+        tokens += final["tokens_predicted"]
+        spent += final["tokens_predicted"]
+        record_metric("generation_continued", model=model_type, tokens=final["tokens_predicted"])
+        if not final.get("stopped_limit"):
+            return text, tokens, final
+
+    log("WARNING: Output still hit the token limit and may be truncated "
+        "(raise continuation_budget or context_size)")
+    record_metric("generation_truncated", model=model_type, tokens=tokens)
+    return text, tokens, final
+
+def generate_completion(prompt, max_tokens=None, system_prompt="", on_token=None, on_retry=None, stop_after_words=None, cancel_token=None, seed=None, json_schema=None, use_guard=True):
+    """Generate completion from loaded model.
+
+    If on_token is given, it is called with each piece of text as it
+    arrives. When the degeneration guard aborts a generation and retries
+    it with adjusted sampling, on_retry is called with the abort reason so
+    callers can discard the text streamed so far. If the last retry
+    degenerates too, the longest text an attempt wrote before it
+    degenerated is returned. stop_after_words ends
+    the generation at the first paragraph break after that many words.
+    Raises GenerationCancelled when cancel_token is cancelled, and
+    ServerCrashed when the server died during the request. Roles with the
+    "chat" request style send the system prompt and the prompt as chat
+    messages, formatted by the model's own chat template. seed fixes the
+    sampling seed. json_schema constrains the output to JSON matching the
+    schema (llama-server only). use_guard=False skips the degeneration
+    guard, for output that repeats by design.
+    """
     params = CONFIG["generation_params"].copy()
     if max_tokens:
         params["max_tokens"] = max_tokens
-
-    # If system prompt provided, prepend it to the user prompt
-    if system_prompt:
-        full_prompt = f"{system_prompt}\n\n{prompt}"
+    if seed is not None:
+        params["seed"] = seed
+    if json_schema:
+        params["json_schema"] = json_schema
+
+    model_type = getattr(_PINNED, "model", None) or CURRENT_MODEL
+    if get_request_style(model_type) == "chat":
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        prompt_fields = {"messages": messages + [{"role": "user", "content": prompt}]}
+    elif system_prompt:
+        # If system prompt provided, prepend it to the user prompt
+        prompt_fields = {"prompt": f"{system_prompt}\n\n{prompt}"}
     else:
-        full_prompt = prompt
+        prompt_fields = {"prompt": prompt}
 
     payload = {
-        "prompt": full_prompt,
+        **prompt_fields,
+        "cache_prompt": True,  # Keep the KV cache so continuations skip the prefill
         **params
     }
 
+    # Select the role's LoRA adapters when several roles share the server
+    backend = getattr(_PINNED, "backend", None)
+    if not backend and model_type and get_model_role(model_type) and _server_adapters(get_model_path(model_type)):
+        payload["lora"] = _lora_request(model_type)
+
+    guard = get_degeneration_guard()
+    if not use_guard:
+        guard = {**guard, "enabled": False}
+
     try:
-        response = requests.post(
-            f"http://127.0.0.1:{CONFIG['server_port']}/completion",
-            json=payload,
-            timeout=120
-        )
-        response.raise_for_status()
-        result = response.json()
-        return result.get("content", "").strip()
+        if on_token is None and not guard["enabled"] and not stop_after_words and cancel_token is None:
+            url, body = _completion_request(payload)
+            response = _http().post(url, json=body, timeout=120)
+            response.raise_for_status()
+            result = _completion_event(response.json())
+            _record_draft_stats(result)
+            text = result.get("content", "")
+            tokens = result.get("tokens_predicted", 0)
+            if result.get("stopped_limit"):
+                text, tokens, _ = _continue_generation(payload, text, result, model_type)
+            update_tokens_per_word(model_type, tokens, len(text.split()))
+            return text.strip()
+
+        attempts = 1 + guard["retries"] if guard["enabled"] else 1
+        salvaged = ""  # Longest text an aborted attempt wrote before it degenerated
+        for attempt in range(1, attempts + 1):
+            detector = DegenerationDetector(guard) if guard["enabled"] else None
+            start_time = time.time()
+            first_token = []
+
+            def on_piece(piece):
+                if not first_token:
+                    first_token.append(time.time() - start_time)
+                if on_token:
+                    on_token(piece)
+
+            text, final, reason = _stream_completion(payload, on_piece, detector, stop_after_words, cancel_token)
+            if not reason:
+                tokens = final["tokens_predicted"]
+                prompt_cache = _prompt_cache_stats(final)
+                if final.get("stopped_limit"):
+                    text, tokens, final = _continue_generation(
+                        payload, text, final, model_type, on_token, detector, stop_after_words, cancel_token
+                    )
+                words = len(text.split())
+                seconds = time.time() - start_time
+                update_tokens_per_word(model_type, tokens, words)
+                _LAST_COMPLETION.stats = {
+                    "tokens": tokens,
+                    "tokens_per_second": round(tokens / seconds, 1) if seconds else None,
+                    "time_to_first_token": round(first_token[0], 3) if first_token else None,
+                    "prompt_tokens": prompt_cache[0] if prompt_cache else None,
+                    "backend": backend.url if backend else None
+                }
+                record_metric(
+                    "generation",
+                    model=model_type,
+                    backend=backend.url if backend else None,
+                    tokens=tokens,
+                    words=words,
+                    seconds=round(seconds, 2),
+                    tokens_per_second=round(tokens / seconds, 1) if seconds else None,
+                    stopped_word_target=final.get("stopped_word_target", False),
+                    stopped_limit=final.get("stopped_limit", False),
+                    request_style="chat" if "messages" in payload else "completion",
+                    time_to_first_token=round(first_token[0], 3) if first_token else None,
+                    prompt_tokens=prompt_cache[0] if prompt_cache else None,
+                    cached_prompt_tokens=prompt_cache[1] if prompt_cache else None
+                )
+                return text.strip()
+
+            log(f"WARNING: Aborted runaway generation after {len(text.split())} words ({reason})")
+            clean = text[:detector.cut].strip()
+            if len(clean) > len(salvaged):
+                salvaged = clean
+            record_metric(
+                "generation_aborted",
+                reason=reason,
+                attempt=attempt,
+                model=model_type,
+                words=len(text.split()),
+                temperature=payload.get("temperature"),
+                repeat_penalty=payload.get("repeat_penalty")
+            )
+
+            if attempt < attempts:
+                # Push sampling away from the loop the model fell into
+                payload["repeat_penalty"] = round(min(payload.get("repeat_penalty", 1.1) + 0.1, 1.5), 2)
+                payload["temperature"] = round(min(payload.get("temperature", 0.8) + 0.1, 1.5), 2)
+                log(f"Retrying with temperature={payload['temperature']:.2f}, "
+                    f"repeat_penalty={payload['repeat_penalty']:.2f}")
+                if on_retry:
+                    on_retry(reason)
+
+        if salvaged:
+            log(f"WARNING: Output kept degenerating; keeping the {len(salvaged.split())} words "
+                "written before it did")
+            record_metric("generation_salvaged", model=model_type, words=len(salvaged.split()))
+            return salvaged
+        log("ERROR: Generation failed: output kept degenerating")
+        return None
+    except GenerationCancelled:
+        log("Generation cancelled (server stays loaded)")
+        record_metric("generation_cancelled", model=model_type)
+        raise
+    except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+            requests.exceptions.Timeout, requests.exceptions.HTTPError) as e:
+        status = e.response.status_code if e.response is not None else None
+        if backend and (status is None or status >= 500):
+            # Unreachable, dropped the connection, timed out or overloaded
+            seconds = _backend_pool().report_failure(backend)
+            _PINNED.backend_failed = True
+            log(f"WARNING: Backend {backend.url} failed ({e}); not using it for {seconds}s")
+            record_metric("backend_failed", model=model_type, url=backend.url, ejected_seconds=seconds)
+            raise BackendFailed(f"backend {backend.url} failed", backend)
+        if not isinstance(e, (requests.exceptions.Timeout, requests.exceptions.HTTPError)):
+            reason = _check_server(getattr(_PINNED, "port", None) or ACTIVE_PORT)
+            if reason:
+                raise ServerCrashed(reason)
+        log(f"ERROR: Generation failed: {e}")
+        return None
     except Exception as e:
         log(f"ERROR: Generation failed: {e}")
         return None
@@ -814,20 +2334,308 @@ Be extremely specific about visual details. Optimize for AI image generation cla
 Image Generation Prompt:"""
 }
 
+# Roster mode: many short items of a content type in one request (see generate_roster)
+ROSTER_TYPES = {
+    "character": {
+        "items": "minor NPCs",
+        "fields": {
+            "name": "full name",
+            "role": "occupation or role in the story",
+            "appearance": "one or two sentences",
+            "personality": "one or two sentences",
+            "hook": "a secret, goal or plot hook a writer can use"
+        }
+    },
+    "artifact": {
+        "items": "minor magic items and curiosities",
+        "fields": {
+            "name": "item name",
+            "appearance": "one or two sentences",
+            "power": "what it does, one or two sentences",
+            "cost": "drawback, price or limitation"
+        }
+    },
+    "image-prompt": {
+        "items": "image generation prompts",
+        "fields": {
+            "title": "short title",
+            "prompt": "comma-separated prompt: subject, setting, lighting, style, camera",
+            "negative_prompt": "comma-separated things to avoid",
+            "aspect_ratio": "e.g. Portrait 2:3"
+        }
+    },
+}
+
+ROSTER_TEMPLATE = """You are an expert worldbuilder creating a batch of {items}.
+
+Request: {user_prompt}
+
+Create {count} distinct {items}. Make every one clearly different from the others.{avoid}
+
+Output ONLY a JSON array of {count} objects, each with these fields:
+{fields}
+
+Start directly with [ and end with ]."""
+
+# Token budget per roster item (the whole array is one generation)
+ROSTER_TOKENS_PER_ITEM = 250
+
+# Results of generate_content waiting to be saved with their details (see catalog_output)
+MAX_PENDING_GENERATIONS = 256
+
+# Fact extraction (see fact_sheet): words of the output shown to the model, and its reply budget
+FACT_SOURCE_WORDS = 1500
+FACT_EXTRACTION_TOKENS = 400
+
 # ============================================================================
 # GENERATION FUNCTIONS
 # ============================================================================
 
-def generate_content(content_type, user_prompt, model_type="worldbuilding", output_format=".md", system_prompt="Default"):
-    """Generate content based on type and prompt."""
+# Templates state their length as "Length: 500-800 words" or "Target length: ..."
+_LENGTH_TARGET_RE = re.compile(r'\b(?:Target )?Length:\s*(\d+)\s*-\s*(\d+)\s*words', re.IGNORECASE)
+
+# Token budget relative to the upper word target, leaving room to finish the paragraph
+LENGTH_TARGET_HEADROOM = 1.25
+
+def get_length_target(content_type):
+    """Return the (min_words, max_words) target of a template, or None."""
+    match = _LENGTH_TARGET_RE.search(TEMPLATES.get(content_type, ""))
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+def route_model(content_type):
+    """Model role that generates content_type according to CONFIG["routing"].
+
+    An entry in "content_types" wins; otherwise the first "length_targets"
+    rule whose max_words covers the template's upper length target is used,
+    then the "default" role. Roles that are neither in CONFIG["models"] nor
+    served by backends are skipped.
+    """
+    routing = CONFIG.get("routing") or DEFAULT_CONFIG["routing"]
+    candidates = [routing.get("content_types", {}).get(content_type)]
+
+    target = get_length_target(content_type)
+    if target:
+        for rule in sorted(routing.get("length_targets", []), key=lambda r: r.get("max_words", 0)):
+            if target[1] <= rule.get("max_words", 0):
+                candidates.append(rule.get("model"))
+                break
+
+    candidates.append(routing.get("default", "worldbuilding"))
+    for model_type in candidates:
+        if not model_type:
+            continue
+        if model_type in model_roles():
+            return model_type
+        log(f"WARNING: Routing refers to unknown model role '{model_type}'")
+    return model_roles()[0]
+
+def _lore_index():
+    """LoreIndex of the output folder, opened on first use (None if SQLite lacks FTS5)."""
+    global LORE_INDEX
+    folder = Path(CONFIG["output_folder"])
+    with LORE_LOCK:
+        if LORE_INDEX is None or LORE_INDEX.folder != folder:
+            try:
+                LORE_INDEX = LoreIndex(folder)
+            except sqlite3.Error as e:
+                log(f"WARNING: Lore index unavailable ({e})")
+                return None
+        return LORE_INDEX
+
+def lore_context(content_type, user_prompt, model_type=None):
+    """Passages of earlier outputs relevant to a request, within CONFIG["lore"]["max_tokens"].
+
+    Only content types listed in CONFIG["lore"]["content_types"] get lore.
+    Files added or changed outside NarrAider are indexed on the first
+    call. Returns "" when nothing relevant was found.
+    """
+    settings = {**DEFAULT_CONFIG["lore"], **CONFIG.get("lore", {})}
+    if not settings["enabled"] or content_type not in settings["content_types"]:
+        return ""
+    index = _lore_index()
+    if index is None:
+        return ""
+    start_time = time.time()
+    try:
+        if not index.updated:
+            changed, removed = index.update()
+            if changed or removed:
+                log(f"Lore index: {changed} file(s) indexed, {removed} removed")
+        facts = {**DEFAULT_CONFIG["facts"], **CONFIG.get("facts", {})}
+        card_for = None
+        if facts["enabled"]:
+            card_for = lambda key: fact_card(index.folder / key, model_type, use_model=False)
+        text, hits = index.context(user_prompt, settings["max_tokens"], get_tokens_per_word(model_type),
+                                   card_for=card_for)
+    except sqlite3.Error as e:
+        log(f"WARNING: Lore lookup failed ({e})")
+        return ""
+    if hits:
+        log(f"Adding {len(hits)} lore passage(s) from {len({hit['path'] for hit in hits})} earlier output(s)"
+            f" ({sum(1 for hit in hits if hit['card'])} as fact cards)")
+    record_metric("lore", content_type=content_type, passages=len(hits), cards=sum(1 for hit in hits if hit["card"]),
+                  milliseconds=round((time.time() - start_time) * 1000, 1))
+    return text
+
+def _extract_facts(text, content_type, model_type=None):
+    """Ask the model for the facts of an output that does not follow its template.
+
+    Returns {field: value} (possibly empty), or None if the request failed.
+    """
+    if model_type is None:
+        model_type = route_model(content_type)
+    prompt, schema = extraction_request(" ".join(text.split()[:FACT_SOURCE_WORDS]), content_type)
+    if not acquire_model(model_type):
+        return None
+    log(f"Extracting a {content_type} fact sheet with the {model_type} model...")
+    try:
+        reply = generate_completion(prompt, max_tokens=FACT_EXTRACTION_TOKENS, json_schema=schema, use_guard=False)
+    except ServerCrashed as e:
+        log(f"WARNING: Fact extraction interrupted ({e})")
+        return None
+    finally:
+        release_model()
+    return parse_extraction(reply, content_type) if reply else None
+
+def fact_sheet(path, content_type=None, text=None, use_model=True, model_type=None):
+    """The fact sheet of a character, magic, culture or artifact output (see narraider_facts).
+
+    The sheet kept next to the file is used while the file is unchanged.
+    Otherwise the template's labels are read; if the output does not
+    follow its template, one short extraction request asks the model
+    (unless use_model is False or CONFIG["facts"]["model_fallback"] is
+    off). New sheets are saved next to the file. Returns None if there is
+    no sheet.
+    """
+    content_type = content_type or content_type_of(path)
+    if content_type not in FACT_FIELDS:
+        return None
+    try:
+        if text is None:
+            text = Path(path).read_text(encoding='utf-8')
+    except OSError as e:
+        log(f"WARNING: Could not read {path} ({e})")
+        return None
+    sheet = load_sheet(path, text)
+    if sheet is not None:
+        return sheet
+
+    facts = parse_facts(text, content_type, Path(path).suffix.lower())
+    method = "labels"
+    if not is_complete(facts):
+        settings = {**DEFAULT_CONFIG["facts"], **CONFIG.get("facts", {})}
+        if not use_model or not settings["model_fallback"]:
+            return None
+        extracted = _extract_facts(text, content_type, model_type)
+        if extracted is None:
+            return None
+        facts = {**extracted, **facts}
+        method = "model"
+    sheet = make_sheet(text, content_type, facts, method)
+    try:
+        save_sheet(path, sheet)
+    except OSError as e:
+        log(f"WARNING: Could not save the fact sheet of {path} ({e})")
+    return sheet
+
+def fact_card(path, model_type=None, use_model=True):
+    """An output's fact sheet as a card of about CONFIG["facts"]["card_tokens"], or None."""
+    sheet = fact_sheet(path, use_model=use_model, model_type=model_type)
+    if not sheet or not sheet["facts"].get("name"):
+        return None
+    settings = {**DEFAULT_CONFIG["facts"], **CONFIG.get("facts", {})}
+    return format_card(sheet, settings["card_tokens"], get_tokens_per_word(model_type))
+
+def with_fact_cards(user_prompt, paths, model_type=None):
+    """user_prompt followed by the fact cards of earlier outputs, in place of the whole documents."""
+    cards = []
+    for path in paths:
+        card = fact_card(path, model_type)
+        if card:
+            cards.append(f"- {card}")
+        else:
+            log(f"WARNING: No fact sheet for {path}; not added to the prompt")
+    if not cards:
+        return user_prompt
+    log(f"Adding {len(cards)} fact card(s) to the prompt")
+    return user_prompt + "\n\nEstablished facts (stay consistent with them):\n" + "\n".join(cards)
+
+def _catalog():
+    """Catalog of the output folder, opened on first use (None if SQLite lacks FTS5)."""
+    global CATALOG
+    folder = Path(CONFIG["output_folder"])
+    with CATALOG_LOCK:
+        if CATALOG is None or CATALOG.folder != folder:
+            try:
+                CATALOG = Catalog(folder)
+            except sqlite3.Error as e:
+                log(f"WARNING: Output catalog unavailable ({e})")
+                return None
+        return CATALOG
+
+def _remember_generation(result, details):
+    """Keep how a result was made until it is saved; the oldest unsaved ones are forgotten."""
+    with GENERATIONS_LOCK:
+        GENERATIONS.setdefault(sha256(result), []).append(details)
+        while len(GENERATIONS) > MAX_PENDING_GENERATIONS:
+            GENERATIONS.pop(next(iter(GENERATIONS)))
+
+def catalog_output(path, content, content_type, details=None):
+    """Record a saved output in the catalog (see narraider_catalog).
+
+    details holds prompt, model, system_prompt, params and timings; by
+    default they are those generate_content remembered for this content.
+    """
+    catalog = _catalog()
+    if catalog is None:
+        return
+    if details is None:
+        digest = sha256(content)
+        with GENERATIONS_LOCK:
+            pending = GENERATIONS.get(digest)
+            if pending:
+                details = pending.pop(0)
+                if not pending:
+                    del GENERATIONS[digest]
+    try:
+        catalog.record(path, content, dict(details or {}, content_type=content_type, created=time.time()))
+    except (sqlite3.Error, OSError, ValueError) as e:
+        log(f"WARNING: Could not add {path} to the catalog ({e})")
+
+def generate_content(content_type, user_prompt, model_type=None, output_format=".md", system_prompt="Default", on_text=None, on_retry=None, cancel_token=None, seed=None, on_prefill=None, use_lore=True):
+    """Generate content based on type and prompt.
+
+    If on_text is given, the output is streamed: on_text receives sanitized
+    text as it is generated, and the complete result is still returned.
+    on_retry is called with the reason when a runaway generation is aborted
+    and restarted, meaning the text streamed so far should be discarded.
+    Pass a CancellationToken to be able to stop the generation from another
+    thread; GenerationCancelled is raised when that happens. Without a
+    model_type the role is picked by route_model(). seed fixes the sampling
+    seed, and on_prefill is called once the first token arrives, i.e. the
+    prompt is in the server's cache (see generate_variants). Relevant
+    passages of earlier outputs are added to the request (see lore_context)
+    unless use_lore is False.
+    """
 
     if content_type not in TEMPLATES:
         log(f"ERROR: Unknown content type '{content_type}'")
         return None
 
-    # Ensure model is loaded
-    if not ensure_model_loaded(model_type):
-        return None
+    if model_type is None:
+        model_type = route_model(content_type)
+        log(f"Routing {content_type} to the {model_type} model")
+
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+
+    request_prompt = user_prompt
+    if use_lore:
+        lore = lore_context(content_type, user_prompt, model_type)
+        if lore:
+            user_prompt += f"\n\nEstablished lore from earlier work (stay consistent with it where it applies):\n{lore}"
 
     # Build prompt
     template = TEMPLATES[content_type]
@@ -845,14 +2653,92 @@ def generate_content(content_type, user_prompt, model_type="worldbuilding", outp
     if output_format in format_instructions:
         full_prompt += format_instructions[output_format]
 
+    # Size the token budget to the template's length target. Structured
+    # formats are left alone since cutting them short breaks the syntax.
+    max_tokens = None
+    stop_after_words = None
+    target = get_length_target(content_type)
+    if target and CONFIG.get("enforce_length_targets", True) and output_format not in (".json", ".xml"):
+        stop_after_words = target[1]
+        estimate = int(target[1] * get_tokens_per_word(model_type) * LENGTH_TARGET_HEADROOM)
+        max_tokens = min(estimate, CONFIG["generation_params"]["max_tokens"])
+        log(f"Length target {target[0]}-{target[1]} words: stopping after {stop_after_words} words, max {max_tokens} tokens")
+
     # Get system prompt text
     sys_prompt_text = SYSTEM_PROMPTS.get(system_prompt, "")
 
-    log(f"Generating {content_type} as {output_format} with '{system_prompt}' system prompt...")
+    # Stream through the sanitizer so leaked instructions never reach on_text
+    on_token = None
+    if on_text or on_prefill:
+        sanitizer = StreamSanitizer()
+        prefilled = []
+
+        def on_token(piece):
+            if on_prefill and not prefilled:
+                prefilled.append(True)
+                on_prefill()
+            if on_text:
+                cleaned = sanitizer.feed(piece)
+                if cleaned:
+                    on_text(cleaned)
+
+    def restart(reason):
+        if on_text:
+            sanitizer.reset()
+        if on_retry:
+            on_retry(reason)
+
+    # A generation has no side effects, so one interrupted by a server crash
+    # can be re-run, unless text was streamed to a caller that cannot discard it
+    replay = CONFIG.get("watchdog", {}).get("replay_requests", True) and (not on_text or on_retry)
+
     start_time = time.time()
+    failed_backends = []
+    while True:
+        # Ensure model is loaded and keep using its server even if another
+        # thread switches models while this one generates
+        if not acquire_model(model_type, cancel_token, failed_backends):
+            return None
+
+        log(f"Generating {content_type} as {output_format} with '{system_prompt}' system prompt...")
 
-    # Generate
-    result = generate_completion(full_prompt, system_prompt=sys_prompt_text)
+        # Generate
+        try:
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            _LAST_COMPLETION.stats = None
+            result = generate_completion(
+                full_prompt, max_tokens=max_tokens, system_prompt=sys_prompt_text,
+                on_token=on_token, on_retry=restart, stop_after_words=stop_after_words,
+                cancel_token=cancel_token, seed=seed
+            )
+            break
+        except ServerCrashed as e:
+            if not replay:
+                log(f"ERROR: Generation failed: {e if isinstance(e, BackendFailed) else 'llama-server crashed'}")
+                return None
+            crash = str(e)
+            failed_backend = getattr(e, "backend", None)
+        finally:
+            release_model()
+
+        record_metric("generation_replayed", model=model_type, reason=crash)
+        restart(f"server crashed ({crash})")
+        if failed_backend:
+            failed_backends.append(failed_backend)
+            if len(failed_backends) > CONFIG.get("backend_retries", 2):
+                log(f"ERROR: Generation failed on {len(failed_backends)} backends")
+                return None
+            log(f"Re-running the generation on another backend ({crash})")
+            continue
+        if not recover_server(model_type, cancel_token):
+            return None
+        log(f"Re-running the generation interrupted by the crash ({crash})")
+
+    if on_text:
+        tail = sanitizer.finish()
+        if tail:
+            on_text(tail)
 
     if result:
         # Clean up any leaked instructions or meta-text
@@ -862,8 +2748,16 @@ def generate_content(content_type, user_prompt, model_type="worldbuilding", outp
         word_count = len(result.split())
         log(f"Generated {word_count} words in {elapsed:.1f}s")
 
-        # Free VRAM if configured to do so
-        if not CONFIG.get("keep_server_loaded", False):
+        # For the catalog entry when the result is saved (see save_output)
+        params = dict(CONFIG["generation_params"], max_tokens=max_tokens or CONFIG["generation_params"]["max_tokens"])
+        _remember_generation(result, {
+            "prompt": request_prompt, "model": model_type, "system_prompt": system_prompt,
+            "params": dict(params, seed=seed) if seed is not None else params,
+            "timings": {"seconds": round(elapsed, 2), "words": word_count, **(_LAST_COMPLETION.stats or {})}
+        })
+
+        # Free VRAM if configured to do so (unless other generations still use the server)
+        if not CONFIG.get("keep_server_loaded", False) and not SERVER_LEASES and not _backend_pool().serves(model_type):
             log("Releasing VRAM (keep_server_loaded=False)")
             kill_server()
 
@@ -871,67 +2765,634 @@ def generate_content(content_type, user_prompt, model_type="worldbuilding", outp
 
     return None
 
-def clean_output(text, output_format):
-    """Remove leaked instruction text and meta-commentary from output."""
-    import re
-
-    # Patterns that indicate leaked instructions (case-insensitive)
-    instruction_patterns = [
-        r'^.*?FORMAT REQUIREMENT:.*?\n',
-        r'^.*?IMPORTANT:.*?\n',
-        r'^.*?Do not include these instructions.*?\n',
-        r'^.*?The scene must follow all requirements.*?\n',
-        r'^.*?Each sentence should be clear and concise.*?\n',
-        r'^.*?demonstrate a skilled understanding.*?\n',
-        r'^.*?Target length:.*?\n',
-        r'^.*?Requirements:.*?\n\n',
-    ]
+def generate_many(jobs, workers=None):
+    """Run several generate_content() calls concurrently.
+
+    jobs is a list of keyword-argument dicts for generate_content; the
+    results come back in the same order (None for failed jobs). By default
+    as many jobs run at once as the roles involved have slots: the slots of
+    their backends, or the local server's "parallel" setting.
+    """
+    if not jobs:
+        return []
+    if not workers:
+        pool = _backend_pool()
+        roles = {job.get("model_type") or route_model(job["content_type"]) for job in jobs}
+        workers = sum(pool.capacity(role) or CONFIG.get("parallel", 1) for role in roles)
+    with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        return list(executor.map(lambda job: generate_content(**job), jobs))
+
+def generate_variants(content_type, user_prompt, n, model_type=None, output_format=".md", system_prompt="Default", on_text=None, on_retry=None, cancel_token=None):
+    """Generate n variants of the same request at once, each with its own seed.
+
+    The first variant starts alone and the others follow as soon as its
+    first token arrives, so the prompt is already in the server's KV cache (shared
+    between slots with kv_unified). With at least n slots ("parallel", or
+    the backends' slots) the variants decode in one batch and take about as
+    long as a single generation. on_text(index, text) and
+    on_retry(index, reason) work like generate_content's callbacks per
+    variant. Returns the n results in order (None for failed variants).
+    """
+    if model_type is None:
+        model_type = route_model(content_type)
+        log(f"Routing {content_type} to the {model_type} model")
+    slots = _backend_pool().capacity(model_type) or CONFIG.get("parallel", 1)
+    if slots < n:
+        log(f"WARNING: {n} variants but {slots} slot(s); they will partly run one after another "
+            f"(raise \"parallel\" to {n})")
+
+    prefilled = threading.Event()
+    base_seed = random.randrange(2 ** 31)
+
+    def run(index):
+        if index:
+            while not prefilled.wait(0.1):
+                if cancel_token:
+                    cancel_token.raise_if_cancelled()
 
-    cleaned = text
-    for pattern in instruction_patterns:
-        cleaned = re.sub(pattern, '', cleaned, flags=re.IGNORECASE | re.MULTILINE)
+        try:
+            return generate_content(
+                content_type, user_prompt, model_type, output_format, system_prompt,
+                on_text=(lambda text: on_text(index, text)) if on_text else None,
+                on_retry=(lambda reason: on_retry(index, reason)) if on_retry else None,
+                cancel_token=cancel_token, seed=base_seed + index, on_prefill=prefilled.set
+            )
+        finally:
+            prefilled.set()
+
+    log(f"Generating {n} variants of {content_type}...")
+    with ThreadPoolExecutor(max_workers=n) as executor:
+        futures = [executor.submit(run, index) for index in range(n)]
+        return [future.result() for future in futures]
+
+def generate_roster(content_type, user_prompt, count, model_type=None, output_format=".md", system_prompt="Default", on_item=None, cancel_token=None):
+    """Generate count short items of a content type (see ROSTER_TYPES) in one request.
+
+    The model writes a JSON array, constrained by a JSON schema on
+    llama-server. Each object is handed to save_output() as soon as it
+    closes in the stream, as <type>_<time>_<number>_<name>, and
+    on_item(number, item, path) is called; the writer thread saves it
+    while the stream goes on. Items saved before a
+    cancellation or a crash stay on disk; after a crash only the missing
+    items are requested again. Returns the paths of the saved items.
+    """
+    roster = ROSTER_TYPES.get(content_type)
+    if not roster:
+        log(f"ERROR: No roster mode for '{content_type}' (available: {', '.join(ROSTER_TYPES)})")
+        return []
+    if model_type is None:
+        model_type = route_model(content_type)
+        log(f"Routing {content_type} to the {model_type} model")
+
+    fields = roster["fields"]
+    timestamp = unique_stamp()
+    saved = []
+    names = []
+
+    def save_item(item):
+        if len(saved) >= count or not isinstance(item, dict):
+            return
+        name = str(next(iter(item.values()), "")) if item else ""
+        slug = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")[:40] or "item"
+        # The slot exists before the writer thread can report on it
+        saved.append(None)
+        number = len(saved)
+
+        def on_saved(path, error):
+            saved[number - 1] = path  # None if it could not be written
+
+        path = save_output(format_roster_item(item, output_format), content_type, output_format,
+                           f"{content_type}_{timestamp}_{number:02d}_{slug}{output_format}",
+                           details={"prompt": user_prompt, "model": model_type, "system_prompt": system_prompt,
+                                    "params": {"roster": count, "item": number}},
+                           wait=False, on_saved=on_saved, overwrite=False)
+        names.append(name)
+        if on_item:
+            on_item(number, item, path)
 
-    # Remove leading/trailing whitespace
-    cleaned = cleaned.strip()
+    start_time = time.time()
+    failed_backends = []
+    for attempt in range(1 + CONFIG.get("backend_retries", 2)):
+        remaining = count - len(saved)
+        if remaining <= 0:
+            break
+        avoid = f" These already exist, do not repeat them: {', '.join(names)}." if names else ""
+        prompt = ROSTER_TEMPLATE.format(
+            items=roster["items"], user_prompt=user_prompt, count=remaining, avoid=avoid,
+            fields="\n".join(f'- "{name}": {description}' for name, description in fields.items())
+        )
+        schema = {
+            "type": "array",
+            "minItems": remaining,
+            "maxItems": remaining,
+            "items": {
+                "type": "object",
+                "properties": {name: {"type": "string"} for name in fields},
+                "required": list(fields)
+            }
+        }
+        parser = JsonArrayItems()
+
+        if not acquire_model(model_type, cancel_token, failed_backends):
+            break
+        log(f"Generating a roster of {remaining} {roster['items']} as {output_format}...")
+        try:
+            generate_completion(
+                prompt, max_tokens=remaining * ROSTER_TOKENS_PER_ITEM,
+                system_prompt=SYSTEM_PROMPTS.get(system_prompt, ""),
+                on_token=lambda piece: [save_item(item) for item in parser.feed(piece)],
+                cancel_token=cancel_token, json_schema=schema, use_guard=False
+            )
+            crash = None
+        except ServerCrashed as e:
+            crash = e
+        finally:
+            release_model()
+
+        if parser.invalid:
+            log(f"WARNING: Skipped {parser.invalid} roster item(s) that were not valid JSON")
+        if crash is None:
+            break
+        log(f"WARNING: Roster interrupted after {len(saved)} of {count} items ({crash}); requesting the rest")
+        record_metric("roster_interrupted", model=model_type, saved=len(saved), count=count)
+        if getattr(crash, "backend", None):
+            failed_backends.append(crash.backend)
+        elif not recover_server(model_type, cancel_token):
+            break
+
+    flush_outputs()
+    saved = [path for path in saved if path]
+    log(f"Roster: {len(saved)} of {count} {roster['items']} saved in {time.time() - start_time:.1f}s")
+    record_metric("roster", model=model_type, content_type=content_type, count=count, saved=len(saved))
+    if not CONFIG.get("keep_server_loaded", False) and not SERVER_LEASES and not _backend_pool().serves(model_type):
+        log("Releasing VRAM (keep_server_loaded=False)")
+        kill_server()
+    return saved
+
+def save_variants(variants, content_type, output_format=".md", wait=True, on_saved=None):
+    """Save variants as a numbered set (<type>_<timestamp>_v1, _v2, ...); returns the paths.
+
+    wait and on_saved work like save_output's.
+    """
+    timestamp = unique_stamp()
+    paths = [
+        save_output(content, content_type, output_format, f"{content_type}_{timestamp}_v{number}{output_format}",
+                    wait=wait, on_saved=on_saved, overwrite=False)
+        for number, content in enumerate(variants, 1) if content
+    ]
+    return [path for path in paths if path]
+
+# Instruction fragments the model sometimes echoes back. Any complete line
+# containing one of them (case-insensitive) is removed from the output.
+LEAKED_INSTRUCTION_MARKERS = [
+    "FORMAT REQUIREMENT:",
+    "IMPORTANT:",
+    "Do not include these instructions",
+    "The scene must follow all requirements",
+    "Each sentence should be clear and concise",
+    "demonstrate a skilled understanding",
+    "Target length:",
+]
+
+_LEAKED_INSTRUCTION_RE = re.compile(
+    "|".join(re.escape(marker) for marker in LEAKED_INSTRUCTION_MARKERS),
+    re.IGNORECASE
+)
+# Case-insensitive regex search is slow on multi-megabyte text, so candidate
+# lines are found with a case-sensitive search over lowercased text and then
+# confirmed with the exact regex. Dotless i and long s match "i"/"s" under
+# re.IGNORECASE but lowercase to themselves, so they are folded by hand.
+_LEAKED_INSTRUCTION_PREFILTER_RE = re.compile(
+    "|".join(re.escape(marker.lower()) for marker in LEAKED_INSTRUCTION_MARKERS)
+)
+# "Requirements:" lines are only removed when followed by a blank line
+_REQUIREMENTS_RE = re.compile(re.escape("Requirements:"), re.IGNORECASE)
+
+class StreamSanitizer:
+    """Incremental version of clean_output() for streamed generations.
+
+    Text is released one complete line at a time. The lookback is limited to
+    the unfinished line, at most one "Requirements:" line waiting to see
+    whether a blank line follows it, and trailing whitespace (which is only
+    released once more text follows it).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Discard all buffered text, e.g. when a generation is restarted."""
+        self._partial = []
+        self._pending = ""
+        self._held_whitespace = ""
+        self._started = False
+
+    def feed(self, chunk):
+        """Add streamed text; return the part that is now safe to emit."""
+        if "\n" not in chunk:
+            self._partial.append(chunk)
+            return ""
+
+        buffer = "".join(self._partial) + chunk
+        cut = buffer.rfind("\n") + 1
+        self._partial = [buffer[cut:]]
+        return self._release(self._filter_lines(buffer[:cut]))
+
+    def finish(self):
+        """Flush whatever is still buffered at the end of the stream."""
+        # An unterminated last line is never removed, and a pending
+        # "Requirements:" line can no longer be followed by a blank line.
+        text = self._pending + "".join(self._partial)
+        self._pending = ""
+        self._partial = []
+        released = self._release(text)
+        self._held_whitespace = ""
+        return released
+
+    def _filter_lines(self, block):
+        """Drop leaked instruction lines from a block of complete lines."""
+        folded = block.lower().replace("\u0131", "i").replace("\u017f", "s")
+        if len(folded) == len(block):
+            haystack, search = folded, _LEAKED_INSTRUCTION_PREFILTER_RE.search
+        else:
+            # Some character lowercases to several, so offsets would drift
+            haystack, search = block, _LEAKED_INSTRUCTION_RE.search
+
+        kept = []
+        pos = 0
+        match = search(haystack)
+        while match:
+            start = block.rfind("\n", 0, match.start()) + 1
+            end = block.index("\n", match.end()) + 1
+            if _LEAKED_INSTRUCTION_RE.search(block, start, end):
+                kept.append(block[pos:start])
+                pos = end
+            match = search(haystack, end)
+        kept.append(block[pos:])
+
+        text = self._pending + "".join(kept)
+        self._pending = ""
+
+        kept = []
+        pos = 0
+        stop = len(text)
+        match = _REQUIREMENTS_RE.search(text)
+        while match:
+            start = text.rfind("\n", 0, match.start()) + 1
+            end = text.index("\n", match.end()) + 1
+            if end == len(text):
+                # Can't tell yet whether a blank line follows - hold it back
+                self._pending = text[start:]
+                stop = start
+                break
+            if text[end] == "\n":
+                kept.append(text[pos:start])
+                pos = end = end + 1
+            match = _REQUIREMENTS_RE.search(text, end)
+        kept.append(text[pos:stop])
+        return "".join(kept)
+
+    def _release(self, text):
+        """Apply the leading/trailing whitespace strip of clean_output()."""
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        text = self._held_whitespace + text
+        body = text.rstrip()
+        self._held_whitespace = text[len(body):]
+        return body
+
+class JsonArrayItems:
+    """Extract the objects of a streamed JSON array as soon as each one closes.
+
+    Text before the opening "[" is ignored. feed() returns the items
+    completed by the new text; objects that are not valid JSON are counted
+    in invalid and skipped.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.current = None  # Characters of the object being read
+        self.invalid = 0
+        self.closed = False  # The array ended
+
+    def feed(self, text):
+        items = []
+        for char in text:
+            if self.closed:
+                break
+            if self.depth == 0:
+                if char == "[":
+                    self.depth = 1
+                continue
+            if self.current is not None:
+                self.current.append(char)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "[{":
+                if self.depth == 1 and char == "{":
+                    self.current = [char]
+                self.depth += 1
+            elif char in "]}":
+                self.depth -= 1
+                if self.depth == 1 and self.current is not None:
+                    try:
+                        items.append(json.loads("".join(self.current)))
+                    except ValueError:
+                        self.invalid += 1
+                    self.current = None
+                elif self.depth == 0:
+                    self.closed = True
+        return items
+
+def format_roster_item(item, output_format=".md"):
+    """Render one roster item (a JSON object) as a document in output_format."""
+    if output_format == ".json":
+        return json.dumps(item, indent=2, ensure_ascii=False)
+    title = str(next(iter(item.values()), "")) if item else ""
+    fields = [(key.replace("_", " ").capitalize(), str(value)) for key, value in item.items()]
+    if output_format == ".html":
+        rows = "\n".join(f"<p><strong>{html.escape(k)}:</strong> {html.escape(v)}</p>" for k, v in fields[1:])
+        return f"<h1>{html.escape(title)}</h1>\n{rows}"
+    if output_format == ".xml":
+        rows = "\n".join(f"  <{key}>{xml_escape(str(value))}</{key}>" for key, value in item.items())
+        return f'<?xml version="1.0" encoding="UTF-8"?>\n<item>\n{rows}\n</item>'
+    if output_format == ".txt":
+        return f"{title}\n\n" + "\n".join(f"{k}: {v}" for k, v in fields[1:])
+    return f"# {title}\n\n" + "\n".join(f"**{k}:** {v}\n" for k, v in fields[1:])
 
-    return cleaned
+def clean_output(text, output_format):
+    """Remove leaked instruction text and meta-commentary from output."""
+    sanitizer = StreamSanitizer()
+    return sanitizer.feed(text) + sanitizer.finish()
+
+# Output subfolder of each content type; other types go to "misc"
+OUTPUT_SUBFOLDERS = {
+    "character": "characters",
+    "magic": "magic_systems",
+    "science": "science_systems",
+    "artifact": "artifacts",
+    "culture": "cultures",
+    "relationships": "relationships",
+    "concept": "concepts",
+    "scene-dialogue": "scenes",
+    "scene-combat": "scenes",
+    "scene-explicit": "scenes",
+    "scene-general": "scenes",
+    "image-prompt": "image_prompts"
+}
 
-def save_output(content, content_type, output_format=".md", filename=None):
-    """Save generated content to file."""
+def unique_stamp():
+    """Timestamp for output names (YYYYmmdd_HHMMSS_mmm), later than any issued before by this process.
+
+    Two saves in the same millisecond get consecutive milliseconds, so
+    names sort in the order the outputs were saved.
+    """
+    global LAST_OUTPUT_STAMP
+    with OUTPUT_WRITER_LOCK:
+        milliseconds = max(int(time.time() * 1000), LAST_OUTPUT_STAMP + 1)
+        LAST_OUTPUT_STAMP = milliseconds
+    return datetime.fromtimestamp(milliseconds / 1000).strftime("%Y%m%d_%H%M%S_") + f"{milliseconds % 1000:03d}"
+
+def _claim_path(temporary, path, overwrite):
+    """Move a written temporary file to path; returns where it ended up.
+
+    Unless overwrite is set, an existing file is never replaced: the
+    name gets a -2, -3, ... suffix instead. A hard link claims a name
+    atomically even against other processes; on file systems without
+    hard links the name is checked first.
+    """
+    if overwrite:
+        os.replace(temporary, path)
+        return path
+    candidate = path
+    number = 2
+    while True:
+        try:
+            os.link(temporary, candidate)
+        except FileExistsError:
+            pass
+        except OSError:
+            if not candidate.exists():
+                os.replace(temporary, candidate)
+                return candidate
+        else:
+            os.unlink(temporary)
+            return candidate
+        candidate = path.with_name(f"{path.stem}-{number}{path.suffix}")
+        number += 1
+
+class SaveJob:
+    """One output waiting for the OutputWriter.
+
+    path is where it is planned; after the save it is where the file
+    ended up (see _claim_path), or error is set.
+    """
+
+    def __init__(self, content, content_type, path, overwrite=False, details=None, on_saved=None):
+        self.content = content
+        self.content_type = content_type
+        self.path = path
+        self.overwrite = overwrite
+        self.details = details
+        self.on_saved = on_saved
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Wait for the save; returns the path, or None if it failed or is still pending."""
+        self.done.wait(timeout)
+        return self.path if self.done.is_set() and self.error is None else None
+
+class OutputWriter:
+    """Writes outputs on a background thread so generation never waits on the disk.
+
+    Saves wait in a bounded queue; when it is full, submit() blocks rather
+    than letting unsaved outputs pile up. Each file is written under a
+    temporary name and renamed into place, so a crash never leaves half a
+    file, and generated names are claimed without replacing an existing
+    file, so concurrent jobs and other NarrAider processes cannot
+    overwrite each other's outputs. With fsync, the files of a batch are
+    flushed to disk before they are renamed, and each of their folders
+    once after.
+    """
+
+    def __init__(self, queue_size=64, fsync=False, batch_size=16):
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.fsync = fsync
+        self.batch_size = max(1, batch_size)
+        self._waiting = False  # Warned about a full queue, until it empties
+        self._thread = threading.Thread(target=self._run, name="output-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, job):
+        """Queue a SaveJob; returns it."""
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            if not self._waiting:
+                log(f"WARNING: {self.queue.maxsize} outputs waiting to be saved; waiting for the disk")
+                self._waiting = True
+            self.queue.put(job)
+        return job
+
+    def flush(self):
+        """Wait until every queued output is saved."""
+        self.queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                if self.queue.empty():
+                    self._waiting = False
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, batch):
+        start_time = time.time()
+        pending = []
+        for job in batch:
+            try:
+                job.path.parent.mkdir(parents=True, exist_ok=True)
+                handle, temporary = tempfile.mkstemp(dir=job.path.parent, prefix=f".{job.path.name}.", suffix=".tmp")
+                f = os.fdopen(handle, 'w', encoding='utf-8')
+                try:
+                    f.write(job.content)
+                    f.flush()
+                except BaseException:
+                    f.close()
+                    os.unlink(temporary)
+                    raise
+                pending.append((job, f, temporary))
+            except (OSError, ValueError) as e:  # ValueError: a name the file system cannot take
+                job.error = e
+
+        # Everything is written before the first fsync, so the disk can take it in one go
+        for job, f, temporary in pending:
+            try:
+                if self.fsync:
+                    os.fsync(f.fileno())
+                f.close()
+                job.path = _claim_path(Path(temporary), job.path, job.overwrite)
+            except (OSError, ValueError) as e:
+                job.error = e
+                try:
+                    f.close()
+                    os.unlink(temporary)
+                except OSError:
+                    pass
+        if self.fsync and os.name != 'nt':  # Windows cannot flush a folder
+            for folder in {job.path.parent for job in batch if job.error is None}:
+                try:
+                    handle = os.open(folder, os.O_RDONLY)
+                    try:
+                        os.fsync(handle)
+                    finally:
+                        os.close(handle)
+                except OSError as e:
+                    log(f"WARNING: Could not flush {folder} to disk ({e})")
+        if len(batch) > 1:
+            record_metric("output_batch", files=len(batch), fsync=self.fsync,
+                          milliseconds=round((time.time() - start_time) * 1000, 1))
+
+        for job in batch:
+            if job.error is None:
+                log(f"Saved to: {job.path}")
+                try:
+                    _index_output(job.path, job.content, job.content_type, job.details)
+                except Exception as e:  # The file is saved; the writer thread must keep going
+                    log(f"WARNING: Could not index {job.path} ({e})")
+            else:
+                log(f"ERROR: Could not save {job.path} ({job.error})")
+            job.done.set()
+            if job.on_saved:
+                try:
+                    job.on_saved(job.path if job.error is None else None, job.error)
+                except Exception as e:
+                    log(f"WARNING: on_saved callback failed ({e})")
+
+def _output_writer():
+    """The OutputWriter, started on first use with CONFIG["output_writer"]."""
+    global OUTPUT_WRITER
+    with OUTPUT_WRITER_LOCK:
+        if OUTPUT_WRITER is None:
+            settings = {**DEFAULT_CONFIG["output_writer"], **CONFIG.get("output_writer", {})}
+            OUTPUT_WRITER = OutputWriter(settings["queue_size"], settings["fsync"], settings["batch_size"])
+        return OUTPUT_WRITER
+
+def flush_outputs():
+    """Wait until every output given to save_output is on disk."""
+    if OUTPUT_WRITER is not None:
+        OUTPUT_WRITER.flush()
+
+# Outputs saved with wait=False must not be lost when a script ends right after
+atexit.register(flush_outputs)
+
+def _index_output(output_path, content, content_type, details=None):
+    """Fact sheet, lore index and catalog entry of a saved output."""
+    # A compact fact sheet for later prompts (see fact_sheet); outputs that
+    # ignore their template get one from the model when first needed
+    settings = {**DEFAULT_CONFIG["facts"], **CONFIG.get("facts", {})}
+    if settings["enabled"] and content_type in FACT_FIELDS:
+        fact_sheet(output_path, content_type, content, use_model=False)
+
+    # Later requests can draw on it (see lore_context)
+    index = _lore_index()
+    if index:
+        try:
+            index.add(output_path, content)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            log(f"WARNING: Could not add {output_path} to the lore index ({e})")
+
+    catalog_output(output_path, content, content_type, details)
+
+def save_output(content, content_type, output_format=".md", filename=None, details=None, wait=True, on_saved=None, overwrite=None):
+    """Save generated content to file.
+
+    Without a filename the name is <type>_<YYYYmmdd_HHMMSS_mmm> (see
+    unique_stamp). The file is written by the OutputWriter thread and
+    never replaces an existing file, except one given by filename (unless
+    overwrite is False). With wait=False this returns at once with the
+    planned path, and on_saved(path, error) is called from the writer
+    thread when the file is on disk; path is None if saving failed.
+    Otherwise it returns the path once the file is saved, or None.
+
+    The file is catalogued with how it was made: details, or what
+    generate_content remembered for this content (see catalog_output).
+    """
     if content is None:
         log("ERROR: Cannot save None content")
         return None
 
+    if overwrite is None:
+        overwrite = bool(filename)
     if not filename:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{content_type}_{timestamp}{output_format}"
-
-    # Determine subfolder based on type
-    subfolder = {
-        "character": "characters",
-        "magic": "magic_systems",
-        "science": "science_systems",
-        "artifact": "artifacts",
-        "culture": "cultures",
-        "relationships": "relationships",
-        "concept": "concepts",
-        "scene-dialogue": "scenes",
-        "scene-combat": "scenes",
-        "scene-explicit": "scenes",
-        "scene-general": "scenes",
-        "image-prompt": "image_prompts"
-    }.get(content_type, "misc")
-
-    output_dir = Path(CONFIG["output_folder"]) / subfolder
-    output_dir.mkdir(parents=True, exist_ok=True)
-
-    output_path = output_dir / filename
-
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(content)
-
-    log(f"Saved to: {output_path}")
-    return output_path
+        filename = f"{content_type}_{unique_stamp()}{output_format}"
+    output_path = Path(CONFIG["output_folder"]) / OUTPUT_SUBFOLDERS.get(content_type, "misc") / filename
+
+    job = _output_writer().submit(SaveJob(content, content_type, output_path, overwrite, details, on_saved))
+    if not wait:
+        return output_path
+    return job.wait()
 
 # ============================================================================
 # CLI INTERFACE
@@ -950,31 +3411,72 @@ Examples:
   # Magic system
   python narraider.py --type magic --prompt "Blood magic with aging cost"
 
-  # Explicit scene
-  python narraider.py --type scene-explicit --prompt "Space pirates after near-death" --model explicit
+  # Explicit scene (routed to the explicit model by default)
+  python narraider.py --type scene-explicit --prompt "Space pirates after near-death"
+
+  # Override the routing table
+  python narraider.py --type image-prompt --prompt "Rogue in the rain" --model worldbuilding
 
   # Story concept
   python narraider.py --type concept --prompt "Cozy coffee shop romance" --output outputs/concepts/coffee_shop.txt
+
+  # Three variants of a character to pick from (saved as character_<time>_v1..v3.md)
+  python narraider.py --type character --prompt "Disgraced court alchemist" --n 3
+
+  # Roster: 20 minor NPCs in one request, each saved as its own file as soon as it is written
+  python narraider.py --type character --prompt "Dockside tavern regulars" --roster 20
+
+  # A scene with two earlier characters, passed as ~100-token fact cards instead of whole profiles
+  python narraider.py --type scene-dialogue --prompt "They meet at the forge" --with outputs/characters/a.md outputs/characters/b.md
         """
     )
 
+    # Load config first: the model roles come from it
+    load_config()
+
     parser.add_argument('--type', required=True, choices=list(TEMPLATES.keys()),
                        help='Type of content to generate')
     parser.add_argument('--prompt', required=True,
                        help='Description of what to generate')
-    parser.add_argument('--model', default='worldbuilding', choices=['worldbuilding', 'explicit'],
-                       help='Which model to use (default: worldbuilding)')
+    parser.add_argument('--model', choices=model_roles(),
+                       help='Which model role to use (default: picked by the routing table)')
     parser.add_argument('--format', default='.md', choices=['.txt', '.md', '.html', '.json', '.xml'],
                        help='Output format (default: .md)')
     parser.add_argument('--output', help='Output file path (optional)')
+    parser.add_argument('--n', type=int, default=1,
+                       help='Generate this many variants at once and save them as a numbered set (default: 1)')
+    parser.add_argument('--roster', type=int, metavar='COUNT',
+                       help=f'Generate COUNT short items in one request, one file each ({", ".join(ROSTER_TYPES)})')
+    parser.add_argument('--with', dest='with_files', nargs='+', metavar='FILE', default=[],
+                       help='Earlier character/magic/culture/artifact outputs to add to the prompt as short fact cards')
     parser.add_argument('--version', action='version', version=f'NarrAider {VERSION}')
 
     args = parser.parse_args()
 
-    # Load config
-    load_config()
-
     try:
+        if args.with_files:
+            args.prompt = with_fact_cards(args.prompt, args.with_files, args.model)
+
+        if args.roster:
+            saved = generate_roster(
+                args.type, args.prompt, args.roster, args.model, args.format,
+                on_item=lambda number, item, path: print(f"  {number:>3}. {next(iter(item.values()), '')}")
+            )
+            return 0 if saved else 1
+
+        if args.n > 1:
+            variants = generate_variants(args.type, args.prompt, args.n, args.model, args.format)
+            if not any(variants):
+                log("Generation failed.")
+                return 1
+            save_variants(variants, args.type, args.format)
+            for number, variant in enumerate(variants, 1):
+                print("\n" + "="*30 + f" Variant {number} " + "="*30)
+                print(variant if variant else "(failed)")
+            print("="*80 + "\n")
+            log(f"Generated {sum(1 for v in variants if v)} of {args.n} variants")
+            return 0
+
         # Generate content
         result = generate_content(args.type, args.prompt, args.model, args.format)
 
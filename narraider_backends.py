@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+NarrAider backends - Spread generations over several inference servers
+Created by Andreas "Uriel1339" Lopez
+
+Keeps the "backends" from narraider_config.json: llama-server or
+OpenAI-compatible endpoints, local or remote, each serving one model role
+with a number of slots. NarrAider never starts or stops them; what a
+backend serves (model, context, slots, chat template) is asked from the
+server itself and cached until it fails. Requests go to the backend with
+the fewest outstanding requests per slot. A backend that fails is ejected
+for a cool-down that doubles with every consecutive failure, so traffic
+moves to the healthy ones and comes back once the backend recovers.
+MIT License - Free to use, modify, and distribute.
+"""
+
+import sys
+import threading
+import time
+
+import requests
+
+# API flavours and the paths NarrAider uses on them
+BACKEND_APIS = {
+    "llama": {"completion": "/completion", "chat": "/v1/chat/completions", "health": "/health", "props": "/props"},
+    "openai": {"completion": "/v1/completions", "chat": "/v1/chat/completions", "health": "/v1/models",
+               "props": "/v1/models"},
+}
+
+# Ejection after the first failure; doubled per further failure, up to the maximum
+EJECT_SECONDS = 5
+MAX_EJECT_SECONDS = 120
+
+# Minimum time between attempts to discover a backend that did not answer
+REDISCOVER_SECONDS = 10
+
+class Backend:
+    """One inference endpoint serving a model role.
+
+    model and slots may be left out; they are then taken from what the
+    server reports (see discover).
+    """
+
+    def __init__(self, url, model=None, slots=None, api="llama", served_model=None):
+        if api not in BACKEND_APIS:
+            raise ValueError(f"Unknown backend API '{api}' (use {' or '.join(BACKEND_APIS)})")
+        self.url = url.rstrip("/")
+        self.configured = {"model": model, "slots": slots, "served_model": served_model}
+        self.model = model
+        self.slots = max(1, int(slots or 1))
+        self.api = api
+        self.served_model = served_model  # "model" field of OpenAI requests
+        self.capabilities = None  # What the server reported, see discover
+        self.discovered_at = 0.0
+        self.discovering = False  # A BackendPool thread is asking the server, see BackendPool.refresh
+        self.outstanding = 0
+        self.failures = 0  # Consecutive failures
+        self.ejected_until = 0.0
+        self.completed = 0
+        # Keep-alive connections, one per slot, shared by all threads
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(self.slots, 10))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def path(self, kind):
+        """URL of the completion, chat, health or props endpoint."""
+        return self.url + BACKEND_APIS[self.api][kind]
+
+    def probe(self, timeout=2):
+        """True if the backend answers its health endpoint."""
+        try:
+            return self.session.get(self.path("health"), timeout=timeout).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def discover(self, role_for=None, timeout=2):
+        """Ask the server what it serves and cache the answer in capabilities.
+
+        llama-server reports its model file, per-slot context size, slot
+        count and chat template on /props; OpenAI-compatible servers list
+        their model on /v1/models. Settings given in the config take
+        precedence. Without a configured model role, role_for(model) names
+        it. Returns the capabilities, or None if the server did not answer.
+        """
+        self.discovered_at = time.time()
+        try:
+            response = self.session.get(self.path("props"), timeout=timeout)
+            response.raise_for_status()
+            props = response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+
+        if self.api == "llama":
+            settings = props.get("default_generation_settings") or {}
+            capabilities = {
+                "model": props.get("model_path") or props.get("model_alias"),
+                "context_size": settings.get("n_ctx") or props.get("n_ctx"),
+                "slots": props.get("total_slots"),
+                "chat_template": bool(props.get("chat_template")),
+            }
+        else:
+            served = (props.get("data") or [{}])[0]
+            capabilities = {
+                "model": served.get("id"),
+                "context_size": served.get("max_model_len"),
+                "slots": None,
+                "chat_template": True,  # Chat models apply their template server-side
+            }
+
+        self.capabilities = capabilities
+        if not self.configured["slots"] and capabilities["slots"]:
+            self.slots = int(capabilities["slots"])
+        if not self.configured["served_model"] and self.api == "openai":
+            self.served_model = capabilities["model"]
+        if not self.configured["model"] and role_for and capabilities["model"]:
+            self.model = role_for(capabilities["model"])
+        return capabilities
+
+    @property
+    def context_size(self):
+        """Context per request reported by the server, or None if unknown."""
+        return (self.capabilities or {}).get("context_size")
+
+    def available(self, now):
+        """True if the backend is not ejected and has a free slot."""
+        return now >= self.ejected_until and self.outstanding < self.slots
+
+    def status(self, now=None):
+        """Health summary for display."""
+        now = now or time.time()
+        if now < self.ejected_until:
+            state = f"ejected for {self.ejected_until - now:.0f}s after {self.failures} failure(s)"
+        elif self.failures:
+            state = "on probation"
+        elif self.capabilities is None:
+            state = "not answering" if self.discovered_at else "not contacted"
+        else:
+            state = "healthy"
+        return {"url": self.url, "model": self.model, "api": self.api, "slots": self.slots,
+                "outstanding": self.outstanding, "completed": self.completed, "state": state,
+                "capabilities": self.capabilities}
+
+class BackendPool:
+    """Least-outstanding-requests dispatch over the configured backends."""
+
+    def __init__(self, backends, role_for=None):
+        self.backends = list(backends)
+        self.role_for = role_for  # Names the role of a discovered model
+        self.entries = None  # Config entries the pool was built from
+        self.changed = threading.Condition()
+
+    @classmethod
+    def from_config(cls, entries, role_for=None, discover=True):
+        """Build a pool from the "backends" config list, asking each server what it serves."""
+        pool = cls(
+            (Backend(e["url"], e.get("model"), e.get("slots"), e.get("api", "llama"), e.get("served_model"))
+             for e in entries),
+            role_for
+        )
+        pool.entries = [dict(e) for e in entries]
+        if discover:
+            pool.refresh(force=True)
+        return pool
+
+    def refresh(self, force=False, wait=True):
+        """Discover backends that have not answered yet (at most every REDISCOVER_SECONDS).
+
+        Each server is asked on its own thread. With wait=False this
+        returns at once, and changed is notified as the answers come in;
+        otherwise it waits for them, including discoveries already running.
+        """
+        now = time.time()
+        with self.changed:
+            stale = [b for b in self.backends if b.capabilities is None and not b.discovering
+                     and (force or now - b.discovered_at >= REDISCOVER_SECONDS)]
+            for backend in stale:
+                backend.discovering = True
+        for backend in stale:
+            threading.Thread(target=self._discover, args=(backend,), daemon=True).start()
+        if wait:
+            self._settle()
+
+    def _settle(self):
+        """Wait for the discoveries that are running."""
+        with self.changed:
+            while any(b.discovering for b in self.backends):
+                self.changed.wait()
+
+    def _discover(self, backend):
+        try:
+            backend.discover(self.role_for)
+        finally:
+            with self.changed:
+                backend.discovering = False
+                self.changed.notify_all()
+
+    def serves(self, model, wait=False):
+        """True if any backend is configured for (or found serving) the model role.
+
+        Answers from what is known without waiting, so it is safe to call
+        from the GUI thread; backends that have not answered yet are asked
+        again in the background (see refresh). With wait, the answers are
+        waited for first, for callers about to send a request.
+        """
+        if not any(b.model == model for b in self.backends):
+            self.refresh(wait=wait)
+        return any(b.model == model for b in self.backends)
+
+    def acquire(self, model, exclude=(), should_stop=None):
+        """Reserve a slot on the best backend for model and return it.
+
+        Waits while every backend is busy or ejected; the backend whose
+        ejection ends first is tried again then (half-open). Backends in
+        exclude are skipped unless no other backend serves the role.
+        Returns None if no backend serves the role. should_stop() is polled
+        while waiting and may raise to give up.
+        """
+        if not any(b.model == model for b in self.backends):
+            self.refresh()
+        candidates = [b for b in self.backends if b.model == model]
+        if not candidates:
+            return None
+        others = [b for b in candidates if b not in exclude]
+        candidates = others or candidates
+
+        with self.changed:
+            while True:
+                now = time.time()
+                ready = [b for b in candidates if b.available(now)]
+                if ready:
+                    backend = min(ready, key=lambda b: ((b.outstanding + 1) / b.slots, b.failures))
+                    backend.outstanding += 1
+                    return backend
+                if should_stop:
+                    should_stop()
+                waits = [b.ejected_until - now for b in candidates if b.ejected_until > now]
+                self.changed.wait(min(waits + [0.5]))
+
+    def release(self, backend, succeeded=True):
+        """Return a slot; a success ends any ejection history.
+
+        A backend that answers requests but not discovery (or came back
+        after a failure) is asked again in the background, at most every
+        REDISCOVER_SECONDS (see refresh).
+        """
+        if succeeded and backend.capabilities is None:
+            self.refresh(wait=False)
+        with self.changed:
+            backend.outstanding -= 1
+            if succeeded:
+                backend.completed += 1
+                backend.failures = 0
+                backend.ejected_until = 0.0
+            self.changed.notify_all()
+
+    def report_failure(self, backend):
+        """Eject a backend that failed a request; returns the ejection in seconds.
+
+        Its capabilities are asked again once it answers: the server may
+        have been restarted with other settings.
+        """
+        with self.changed:
+            backend.failures += 1
+            backend.capabilities = None
+            backend.discovered_at = time.time()
+            seconds = min(MAX_EJECT_SECONDS, EJECT_SECONDS * 2 ** (backend.failures - 1))
+            backend.ejected_until = time.time() + seconds
+            self.changed.notify_all()
+            return seconds
+
+    def capacity(self, model):
+        """Total slots of the backends serving model (once running discoveries have answered)."""
+        self._settle()
+        return sum(b.slots for b in self.backends if b.model == model)
+
+    def status(self):
+        """Health summaries of all backends."""
+        now = time.time()
+        with self.changed:
+            return [b.status(now) for b in self.backends]
+
+def main():
+    """Check the configured backends and show what they serve."""
+    import narraider
+    narraider.load_config()
+    pool = narraider._backend_pool()
+    if not pool.backends:
+        print("No backends configured (add them under \"backends\" in narraider_config.json).")
+        return 0
+    healthy = 0
+    for backend in pool.backends:
+        capabilities = backend.capabilities or backend.discover(pool.role_for)
+        healthy += bool(capabilities)
+        print(f"{'[OK]' if capabilities else '[X] '} {backend.model or '?':<14} {backend.url} "
+              f"({backend.api}, {backend.slots} slot(s))")
+        if capabilities:
+            print(f"     serves {capabilities['model']}, context {capabilities['context_size'] or 'unknown'}, "
+                  f"chat template: {'yes' if capabilities['chat_template'] else 'no'}")
+    print(f"{healthy}/{len(pool.backends)} backend(s) answering")
+    return 0 if healthy == len(pool.backends) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
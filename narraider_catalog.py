@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+NarrAider catalog - Find any output by what it is and how it was made
+Created by Andreas "Uriel1339" Lopez
+
+Every file save_output writes gets a catalog row: content type, the prompt,
+model role, sampling parameters, timings, path and a SHA-256 of the
+content. The rows are kept in an SQLite database in the output folder with
+an FTS5 index over the title, prompt and opening of each output, so the
+CLI and the GUI's History tab can search 100,000 outputs in milliseconds.
+
+What the files cannot tell by themselves (prompt, model, parameters,
+timings) is also appended to a journal next to the database. rebuild()
+recreates the database from the journal and the files on disk; files
+that were never recorded (older outputs, files copied in by hand) are
+catalogued from their name, folder and text.
+MIT License - Free to use, modify, and distribute.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from narraider_lore import SKIP_NAMES, SKIP_SUFFIXES, TEXT_SUFFIXES, document_text
+
+CATALOG_NAME = ".catalog.sqlite"
+JOURNAL_NAME = ".catalog.jsonl"
+SCHEMA_VERSION = 1
+
+# Characters of each output's text kept for search and previews
+EXCERPT_CHARS = 300
+
+# BM25 weights of the title, prompt and excerpt when results are ranked
+TITLE_WEIGHT = 4.0
+PROMPT_WEIGHT = 2.0
+EXCERPT_WEIGHT = 1.0
+
+# Content types of the output subfolders, for files without a journal entry
+FOLDER_TYPES = {
+    "characters": "character", "magic_systems": "magic", "science_systems": "science",
+    "artifacts": "artifact", "cultures": "culture", "relationships": "relationships",
+    "concepts": "concept", "scenes": "scene", "image_prompts": "image-prompt", "books": "book",
+}
+
+# Columns of a catalog entry, in table order
+COLUMNS = ["path", "content_type", "format", "title", "prompt", "model", "system_prompt",
+           "params", "timings", "created", "size", "mtime", "sha256", "excerpt"]
+
+# "character_20260131_191205..." as save_output names files
+_NAME_RE = re.compile(r"^([a-z]+(?:-[a-z]+)?)_(\d{8}_\d{6})")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def sha256(text):
+    """Hex SHA-256 of a text as it is saved (UTF-8)."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def _title(plain):
+    """A document's first non-empty line, without markup."""
+    for line in plain.splitlines():
+        line = line.strip().strip("#*").strip()
+        if line:
+            return line[:100]
+    return ""
+
+def match_expression(query):
+    """An FTS5 expression matching outputs that contain every word of query.
+
+    The last word also matches as a prefix, so results follow typing.
+    Returns None when query has no words.
+    """
+    words = _WORD_RE.findall(query.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words[:-1]] + [f'"{words[-1]}"*']
+    return " AND ".join(terms)
+
+class Catalog:
+    """Metadata and search index of the outputs in one folder."""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.path = self.folder / CATALOG_NAME
+        self.journal = self.folder / JOURNAL_NAME
+        self.lock = threading.Lock()
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")  # The GUI, the CLI and scripts can share the catalog
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.db.executescript("""
+                DROP TABLE IF EXISTS outputs_fts;
+                DROP TABLE IF EXISTS outputs;
+            """)
+        # Like the lore index: a plain table indexed by an external-content
+        # FTS table, kept in step by triggers. Row ids grow with time, so
+        # "newest first" walks the FTS index backwards and stops at the limit.
+        self.db.executescript(f"""
+            CREATE TABLE IF NOT EXISTS outputs (
+                id INTEGER PRIMARY KEY, path TEXT UNIQUE, content_type TEXT, format TEXT, title TEXT,
+                prompt TEXT, model TEXT, system_prompt TEXT, params TEXT, timings TEXT, created REAL,
+                size INTEGER, mtime REAL, sha256 TEXT, excerpt TEXT
+            );
+            CREATE INDEX IF NOT EXISTS outputs_type ON outputs (content_type, id);
+            CREATE INDEX IF NOT EXISTS outputs_model ON outputs (model, id);
+            CREATE INDEX IF NOT EXISTS outputs_sha256 ON outputs (sha256);
+            CREATE VIRTUAL TABLE IF NOT EXISTS outputs_fts USING fts5(
+                title, prompt, excerpt, content='outputs', content_rowid='id',
+                tokenize='porter unicode61', prefix='2 3'
+            );
+            CREATE TRIGGER IF NOT EXISTS outputs_insert AFTER INSERT ON outputs BEGIN
+                INSERT INTO outputs_fts (rowid, title, prompt, excerpt) VALUES (new.id, new.title, new.prompt, new.excerpt);
+            END;
+            CREATE TRIGGER IF NOT EXISTS outputs_delete AFTER DELETE ON outputs BEGIN
+                INSERT INTO outputs_fts (outputs_fts, rowid, title, prompt, excerpt)
+                VALUES ('delete', old.id, old.title, old.prompt, old.excerpt);
+            END;
+            INSERT INTO outputs_fts (outputs_fts, rank) VALUES ('rank', 'bm25({TITLE_WEIGHT}, {PROMPT_WEIGHT}, {EXCERPT_WEIGHT})');
+            PRAGMA user_version={SCHEMA_VERSION};
+        """)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _key(self, path):
+        """Path of a file relative to the folder, with forward slashes (None if outside it)."""
+        try:
+            return Path(path).resolve().relative_to(self.folder.resolve()).as_posix()
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _catalogued(key):
+        parts = key.split("/")
+        return (Path(key).suffix.lower() in TEXT_SUFFIXES and parts[-1] not in SKIP_NAMES
+                and not parts[-1].lower().endswith(SKIP_SUFFIXES)
+                and not any(part.startswith(".") for part in parts))
+
+    def _describe(self, key, text, stat, info=None):
+        """A catalog entry of one file; info holds what only the generation knows."""
+        info = info or {}
+        name = key.split("/")[-1]
+        match = _NAME_RE.match(name)
+        created = info.get("created")
+        if created is None and match:
+            try:
+                created = datetime.strptime(match.group(2), "%Y%m%d_%H%M%S").timestamp()
+            except ValueError:
+                pass
+        plain = document_text(text, Path(key).suffix.lower())
+        return {
+            "path": key,
+            "content_type": info.get("content_type") or (match.group(1) if match else None)
+                            or FOLDER_TYPES.get(key.split("/")[0]) or "misc",
+            "format": Path(key).suffix.lower(),
+            "title": _title(plain),
+            "prompt": info.get("prompt") or "",
+            "model": info.get("model") or "",
+            "system_prompt": info.get("system_prompt") or "",
+            "params": info.get("params") or {},
+            "timings": info.get("timings") or {},
+            "created": created if created is not None else stat.st_mtime,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": sha256(text),
+            "excerpt": " ".join(plain.split())[:EXCERPT_CHARS],
+        }
+
+    def _insert(self, entries, replace=True):
+        """Add entries, replacing those of the same paths (caller holds the lock and commits).
+
+        A replaced entry keeps its row id, and with it its place in the history.
+        """
+        rows = []
+        for entry in entries:
+            row_id = None
+            if replace:
+                row = self.db.execute("SELECT id FROM outputs WHERE path = ?", (entry["path"],)).fetchone()
+                if row:
+                    row_id = row[0]
+                    self.db.execute("DELETE FROM outputs WHERE id = ?", row)
+            rows.append([row_id] + [json.dumps(entry[c]) if c in ("params", "timings") else entry[c] for c in COLUMNS])
+        self.db.executemany(
+            f"INSERT INTO outputs (id, {', '.join(COLUMNS)}) VALUES ({', '.join('?' * (len(COLUMNS) + 1))})", rows
+        )
+
+    def _append_journal(self, entries):
+        with open(self.journal, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def record(self, path, text=None, info=None):
+        """Catalog one saved output; returns its entry (None if the file is not catalogued).
+
+        info may hold content_type, prompt, model, system_prompt, params,
+        timings and created (a timestamp) of the generation that made it.
+        """
+        path = Path(path)
+        key = self._key(path)
+        if key is None or not self._catalogued(key):
+            return None
+        if text is None:
+            text = path.read_text(encoding='utf-8', errors='replace')
+        entry = self._describe(key, text, path.stat(), info)
+        with self.lock:
+            self._append_journal([entry])
+            with self.db:
+                self._insert([entry])
+        return entry
+
+    def remove(self, path):
+        """Drop a file from the catalog."""
+        key = self._key(path)
+        if key is None:
+            return
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM outputs WHERE path = ?", (key,))
+
+    def _scan(self):
+        """(key, path, stat) of every catalogued file under the folder."""
+        for root, dirs, files in os.walk(self.folder):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            prefix = Path(root).relative_to(self.folder).as_posix()
+            for name in files:
+                key = name if prefix == "." else f"{prefix}/{name}"
+                if not self._catalogued(key):
+                    continue
+                path = Path(root) / name
+                try:
+                    yield key, path, path.stat()
+                except OSError:
+                    continue
+
+    def _from_disk(self, found, known):
+        """Entries of files whose size or modification time differ from known[key].
+
+        The generation details of a known entry are kept, since editing
+        a file by hand does not change how it was made.
+        """
+        entries = []
+        for key, path, stat in found:
+            old = known.get(key)
+            if old and (old["size"], old["mtime"]) == (stat.st_size, stat.st_mtime):
+                continue
+            try:
+                text = path.read_text(encoding='utf-8', errors='replace')
+            except OSError:
+                continue
+            entries.append(self._describe(key, text, stat, old))
+        return entries
+
+    def update(self):
+        """Bring the catalog in line with the folder: add new and changed files, drop deleted ones.
+
+        Returns (added_or_changed, removed).
+        """
+        with self.lock:
+            rows = self.db.execute(f"SELECT {', '.join(COLUMNS)} FROM outputs").fetchall()
+        known = {row[0]: self._entry(row) for row in rows}
+        found = list(self._scan())
+        seen = {key for key, _, _ in found}
+        removed = [key for key in known if key not in seen]
+        entries = self._from_disk(found, known)
+        with self.lock, self.db:
+            for key in removed:
+                self.db.execute("DELETE FROM outputs WHERE path = ?", (key,))
+            self._insert(sorted(entries, key=lambda e: e["created"]))
+        return len(entries), len(removed)
+
+    def rebuild(self):
+        """Recreate the catalog from the journal and the files on disk.
+
+        Files matching their latest journal entry are not read again.
+        Returns (files catalogued, files that had no journal entry).
+        """
+        journal = {}
+        try:
+            with open(self.journal, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by a crash
+                    if isinstance(entry, dict) and "path" in entry:
+                        journal[entry["path"]] = entry
+        except OSError:
+            pass
+        found = list(self._scan())
+        entries = [journal[key] for key, _, stat in found
+                   if key in journal and (journal[key]["size"], journal[key]["mtime"]) == (stat.st_size, stat.st_mtime)]
+        fresh = self._from_disk(found, journal)
+        new = sum(1 for entry in fresh if entry["path"] not in journal)
+        entries.extend(fresh)
+        entries.sort(key=lambda e: e["created"])
+        with self.lock:
+            with self.db:
+                self.db.execute("DELETE FROM outputs")
+                self.db.execute("INSERT INTO outputs_fts (outputs_fts) VALUES ('rebuild')")
+                self._insert(entries, replace=False)
+                self.db.execute("INSERT INTO outputs_fts (outputs_fts) VALUES ('optimize')")
+            # Compact the journal to the entries that are still on disk
+            temporary = self.journal.with_name(self.journal.name + ".tmp")
+            with open(temporary, 'w', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(temporary, self.journal)
+        return len(entries), new
+
+    @staticmethod
+    def _entry(row):
+        entry = dict(zip(COLUMNS, row))
+        for column in ("params", "timings"):
+            try:
+                entry[column] = json.loads(entry[column] or "{}")
+            except ValueError:
+                entry[column] = {}
+        return entry
+
+    def search(self, query="", content_type=None, model=None, limit=100, ranked=False):
+        """Outputs matching every word of query (all outputs if it is empty).
+
+        content_type and model narrow the results down. Newest come first,
+        or the best matches if ranked. Each result is an entry dict like
+        record() returns, with path relative to the folder.
+        """
+        expression = match_expression(query)
+        where = []
+        params = []
+        if expression:
+            where.append("outputs_fts MATCH ?")
+            params.append(expression)
+        if content_type:
+            where.append("outputs.content_type = ?")
+            params.append(content_type)
+        if model:
+            where.append("outputs.model = ?")
+            params.append(model)
+        columns = ", ".join(f"outputs.{c}" for c in COLUMNS)
+        if expression:
+            order = "outputs_fts.rank" if ranked else "outputs_fts.rowid DESC"
+            sql = (f"SELECT {columns} FROM outputs_fts JOIN outputs ON outputs.id = outputs_fts.rowid "
+                   f"WHERE {' AND '.join(where)} ORDER BY {order} LIMIT ?")
+        else:
+            sql = (f"SELECT {columns} FROM outputs {'WHERE ' + ' AND '.join(where) if where else ''} "
+                   f"ORDER BY outputs.id DESC LIMIT ?")
+        with self.lock:
+            rows = self.db.execute(sql, params + [limit]).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def find(self, path=None, digest=None):
+        """Entries of a file, or of every file with a given SHA-256."""
+        if path is not None:
+            key = self._key(path) if Path(path).is_absolute() else Path(path).as_posix()
+            condition, value = "path = ?", key
+        else:
+            condition, value = "sha256 = ?", digest
+        with self.lock:
+            rows = self.db.execute(f"SELECT {', '.join(COLUMNS)} FROM outputs WHERE {condition}", (value,)).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def stats(self):
+        """Number of catalogued outputs per content type."""
+        with self.lock:
+            rows = self.db.execute("SELECT content_type, COUNT(*) FROM outputs GROUP BY content_type").fetchall()
+        return dict(rows)
+
+def format_entry(entry, width=100):
+    """One catalog entry as a line for the terminal."""
+    when = datetime.fromtimestamp(entry["created"]).strftime("%Y-%m-%d %H:%M")
+    label = entry["title"] or entry["prompt"] or entry["excerpt"]
+    line = f"{when}  {entry['content_type']:<15} {entry['model'] or '-':<14} {label}"
+    return line[:width - len(entry["path"]) - 2].ljust(width - len(entry["path"]) - 2) + "  " + entry["path"]
+
+def main():
+    """Search the catalog of outputs, or bring it up to date."""
+    parser = argparse.ArgumentParser(description="Search every NarrAider output by its text, prompt, type or model")
+    parser.add_argument("query", nargs="?", default="", help="Words to search for (default: list the newest outputs)")
+    parser.add_argument("--type", help="Only outputs of this content type")
+    parser.add_argument("--model", help="Only outputs of this model role")
+    parser.add_argument("--limit", type=int, default=20, help="Number of results (default: 20)")
+    parser.add_argument("--ranked", action="store_true", help="Best matches first instead of newest first")
+    parser.add_argument("--details", action="store_true", help="Show prompt, parameters and timings of each result")
+    parser.add_argument("--update", action="store_true", help="Catalog files added, changed or deleted by hand")
+    parser.add_argument("--rebuild", action="store_true", help="Recreate the catalog from its journal and the files on disk")
+    parser.add_argument("--folder", help="Output folder (default: output_folder from the config)")
+    args = parser.parse_args()
+
+    folder = args.folder
+    if not folder:
+        import narraider
+        narraider.load_config()
+        folder = narraider.CONFIG["output_folder"]
+    catalog = Catalog(folder)
+
+    if args.rebuild or args.update:
+        start = time.perf_counter()
+        if args.rebuild:
+            count, new = catalog.rebuild()
+            print(f"Catalogued {count} outputs ({new} without generation details) "
+                  f"in {time.perf_counter() - start:.2f}s")
+        else:
+            changed, removed = catalog.update()
+            print(f"{changed} outputs catalogued, {removed} removed in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    results = catalog.search(args.query, args.type, args.model, args.limit, args.ranked)
+    elapsed = (time.perf_counter() - start) * 1000
+    for entry in results:
+        print(format_entry(entry))
+        if args.details:
+            print(f"    prompt:  {entry['prompt'] or '-'}")
+            print(f"    params:  {json.dumps(entry['params'])}")
+            print(f"    timings: {json.dumps(entry['timings'])}")
+            print(f"    sha256:  {entry['sha256']}")
+    print(f"{len(results)} result(s) in {elapsed:.1f} ms ({sum(catalog.stats().values())} outputs catalogued)")
+    catalog.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,668 @@
+#!/usr/bin/env python3
+"""
+NarrAider chapters - Write a whole book from a generated concept document
+Created by Andreas "Uriel1339" Lopez
+
+Reads the chapter plan of a Concept.txt written by the "concept" template
+(chapter count, emotional beats, acts and structure signposts) and drafts
+one chapter per request. Every request carries a story bible taken from the
+concept and a rolling summary of the story so far: each finished chapter is
+summarized, and each finished act is condensed into a recap, so the prompt
+fits the server's context however long the book gets. Within an act the
+chapters follow each other; the acts themselves are drafted side by side on
+free slots, a later act working from the plan where earlier chapters are
+not written yet. Chapters and summaries are saved as soon as they are done,
+so an interrupted run picks up where it stopped.
+MIT License - Free to use, modify, and distribute.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import narraider
+from narraider import log, record_metric
+
+# Books are kept in <output_folder>/books/<name>/
+BOOKS_FOLDER = "books"
+STATE_FILE = "book.json"
+
+# Words per chapter when the concept does not state the book's length
+CHAPTER_WORDS = (2000, 2500)
+
+# Length of the rolling summaries
+SUMMARY_WORDS = 120
+RECAP_WORDS = 200
+
+# Chapters per part when the concept lists no acts
+PART_CHAPTERS = 5
+
+# Words of the previous chapter's ending given for a seamless hand-over
+ENDING_WORDS = 250
+
+# Length of a chapter's plan when it stands in for a summary
+PLANNED_WORDS = 30
+
+# Share of the context the story bible may take, and the tokens kept free
+BIBLE_SHARE = 0.4
+PROMPT_MARGIN = 64
+
+# Concept sections that make up the story bible, most important first
+BIBLE_SECTIONS = ["CONCEPT", "CONSTRAINTS", "PROSE STYLE", "CHARACTER REQUIREMENTS", "UNIQUE ELEMENTS"]
+
+CHAPTER_TEMPLATE = """You are a novelist writing a book chapter by chapter from its concept document.
+
+STORY BIBLE:
+{bible}
+
+STORY SO FAR:
+{story}
+
+CHAPTER {number} OF {count}{part}
+{plan}
+{ending}
+Write Chapter {number} in full: {min_words}-{max_words} words of finished prose that carries out this plan and continues seamlessly from the story so far. Keep the POV, tense, tone and style of the story bible. {heading} Do not summarize and do not add notes; stop at the end of the chapter.
+
+Chapter {number}:"""
+
+SUMMARY_TEMPLATE = """Summarize Chapter {number} of a novel for the author's continuity notes.
+
+{text}
+
+In at most {words} words, state what happens, what changed for each character involved, and which threads are left open. Plain prose, no headings.
+
+Summary:"""
+
+RECAP_TEMPLATE = """Condense these chapter summaries of {part} into one recap for the author's continuity notes.
+
+{summaries}
+
+In at most {words} words, keep the events, character changes and open threads later chapters depend on. Plain prose, no headings.
+
+Recap:"""
+
+_SECTION_RE = re.compile(r"^[#*\s]*\[([A-Z][A-Z0-9 &/\-]*)\][*:\s]*$", re.MULTILINE)
+_CHAPTER_COUNT_RE = re.compile(r"CHAPTER COUNT:\W*(\d+)", re.IGNORECASE)
+_BOOK_WORDS_RE = re.compile(r"([\d,]{3,})\s*(?:-|–|—|to)\s*([\d,]{3,})\s*words|([\d,]{3,})\s*words", re.IGNORECASE)
+_BEAT_RE = re.compile(
+    r"^(?:\d+[.)]\s+)?(?:chapter|ch\.?)\s*(\d+)\s*(?:[(\[]([^)\]]*)[)\]])?\s*[:.\-–—]+\s*(.+)$"
+    r"|^(\d+)\s*[.):\-–—]+\s*(.+)$",
+    re.IGNORECASE
+)
+_ACT_RE = re.compile(
+    r"^ACT\s+(\w+)\s*\((?:chapters?|ch\.?)\s*(\d+)\s*[-–—]\s*(\d+)\)\s*[:.\-–—]*\s*(.*)$", re.IGNORECASE
+)
+_BULLET_CHAPTER_RE = re.compile(r"^(?:chapter|ch\.?)\s*(\d+)\s*[:.\-–—]+\s*(.+)$", re.IGNORECASE)
+_SIGNPOST_RE = re.compile(
+    r"^\d+\.\s+(.+?)\s*\((?:chapters?|ch\.?)\s*(\d+)(?:\s*[-–—]\s*(\d+))?[^)]*\)\s*:?\s*(.*)$",
+    re.IGNORECASE | re.DOTALL
+)
+_TITLE_RE = re.compile(r"^[#*\s]*chapter\s+\d+\s*[:.\-–—]+\s*(.+?)[*\s]*$", re.IGNORECASE)
+
+def _plain(line):
+    """A concept line without list bullets and markdown emphasis."""
+    return line.replace("**", "").strip().lstrip("-*•").strip()
+
+def _words(text, limit):
+    """text cut to its first limit words."""
+    words = text.split()
+    return text.strip() if len(words) <= limit else " ".join(words[:limit]) + " ..."
+
+def _clip(text, limit):
+    """text cut to limit words, keeping its beginning and its end."""
+    words = text.split()
+    if len(words) <= limit:
+        return text.strip()
+    half = limit // 2
+    return " ".join(words[:half]) + "\n\n[...]\n\n" + " ".join(words[-half:])
+
+def _tokens(text, model_type):
+    """Estimated tokens of text for a model role."""
+    return int(len(text.split()) * narraider.get_tokens_per_word(model_type)) + 1
+
+def parse_sections(text):
+    """Split a concept document into its [SECTION] blocks (name -> body)."""
+    headings = list(_SECTION_RE.finditer(text))
+    return {
+        match.group(1).strip(): text[match.end():headings[i + 1].start() if i + 1 < len(headings) else len(text)].strip()
+        for i, match in enumerate(headings)
+    }
+
+def _section(sections, prefix):
+    """Body of the first section whose name starts with prefix ("" if none)."""
+    return next((body for name, body in sections.items() if name.startswith(prefix)), "")
+
+def parse_concept(text):
+    """Read the chapter plan of a concept document.
+
+    Returns a dict with the story bible, the words per chapter, the
+    chapters (number, beat from [EMOTIONAL BEATS], purpose from the act
+    bullets of [STORY STRUCTURE], signposts due in the chapter) and the
+    parts the chapters are grouped in: the acts, or runs of PART_CHAPTERS
+    chapters when the concept lists none. The chapter list is empty if
+    the document has no chapter plan.
+    """
+    sections = parse_sections(text)
+    chapters = {}
+
+    def chapter(number):
+        return chapters.setdefault(number, {"number": number, "title": "", "beat": "", "purpose": "", "signposts": []})
+
+    for line in _section(sections, "EMOTIONAL BEATS").splitlines():
+        match = _BEAT_RE.match(_plain(line))
+        if match:
+            number = int(match.group(1) or match.group(4))
+            entry = chapter(number)
+            entry["title"] = (match.group(2) or "").strip()
+            entry["beat"] = (match.group(3) or match.group(5)).strip()
+
+    acts = []
+    for line in _section(sections, "STORY STRUCTURE").splitlines():
+        match = _ACT_RE.match(_plain(line))
+        if match:
+            first, last = int(match.group(2)), int(match.group(3))
+            acts.append({"name": f"Act {match.group(1)}", "title": match.group(4).strip(),
+                         "chapters": list(range(first, last + 1)), "bullets": 0})
+        elif acts and line.strip()[:1] in "-*•" and _plain(line):
+            act = acts[-1]
+            bullet = _plain(line)
+            numbered = _BULLET_CHAPTER_RE.match(bullet)
+            if numbered:
+                number, bullet = int(numbered.group(1)), numbered.group(2)
+            elif act["bullets"] < len(act["chapters"]):
+                number = act["chapters"][act["bullets"]]
+            else:
+                continue
+            act["bullets"] += 1
+            entry = chapter(number)
+            entry["purpose"] = f"{entry['purpose']} {bullet}".strip()
+
+    for item in re.split(r"\n\s*(?=\d+\.\s)", _section(sections, "SUPER STRUCTURE")):
+        match = _SIGNPOST_RE.match(item.replace("**", "").strip())
+        if match:
+            name = match.group(1).strip().title()
+            description = " ".join(match.group(4).split()).strip("() ")
+            first = int(match.group(2))
+            for number in range(first, int(match.group(3) or first) + 1):
+                chapter(number)["signposts"].append(f"{name}: {description}" if description else name)
+
+    count_match = _CHAPTER_COUNT_RE.search(text)
+    count = max([int(count_match.group(1)) if count_match else 0]
+                + list(chapters) + [n for act in acts for n in act["chapters"]])
+    for number in range(1, count + 1):
+        chapter(number)
+
+    # Every chapter belongs to one part; chapters outside the acts form their own parts
+    parts = []
+    covered = set()
+    for act in acts:
+        numbers = [n for n in act["chapters"] if n <= count and n not in covered]
+        covered.update(numbers)
+        parts.append({"name": act["name"], "title": act["title"], "chapters": numbers})
+    loose = [n for n in range(1, count + 1) if n not in covered]
+    for start in range(0, len(loose), PART_CHAPTERS):
+        numbers = loose[start:start + PART_CHAPTERS]
+        parts.append({"name": f"Chapters {numbers[0]}-{numbers[-1]}", "title": "", "chapters": numbers})
+    parts = sorted((p for p in parts if p["chapters"]), key=lambda p: p["chapters"][0])
+    for number, part in enumerate(parts, 1):
+        part.update(number=number, recap="")
+        for n in part["chapters"]:
+            chapters[n]["part"] = number
+
+    words = CHAPTER_WORDS
+    constraints = _section(sections, "CONSTRAINTS")
+    format_line = next((line for line in constraints.splitlines() if "FORMAT" in line.upper()), "")
+    match = _BOOK_WORDS_RE.search(format_line)
+    if match and count:
+        low, high = (int(g.replace(",", "")) for g in (match.group(1, 2) if match.group(1) else match.group(3, 3)))
+        if high // count >= 300:
+            words = (low // count // 100 * 100, -(-high // count // 100) * 100)
+
+    bible = "\n\n".join(f"[{name}]\n{_section(sections, name)}" for name in BIBLE_SECTIONS if _section(sections, name))
+    return {
+        "bible": bible or text.strip(),
+        "words": list(words),
+        "chapters": [chapters[n] for n in sorted(chapters) if n <= count],
+        "parts": parts,
+    }
+
+def request_context_size(model_type):
+    """Tokens one request for model_type can use.
+
+    That is the smallest context reported by the role's backends, or the
+    local server's context_size divided between its slots (unless
+    kv_unified lets every slot use all of it).
+    """
+    pool = narraider._backend_pool()
+    served = pool.serves(model_type, wait=True)
+    sizes = [b.context_size for b in pool.backends if b.model == model_type and b.context_size]
+    if sizes:
+        return min(sizes)
+    context_size = narraider.CONFIG["context_size"]
+    parallel = narraider.CONFIG.get("parallel", 1)
+    if served or narraider.CONFIG.get("kv_unified", False) or parallel <= 1:
+        return context_size
+    return context_size // parallel
+
+def _write_atomic(path, text):
+    """Replace path with text so an interrupted write never leaves half a file."""
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+class Book:
+    """A book being written from a concept, checkpointed in its folder.
+
+    book.json holds the plan, each chapter's state (planned, drafted or
+    done) and the rolling summaries; every chapter is a file of its own.
+    """
+
+    def __init__(self, folder, state):
+        self.folder = Path(folder)
+        self.state = state
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, concept_path, folder=None, output_format=".md"):
+        """Open the book of a concept, planning it on the first run.
+
+        A chapter only counts as drafted if its file exists, so whatever
+        was in flight when a run stopped is written again.
+        """
+        concept_path = Path(concept_path)
+        text = concept_path.read_text(encoding='utf-8')
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        if folder is None:
+            name = re.sub(r"[^a-z0-9]+", "_", concept_path.stem.lower()).strip("_") or "book"
+            folder = Path(narraider.CONFIG["output_folder"]) / BOOKS_FOLDER / name
+        folder = Path(folder)
+
+        try:
+            with open(folder / STATE_FILE, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = None
+        if state is not None:
+            book = cls(folder, state)
+            if state["concept_hash"] != digest:
+                log(f"WARNING: {concept_path} changed since {folder} was planned; keeping the original plan "
+                    f"(delete the folder to start over)")
+            if state["format"] != output_format:
+                log(f"WARNING: {folder} is written as {state['format']}; ignoring {output_format}")
+            for chapter in state["chapters"]:
+                if chapter["status"] != "planned" and not book.chapter_path(chapter["number"]).exists():
+                    chapter.update(status="planned", summary="", words=0, heading="")
+            return book
+
+        plan = parse_concept(text)
+        if not plan["chapters"]:
+            return None
+        for chapter in plan["chapters"]:
+            chapter.update(status="planned", summary="", words=0, heading="")
+        folder.mkdir(parents=True, exist_ok=True)
+        book = cls(folder, {
+            "concept": str(concept_path),
+            "concept_hash": digest,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "format": output_format,
+            **plan
+        })
+        book.save()
+        log(f"Planned {len(plan['chapters'])} chapters in {len(plan['parts'])} parts "
+            f"({plan['words'][0]}-{plan['words'][1]} words each) in {folder}")
+        return book
+
+    @property
+    def chapters(self):
+        return self.state["chapters"]
+
+    @property
+    def parts(self):
+        return self.state["parts"]
+
+    def chapter(self, number):
+        return self.chapters[number - 1]
+
+    def chapter_path(self, number):
+        return self.folder / f"chapter_{number:02d}{self.state['format']}"
+
+    def save(self):
+        """Write book.json (call with the lock held once threads are running)."""
+        _write_atomic(self.folder / STATE_FILE, json.dumps(self.state, indent=2, ensure_ascii=False))
+
+    def update(self, entry, **fields):
+        """Change a chapter or part and checkpoint the state."""
+        with self.lock:
+            entry.update(fields)
+            self.save()
+
+    def manuscript_path(self):
+        return self.folder / f"{self.folder.name}{self.state['format']}"
+
+    def assemble(self):
+        """Join the chapters into one manuscript file; returns its path."""
+        text = "\n\n".join(self.chapter_path(c["number"]).read_text(encoding='utf-8').strip()
+                           for c in self.chapters)
+        path = self.manuscript_path()
+        _write_atomic(path, text + "\n")
+        return path
+
+def _generate(prompt, model_type, max_tokens, system_prompt="", stop_after_words=None, cancel_token=None):
+    """One request, surviving crashes like generate_content does.
+
+    A failed backend is swapped for another one and a crashed local
+    server is restarted. Returns the text, or None.
+    """
+    failed_backends = []
+    for _ in range(1 + narraider.CONFIG.get("backend_retries", 2)):
+        if not narraider.acquire_model(model_type, cancel_token, failed_backends):
+            return None
+        try:
+            return narraider.generate_completion(
+                prompt, max_tokens=max_tokens, system_prompt=system_prompt,
+                stop_after_words=stop_after_words, cancel_token=cancel_token
+            )
+        except narraider.ServerCrashed as e:
+            crash = e
+        finally:
+            narraider.release_model()
+
+        log(f"WARNING: Request interrupted ({crash}); running it again")
+        if getattr(crash, "backend", None):
+            failed_backends.append(crash.backend)
+        elif not narraider.recover_server(model_type, cancel_token):
+            return None
+    return None
+
+def _planned(chapter):
+    """A chapter's plan in one line."""
+    return _words(chapter["beat"] or chapter["purpose"] or "(no plan)", PLANNED_WORDS)
+
+def _part_label(part):
+    """A part's name with its chapter range."""
+    first, last = part["chapters"][0], part["chapters"][-1]
+    return part["name"] if part["name"].startswith("Chapters") else f"{part['name']} (Chapters {first}-{last})"
+
+def _story_so_far(book, number, budget, model_type):
+    """The rolling summary of the chapters before number, within budget tokens.
+
+    Finished parts are given as their recap, written chapters as their
+    summary and chapters not written yet (drafted in parallel) as their
+    plan. Over budget, the oldest summaries shrink to their plan first,
+    then the oldest entries are left out.
+    """
+    entries = []  # (full, short)
+    for part in book.parts:
+        earlier = [n for n in part["chapters"] if n < number]
+        if not earlier:
+            continue
+        if part["recap"] and len(earlier) == len(part["chapters"]):
+            recap = f"{_part_label(part)}: {part['recap']}"
+            entries.append((recap, _words(recap, PLANNED_WORDS * 2)))
+            continue
+        for n in earlier:
+            chapter = book.chapter(n)
+            title = chapter["heading"] or chapter["title"]
+            title = f" ({title})" if title else ""
+            if chapter["summary"]:
+                entries.append((f"Chapter {n}{title}: {chapter['summary']}", f"Chapter {n}{title}: {_planned(chapter)}"))
+            else:
+                planned = f"Chapter {n}{title} (not written yet, planned): {_planned(chapter)}"
+                entries.append((planned, planned))
+
+    if not entries:
+        return "(This is the beginning of the book.)"
+    texts = [full for full, _ in entries]
+    for i, (_, short) in enumerate(entries):
+        if _tokens("\n".join(texts), model_type) <= budget:
+            break
+        texts[i] = short
+    omitted = False
+    while texts and _tokens("\n".join(texts), model_type) > budget:
+        texts.pop(0)
+        omitted = True
+    return ("(Earlier chapters omitted.)\n" if omitted else "") + "\n".join(texts)
+
+def _chapter_plan(chapter):
+    """What the concept asks of a chapter."""
+    lines = []
+    if chapter["title"]:
+        lines.append(f"Title: {chapter['title']}")
+    if chapter["beat"]:
+        lines.append(f"Emotional beat: {chapter['beat']}")
+    if chapter["purpose"]:
+        lines.append(f"Purpose: {chapter['purpose']}")
+    lines += [f"Structural beat - {signpost}" for signpost in chapter["signposts"]]
+    return "\n".join(lines) or "Continue the story toward the next beat of the concept."
+
+def draft_chapter(book, number, bible, model_type, system_prompt="", cancel_token=None):
+    """Write one chapter and checkpoint it; returns its text, or None."""
+    chapter = book.chapter(number)
+    part = book.parts[chapter["part"] - 1]
+    min_words, max_words = book.state["words"]
+    context = request_context_size(model_type)
+    output_tokens = min(int(max_words * narraider.get_tokens_per_word(model_type)
+                            * narraider.LENGTH_TARGET_HEADROOM), context // 2)
+
+    heading = (f'Begin with the heading "# Chapter {number}: " and a chapter title.' if book.state["format"] == ".md"
+               else f'Begin with the line "Chapter {number}: " and a chapter title, then plain text without markdown.')
+    fields = {
+        "bible": bible, "number": number, "count": len(book.chapters),
+        "part": f" ({part['name']}{': ' + part['title'] if part['title'] else ''})",
+        "plan": _chapter_plan(chapter), "min_words": min_words, "max_words": max_words, "heading": heading
+    }
+    ending = ""
+    previous = book.chapter(number - 1) if number > 1 else None
+    if previous and previous["status"] != "planned":
+        tail = book.chapter_path(number - 1).read_text(encoding='utf-8').split()[-ENDING_WORDS:]
+        ending = f"\nCHAPTER {number - 1} ENDED WITH:\n... {' '.join(tail)}\n"
+
+    story_budget = (context - output_tokens - PROMPT_MARGIN
+                    - _tokens(CHAPTER_TEMPLATE.format(story="", ending="", **fields), model_type))
+    if _tokens(ending, model_type) > story_budget // 2:
+        ending = ""
+    story = _story_so_far(book, number, story_budget - _tokens(ending, model_type), model_type)
+    prompt = CHAPTER_TEMPLATE.format(story=story, ending=ending, **fields)
+
+    log(f"Drafting chapter {number} of {len(book.chapters)} (~{_tokens(prompt, model_type)} prompt tokens)...")
+    start_time = time.time()
+    # Not set when the generation fails or is salvaged; never take an earlier call's
+    narraider._LAST_COMPLETION.stats = None
+    text = _generate(prompt, model_type, output_tokens, system_prompt, max_words, cancel_token)
+    if not text:
+        return None
+    text = narraider.clean_output(text, book.state["format"]).strip()
+    title = _TITLE_RE.match(text.splitlines()[0]) if text else None
+
+    _write_atomic(book.chapter_path(number), text + "\n")
+    narraider.catalog_output(book.chapter_path(number), text + "\n", "chapter", {
+        "prompt": _chapter_plan(chapter), "model": model_type,
+        "timings": {"seconds": round(time.time() - start_time, 2), **(getattr(narraider._LAST_COMPLETION, "stats", None) or {})}
+    })
+    words = len(text.split())
+    book.update(chapter, status="drafted", words=words, heading=title.group(1) if title else "")
+    log(f"Chapter {number}: {words} words in {time.time() - start_time:.1f}s")
+    record_metric("chapter", model=model_type, number=number, words=words,
+                  seconds=round(time.time() - start_time, 2), prompt_tokens=_tokens(prompt, model_type),
+                  planned_before=sum(1 for c in book.chapters[:number - 1] if not c["summary"]))
+    return text
+
+def summarize_chapter(book, number, model_type, cancel_token=None):
+    """Write the rolling summary of a drafted chapter; returns it, or None."""
+    chapter = book.chapter(number)
+    summary_tokens = int(SUMMARY_WORDS * narraider.get_tokens_per_word(model_type) * 1.5)
+    room = (request_context_size(model_type) - summary_tokens - PROMPT_MARGIN
+            - _tokens(SUMMARY_TEMPLATE.format(number=number, text="", words=SUMMARY_WORDS), model_type))
+    text = _clip(book.chapter_path(number).read_text(encoding='utf-8'),
+                 int(room / narraider.get_tokens_per_word(model_type)))
+    summary = _generate(SUMMARY_TEMPLATE.format(number=number, text=text, words=SUMMARY_WORDS),
+                        model_type, summary_tokens, cancel_token=cancel_token)
+    if not summary:
+        return None
+    summary = _words(" ".join(summary.split()), SUMMARY_WORDS * 3 // 2)
+    book.update(chapter, status="done", summary=summary)
+    return summary
+
+def recap_part(book, part, model_type, cancel_token=None):
+    """Condense the summaries of a finished part into its recap; returns it, or None."""
+    summaries = "\n".join(f"Chapter {n}: {book.chapter(n)['summary']}" for n in part["chapters"])
+    name = _part_label(part)
+    recap_tokens = int(RECAP_WORDS * narraider.get_tokens_per_word(model_type) * 1.5)
+    recap = _generate(RECAP_TEMPLATE.format(part=name, summaries=summaries, words=RECAP_WORDS),
+                      model_type, recap_tokens, cancel_token=cancel_token)
+    if not recap:
+        return None
+    recap = _words(" ".join(recap.split()), RECAP_WORDS * 3 // 2)
+    book.update(part, recap=recap)
+    log(f"Recapped {name}")
+    return recap
+
+def write_book(concept_path, model_type=None, output_format=".md", system_prompt="Default", sequential=False, workers=None, folder=None, on_chapter=None, cancel_token=None):
+    """Write (or finish) the book of a concept document.
+
+    Chapters already done are skipped, so calling this again after an
+    interruption only redoes unfinished work. The parts (acts) are drafted
+    side by side on up to workers threads, by default as many as the role
+    has slots; sequential=True writes every chapter after the previous
+    one, each seeing the summaries of all earlier chapters.
+    on_chapter(number, path) is called for every new chapter. Returns the
+    path of the assembled manuscript once every chapter is done, or None.
+    """
+    book = Book.open(concept_path, folder, output_format)
+    if book is None:
+        log(f"ERROR: No chapter plan found in {concept_path} (expected a document from the 'concept' template)")
+        return None
+    if model_type is None:
+        model_type = narraider.route_model("chapter")
+        log(f"Routing chapters to the {model_type} model")
+
+    system_prompt_text = narraider.SYSTEM_PROMPTS.get(system_prompt, "")
+    context = request_context_size(model_type)
+    bible_words = int(context * BIBLE_SHARE / narraider.get_tokens_per_word(model_type))
+    bible = _words(book.state["bible"], bible_words)
+
+    units = [[c["number"] for c in book.chapters]] if sequential else [p["chapters"] for p in book.parts]
+    units = [numbers for numbers in units if any(book.chapter(n)["status"] != "done" for n in numbers)]
+    pending = sum(1 for c in book.chapters if c["status"] != "done")
+    if not workers:
+        workers = narraider._backend_pool().capacity(model_type) or narraider.CONFIG.get("parallel", 1)
+    if pending:
+        log(f"Writing {pending} of {len(book.chapters)} chapters ({len(units)} part(s) at a time, "
+            f"{min(workers, len(units))} in parallel, {context} tokens of context)")
+
+    recapping = set()  # Parts whose recap a thread is writing
+
+    def finish_parts():
+        for part in book.parts:
+            with book.lock:
+                ready = (part["number"] not in recapping and not part["recap"]
+                         and all(book.chapter(n)["status"] == "done" for n in part["chapters"]))
+                if ready:
+                    recapping.add(part["number"])
+            if ready:
+                try:
+                    recap_part(book, part, model_type, cancel_token)
+                finally:
+                    with book.lock:
+                        recapping.discard(part["number"])
+
+    def run(numbers):
+        # Later chapters of a unit build on the earlier ones; stop at the first failure
+        for number in numbers:
+            chapter = book.chapter(number)
+            if chapter["status"] == "planned":
+                if not draft_chapter(book, number, bible, model_type, system_prompt_text, cancel_token):
+                    log(f"ERROR: Chapter {number} failed; it is written again on the next run")
+                    return False
+                if on_chapter:
+                    on_chapter(number, book.chapter_path(number))
+            if chapter["status"] == "drafted" and not summarize_chapter(book, number, model_type, cancel_token):
+                log(f"ERROR: Could not summarize chapter {number}; it is summarized on the next run")
+                return False
+            finish_parts()
+        return True
+
+    start_time = time.time()
+    try:
+        if units:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(units)))) as executor:
+                futures = [executor.submit(run, numbers) for numbers in units]
+                for future in futures:
+                    future.result()
+        finish_parts()
+    finally:
+        if not narraider.CONFIG.get("keep_server_loaded", False) and not narraider.SERVER_LEASES \
+                and not narraider._backend_pool().serves(model_type):
+            narraider.kill_server()
+
+    done = sum(1 for c in book.chapters if c["status"] == "done")
+    record_metric("book", model=model_type, chapters=len(book.chapters), done=done,
+                  seconds=round(time.time() - start_time, 2))
+    if done < len(book.chapters):
+        log(f"{done} of {len(book.chapters)} chapters done; run again to continue")
+        return None
+    path = book.assemble()
+    log(f"Book complete: {sum(c['words'] for c in book.chapters)} words in {path}")
+    return path
+
+def format_status(book):
+    """One line per chapter: state, words and title or plan."""
+    lines = []
+    for part in book.parts:
+        lines.append(f"{part['name']}{': ' + part['title'] if part['title'] else ''}"
+                     f"{' (recapped)' if part['recap'] else ''}")
+        for n in part["chapters"]:
+            chapter = book.chapter(n)
+            words = f"{chapter['words']:>6} words" if chapter["words"] else " " * 12
+            lines.append(f"  {n:>3}. {chapter['status']:<8} {words}  {chapter['heading'] or chapter['title'] or _planned(chapter)}")
+    return "\n".join(lines)
+
+def main():
+    """Write the book of a concept document, or show how far it is."""
+    parser = argparse.ArgumentParser(
+        description="Write a book chapter by chapter from a NarrAider concept document",
+        epilog="Run the same command again to continue an interrupted book."
+    )
+    parser.add_argument("concept", help="Concept document made with --type concept")
+    parser.add_argument("--model", help="Model role (default: routing for 'chapter')")
+    parser.add_argument("--format", default=".md", choices=[".md", ".txt"], help="Chapter format (default: .md)")
+    parser.add_argument("--system", default="Default", help="System prompt name (default: Default)")
+    parser.add_argument("--book", help=f"Book folder (default: <output_folder>/{BOOKS_FOLDER}/<concept name>)")
+    parser.add_argument("--sequential", action="store_true",
+                        help="Write every chapter after the previous one instead of drafting the acts in parallel")
+    parser.add_argument("--workers", type=int, help="Parts drafted at once (default: the model's slots)")
+    parser.add_argument("--status", action="store_true", help="Show the chapters and their state, then exit")
+    args = parser.parse_args()
+
+    narraider.load_config()
+    if args.model and args.model not in narraider.model_roles():
+        print(f"ERROR: Unknown model role '{args.model}' (available: {', '.join(narraider.model_roles())})")
+        return 1
+    if args.status:
+        book = Book.open(args.concept, args.book, args.format)
+        if book is None:
+            print(f"ERROR: No chapter plan found in {args.concept}")
+            return 1
+        print(format_status(book))
+        return 0
+
+    try:
+        path = write_book(
+            args.concept, args.model, args.format, args.system, args.sequential, args.workers, args.book,
+            on_chapter=lambda number, path: print(f"  Chapter {number} saved to {path}")
+        )
+    finally:
+        narraider.kill_server()
+    return 0 if path else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
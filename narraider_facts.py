@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+NarrAider facts - Compact fact sheets of generated profiles
+Created by Andreas "Uriel1339" Lopez
+
+A character profile runs to well over a thousand words, but a later scene
+only needs the name, a few traits, what the character wants and fears and
+how they talk. This module reads outputs of the character, magic, culture
+and artifact templates into small structured fact sheets using the
+templates' own labels ("Full Name:", "Physical/mental costs of use:", ...),
+stores each sheet next to its output as <name>.facts.json, and renders a
+sheet as a card of about 100 tokens to put in a prompt instead of the
+whole document. Outputs that do not follow the template can be handed to
+the model for one short extraction call (see narraider.fact_sheet).
+MIT License - Free to use, modify, and distribute.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+from narraider_lore import document_text
+
+SHEET_SUFFIX = ".facts.json"
+
+# Fields of each content type's sheet, in card order: field -> (card label,
+# labels of the template that hold it). A label matches when it starts with
+# one of these after lowercasing; earlier entries win. A card label of None
+# puts the value right after the name.
+FACT_FIELDS = {
+    "character": {
+        "name": (None, ["full name", "name"]),
+        "identity": (None, ["age & species", "species", "race", "age"]),
+        "role": (None, ["occupation/role", "occupation", "role"]),
+        "appearance": ("Looks", ["physical appearance", "appearance"]),
+        "traits": ("Traits", ["core personality traits", "personality traits", "personality", "traits"]),
+        "wants": ("Wants", ["motivations & goals", "motivations", "goals", "hook"]),
+        "fears": ("Fears", ["fears & vulnerabilities", "fears"]),
+        "skills": ("Skills", ["special skills/talents", "special skills", "skills"]),
+        "voice": ("Voice", ["speech patterns", "speech", "voice"]),
+    },
+    "magic": {
+        "name": (None, ["name of the system", "system name", "name"]),
+        "source": ("Source", ["source of power", "source"]),
+        "access": ("Access", ["how magic is accessed", "access"]),
+        "costs": ("Costs", ["physical/mental costs of use", "costs", "cost"]),
+        "limits": ("Limits", ["what prevents unlimited power", "limitations"]),
+        "forbidden": ("Forbidden", ["forbidden or dangerous techniques", "forbidden"]),
+        "looks": ("Looks", ["what does magic look like", "visual"]),
+    },
+    "culture": {
+        "name": (None, ["name of culture/species/faction", "name"]),
+        "traits": ("Traits", ["key characteristics that define them", "key characteristics", "characteristics"]),
+        "government": ("Rule", ["government/leadership model", "government", "leadership"]),
+        "values": ("Values", ["core values and philosophy", "core values", "values"]),
+        "beliefs": ("Beliefs", ["religious or spiritual beliefs", "religion", "beliefs"]),
+        "allies": ("Allies", ["allies and trading partners", "allies"]),
+        "enemies": ("Enemies", ["rivals and enemies", "current threats or enemies", "enemies"]),
+    },
+    "artifact": {
+        "name": (None, ["name of the artifact", "name"]),
+        "appearance": ("Looks", ["physical appearance", "appearance"]),
+        "power": ("Power", ["primary power/function", "primary power", "power"]),
+        "abilities": ("Also", ["secondary abilities"]),
+        "costs": ("Costs", ["usage costs or requirements", "usage costs", "costs", "cost"]),
+        "dangers": ("Dangers", ["dangers to the wielder", "dangers"]),
+        "whereabouts": ("Now", ["where is it now", "current location", "location"]),
+    },
+}
+
+# Output subfolders of the types above, for files given without a type
+FOLDER_TYPES = {"characters": "character", "magic_systems": "magic", "cultures": "culture", "artifacts": "artifact"}
+
+# A sheet needs a name and this many other fields; anything less is
+# treated as an output that does not follow its template
+MIN_FIELDS = 3
+
+# Words kept of each field, and of a card as a whole
+FIELD_WORDS = 14
+CARD_TOKENS = 100
+
+EXTRACTION_TEMPLATE = """Extract a fact sheet from this {content_type} description.
+
+{text}
+
+Fill in each field with the facts the description gives, in at most {words} words each, or "" if it says nothing about it:
+{fields}
+
+Output ONLY a JSON object with these fields."""
+
+_LINE_LABEL_RE = re.compile(r"^(?:\*\*|__)?([^:*_\n]{1,60}?)\s*(?:\*\*|__)?\s*:\s*(?:\*\*|__)?\s*(.*)$")
+_BOLD_LABEL_RE = re.compile(r"^(?:\*\*|__)([^*_\n]{1,60}?)(?:\*\*|__)\s*[:\-–—]?\s*(.+)$")
+_BULLET_RE = re.compile(r"^(?:[-*•+]\s+|\d+[.)]\s+)")
+_MARKUP_RE = re.compile(r"\*\*|__|`")
+
+def content_type_of(path):
+    """The content type of an output file from its folder, or None."""
+    return FOLDER_TYPES.get(Path(path).parent.name)
+
+def sheet_path(path):
+    """Where the fact sheet of an output file is kept."""
+    path = Path(path)
+    return path.with_name(path.stem + SHEET_SUFFIX)
+
+def _normalize(label):
+    label = _MARKUP_RE.sub("", label).strip().lower().replace(" and ", " & ")
+    return " ".join(label.rstrip("?.: ").split())
+
+def _clip(text, words):
+    text = _MARKUP_RE.sub("", " ".join(text.split())).strip(" -")
+    parts = text.split()
+    return " ".join(parts[:words]) + ("..." if len(parts) > words else "")
+
+def labelled_values(text, suffix=".md"):
+    """The document's (label, value) pairs and its title, in order.
+
+    A label is a line like "Full Name: Borghild" or "**Full Name** Borghild"
+    (bullets and headings allowed); a label line without a value, or a
+    heading, takes the lines that follow it up to the next label or heading.
+    """
+    pairs = []
+    title = ""
+    label = None
+    value = []
+
+    def flush():
+        if label is not None and value:
+            pairs.append((label, " ".join(value)))
+
+    for raw in document_text(text, suffix).splitlines():
+        line = _BULLET_RE.sub("", raw.strip())
+        if not line:
+            continue
+        heading = (line.startswith("#") or (line.isupper() and len(line.split()) <= 6)
+                   or (line.startswith(("**", "__")) and line.endswith(("**", "__", "**:", "__:"))))
+        line = line.lstrip("#").strip()
+        match = _LINE_LABEL_RE.match(line) or _BOLD_LABEL_RE.match(line)
+        if heading:
+            title = title or _MARKUP_RE.sub("", line).strip()
+        if heading and not (match and match.group(2)):
+            flush()
+            label, value = _normalize(line.rstrip(":")), []
+        elif match:
+            flush()
+            label, value = _normalize(match.group(1)), [match.group(2)] if match.group(2) else []
+        elif label is not None:
+            value.append(line)
+        else:
+            title = title or _MARKUP_RE.sub("", line).strip()
+    flush()
+    return pairs, title
+
+def parse_facts(text, content_type, suffix=".md"):
+    """The facts the template labels of content_type give, as {field: value}."""
+    pairs, title = labelled_values(text, suffix)
+    facts = {}
+    for field, (_, candidates) in FACT_FIELDS[content_type].items():
+        for candidate in candidates:
+            value = next((v for label, v in pairs if label == candidate or label.startswith(candidate + " ")
+                          or label.startswith(candidate + "/")), None)
+            if value:
+                facts[field] = _clip(value, FIELD_WORDS)
+                break
+    if "name" not in facts and title and len(title.split()) <= 10:
+        # "Character Profile: Borghild Stonehand", "The Ashbound Covenant"
+        facts["name"] = _clip(title.split(":")[-1], FIELD_WORDS)
+    return facts
+
+def is_complete(facts):
+    """Whether parsed facts make a useful sheet (see MIN_FIELDS)."""
+    return bool(facts.get("name")) and len(facts) - 1 >= MIN_FIELDS
+
+def extraction_request(text, content_type):
+    """Prompt and JSON schema of the extraction call for an output that parse_facts cannot read."""
+    fields = FACT_FIELDS[content_type]
+    prompt = EXTRACTION_TEMPLATE.format(
+        content_type=content_type, text=text, words=FIELD_WORDS,
+        fields="\n".join(f'- "{field}": {labels[0]}' for field, (_, labels) in fields.items())
+    )
+    schema = {
+        "type": "object",
+        "properties": {field: {"type": "string"} for field in fields},
+        "required": list(fields)
+    }
+    return prompt, schema
+
+def parse_extraction(reply, content_type):
+    """Facts from the model's reply to extraction_request, or {}."""
+    match = re.search(r"\{.*\}", reply or "", re.DOTALL)
+    try:
+        data = json.loads(match.group(0)) if match else {}
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {field: _clip(str(data[field]), FIELD_WORDS) for field in FACT_FIELDS[content_type]
+            if isinstance(data.get(field), (str, int, float)) and str(data[field]).strip()}
+
+def _digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def make_sheet(text, content_type, facts, method):
+    """A fact sheet of text; method says how the facts were found ("labels" or "model")."""
+    return {"content_type": content_type, "method": method, "source_sha1": _digest(text), "facts": facts}
+
+def load_sheet(path, text=None):
+    """The cached sheet of an output file, or None if there is none or the file changed since."""
+    try:
+        with open(sheet_path(path), 'r', encoding='utf-8') as f:
+            sheet = json.load(f)
+        if text is None:
+            text = Path(path).read_text(encoding='utf-8')
+    except (OSError, ValueError):
+        return None
+    if not isinstance(sheet, dict) or sheet.get("source_sha1") != _digest(text):
+        return None
+    return sheet
+
+def save_sheet(path, sheet):
+    """Write a sheet next to its output file; returns the sheet's path."""
+    target = sheet_path(path)
+    temp = target.with_name(target.name + ".tmp")
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(sheet, f, indent=2, ensure_ascii=False)
+    os.replace(temp, target)
+    return target
+
+def format_card(sheet, max_tokens=CARD_TOKENS, tokens_per_word=1.4):
+    """A sheet as one compact line for a prompt, within max_tokens.
+
+    The name and the unlabelled fields come first; labelled fields are
+    added in FACT_FIELDS order while they fit.
+    """
+    facts = sheet["facts"]
+    fields = FACT_FIELDS[sheet["content_type"]]
+    budget = int(max_tokens / tokens_per_word)
+    head = ", ".join(facts[field] for field, (label, _) in fields.items()
+                     if label is None and field != "name" and facts.get(field))
+    card = f"{facts.get('name') or 'Unnamed'} ({sheet['content_type']}{': ' + head if head else ''})"
+    card = _clip(card, budget)
+    for field, (label, _) in fields.items():
+        if label is None or not facts.get(field):
+            continue
+        part = f"{label}: {facts[field]}"
+        if len(card.split()) + len(part.split()) > budget:
+            break
+        card += f". {part}" if not card.endswith(".") else f" {part}"
+    return card
+
+def main():
+    """Print the fact cards of output files, writing their sheets."""
+    parser = argparse.ArgumentParser(description="Turn NarrAider profiles into compact fact sheets")
+    parser.add_argument("files", nargs="+", help="Output files (character, magic, culture or artifact)")
+    parser.add_argument("--type", choices=sorted(FACT_FIELDS), help="Content type (default: from the file's folder)")
+    parser.add_argument("--extract", action="store_true", help="Ask the model when a file does not follow its template")
+    parser.add_argument("--sheet", action="store_true", help="Print the whole sheet as JSON instead of the card")
+    args = parser.parse_args()
+
+    narraider = None
+    if args.extract:
+        import narraider
+        narraider.load_config()
+    failed = 0
+    try:
+        for name in args.files:
+            content_type = args.type or content_type_of(name)
+            if content_type not in FACT_FIELDS:
+                print(f"{name}: unknown content type (use --type)", file=sys.stderr)
+                failed += 1
+                continue
+            if narraider:
+                sheet = narraider.fact_sheet(name, content_type)
+            else:
+                try:
+                    text = Path(name).read_text(encoding='utf-8')
+                except OSError as e:
+                    print(f"{name}: {e}", file=sys.stderr)
+                    failed += 1
+                    continue
+                sheet = load_sheet(name, text)
+                if sheet is None:
+                    facts = parse_facts(text, content_type, Path(name).suffix.lower())
+                    if is_complete(facts):
+                        sheet = make_sheet(text, content_type, facts, "labels")
+                        save_sheet(name, sheet)
+            if not sheet or not sheet["facts"].get("name"):
+                print(f"{name}: no facts found for a {content_type} (try --extract)", file=sys.stderr)
+                failed += 1
+                continue
+            print(json.dumps(sheet, indent=2, ensure_ascii=False) if args.sheet else format_card(sheet))
+    finally:
+        if narraider:
+            narraider.kill_server()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
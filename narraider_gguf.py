@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+NarrAider GGUF reader - Model metadata without loading the weights
+Created by Andreas "Uriel1339" Lopez
+
+Parses the header of .gguf model files (metadata and tensor table) through a
+memory map, so only the first few megabytes of a multi-GB file are read.
+Results are cached in model_index.json, keyed by path, size and mtime.
+MIT License - Free to use, modify, and distribute.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from pathlib import Path
+
+GGUF_MAGIC = b"GGUF"
+
+# GGUF metadata value types
+_UINT8, _INT8, _UINT16, _INT16, _UINT32, _INT32, _FLOAT32, _BOOL, _STRING, _ARRAY, _UINT64, _INT64, _FLOAT64 = range(13)
+
+_SCALAR_FORMATS = {
+    _UINT8: "<B", _INT8: "<b", _UINT16: "<H", _INT16: "<h",
+    _UINT32: "<I", _INT32: "<i", _FLOAT32: "<f", _BOOL: "<?",
+    _UINT64: "<Q", _INT64: "<q", _FLOAT64: "<d",
+}
+
+# llama.cpp's general.file_type values (LLAMA_FTYPE_MOSTLY_*)
+FILE_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 7: "Q8_0", 8: "Q5_0", 9: "Q5_1",
+    10: "Q2_K", 11: "Q3_K_S", 12: "Q3_K_M", 13: "Q3_K_L", 14: "Q4_K_S", 15: "Q4_K_M",
+    16: "Q5_K_S", 17: "Q5_K_M", 18: "Q6_K", 19: "IQ2_XXS", 20: "IQ2_XS", 21: "Q2_K_S",
+    22: "IQ3_XS", 23: "IQ3_XXS", 24: "IQ1_S", 25: "IQ4_NL", 26: "IQ3_S", 27: "IQ3_M",
+    28: "IQ2_S", 29: "IQ2_M", 30: "IQ4_XS", 31: "IQ1_M", 32: "BF16", 36: "TQ1_0", 37: "TQ2_0",
+}
+
+# Arrays longer than this (token lists, merges) are skipped rather than decoded
+_MAX_DECODED_ARRAY = 64
+
+# llama.cpp rejects draft models whose vocabulary size differs by more than this
+SPEC_VOCAB_MAX_SIZE_DIFFERENCE = 128
+
+# Bump when the extracted fields change so stale index entries are re-read
+INDEX_VERSION = 3
+
+class GGUFError(Exception):
+    """Raised when a file is not a readable GGUF model."""
+
+class _Reader:
+    """Sequential little-endian reader over a memory-mapped file."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.pos = 0
+
+    def scalar(self, value_type):
+        fmt = _SCALAR_FORMATS.get(value_type)
+        if fmt is None:
+            raise GGUFError(f"Unknown GGUF value type {value_type}")
+        value = struct.unpack_from(fmt, self.buffer, self.pos)[0]
+        self.pos += struct.calcsize(fmt)
+        return value
+
+    def uint32(self):
+        return self.scalar(_UINT32)
+
+    def uint64(self):
+        return self.scalar(_UINT64)
+
+    def string(self):
+        length = self.uint64()
+        start = self.pos
+        self.pos += length
+        if self.pos > len(self.buffer):
+            raise GGUFError("Truncated string in GGUF header")
+        return self.buffer[start:self.pos].decode("utf-8", errors="replace")
+
+    def skip_string(self):
+        length = self.uint64()
+        self.pos += length
+
+    def value(self, value_type):
+        """Read a metadata value; long arrays are skipped and summarized."""
+        if value_type == _STRING:
+            return self.string()
+        if value_type != _ARRAY:
+            return self.scalar(value_type)
+
+        item_type = self.uint32()
+        count = self.uint64()
+        start = self.pos
+        if count <= _MAX_DECODED_ARRAY:
+            return [self.value(item_type) for _ in range(count)]
+
+        if item_type == _STRING:
+            for _ in range(count):
+                self.skip_string()
+        elif item_type in _SCALAR_FORMATS:
+            self.pos += count * struct.calcsize(_SCALAR_FORMATS[item_type])
+        else:
+            for _ in range(count):
+                self.value(item_type)
+        # Hash the raw bytes so large arrays (e.g. vocabularies) can be compared
+        digest = hashlib.sha1(self.buffer[start:self.pos]).hexdigest()
+        return {"count": count, "sha1": digest}
+
+def read_gguf_metadata(path):
+    """Read the raw metadata key/values and tensor table of a GGUF file.
+
+    Returns (metadata, tensors) where tensors maps names to
+    {"shape": [...], "bytes": n}. Tensor sizes are derived from the data
+    offsets, so no table of quantization block sizes is needed.
+    """
+    with open(path, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise GGUFError("File is empty")
+
+    try:
+        reader = _Reader(buffer)
+        if buffer[:4] != GGUF_MAGIC:
+            raise GGUFError("Not a GGUF file (bad magic)")
+        reader.pos = 4
+        version = reader.uint32()
+        if version < 2:
+            raise GGUFError(f"Unsupported GGUF version {version}")
+
+        tensor_count = reader.uint64()
+        kv_count = reader.uint64()
+
+        metadata = {"GGUF.version": version}
+        for _ in range(kv_count):
+            key = reader.string()
+            metadata[key] = reader.value(reader.uint32())
+
+        tensors = {}
+        for _ in range(tensor_count):
+            name = reader.string()
+            n_dims = reader.uint32()
+            shape = [reader.uint64() for _ in range(n_dims)]
+            reader.uint32()  # ggml tensor type
+            tensors[name] = {"shape": shape, "offset": reader.uint64()}
+
+        # Tensor data starts at the next aligned offset after the header
+        alignment = metadata.get("general.alignment", 32)
+        if not isinstance(alignment, int) or alignment <= 0:
+            raise GGUFError(f"Invalid GGUF alignment {alignment}")
+        data_start = (reader.pos + alignment - 1) // alignment * alignment
+        end = len(buffer) - data_start
+        for tensor in sorted(tensors.values(), key=lambda t: t["offset"], reverse=True):
+            tensor["bytes"] = max(0, end - tensor["offset"])
+            end = tensor["offset"]
+            del tensor["offset"]
+        return metadata, tensors
+    except struct.error:
+        raise GGUFError("Truncated GGUF header")
+    finally:
+        buffer.close()
+
+def parse_gguf(path):
+    """Extract the model facts NarrAider needs from a GGUF file header."""
+    path = Path(path)
+    metadata, tensors = read_gguf_metadata(path)
+
+    arch = metadata.get("general.architecture", "unknown")
+
+    def arch_value(key, default=None):
+        return metadata.get(f"{arch}.{key}", default)
+
+    parameters = 0
+    layer_bytes = 0
+    output_bytes = 0
+    for name, tensor in tensors.items():
+        count = 1
+        for dim in tensor["shape"]:
+            count *= dim
+        parameters += count
+        if name.startswith("blk."):
+            layer_bytes += tensor["bytes"]
+        elif name != "token_embd.weight" or "output.weight" not in tensors:
+            # Token embeddings stay in system RAM unless they double as the output layer
+            output_bytes += tensor["bytes"]
+
+    head_count = arch_value("attention.head_count")
+    head_count_kv = arch_value("attention.head_count_kv", head_count)
+    # Per-layer head counts are stored as arrays by some architectures
+    if isinstance(head_count, list):
+        head_count = max(head_count)
+    if isinstance(head_count_kv, list):
+        head_count_kv = max(head_count_kv)
+
+    embedding = arch_value("embedding_length")
+    head_dim = arch_value("attention.key_length")
+    if head_dim is None and embedding and head_count:
+        head_dim = embedding // head_count
+
+    tokens = metadata.get("tokenizer.ggml.tokens")
+    file_type = metadata.get("general.file_type")
+    size = path.stat().st_size
+
+    return {
+        "name": metadata.get("general.name", path.stem),
+        "type": metadata.get("general.type", "model"),  # "adapter" for LoRA files
+        "architecture": arch,
+        "parameters": parameters,
+        "layers": arch_value("block_count"),
+        "embedding_length": embedding,
+        "context_length": arch_value("context_length"),
+        "head_count": head_count,
+        "head_count_kv": head_count_kv,
+        "key_length": head_dim,
+        "value_length": arch_value("attention.value_length", head_dim),
+        "sliding_window": arch_value("attention.sliding_window"),
+        "quantization": FILE_TYPES.get(file_type, f"type {file_type}" if file_type is not None else "unknown"),
+        "bits_per_weight": round(size * 8 / parameters, 2) if parameters else None,
+        "file_size": size,
+        "layer_bytes": layer_bytes,  # All repeating blk.* tensors
+        "output_bytes": output_bytes,  # Non-repeating tensors offloaded with the last layer
+        "chat_template": metadata.get("tokenizer.chat_template"),
+        "tokenizer_model": metadata.get("tokenizer.ggml.model"),
+        "vocab_size": tokens["count"] if isinstance(tokens, dict) else len(tokens or []),
+        "vocab_hash": tokens["sha1"] if isinstance(tokens, dict) else None,
+        "bos_token_id": metadata.get("tokenizer.ggml.bos_token_id"),
+        "eos_token_id": metadata.get("tokenizer.ggml.eos_token_id"),
+    }
+
+def draft_incompatibility(target, draft):
+    """Why draft cannot be used for speculative decoding with target, or None.
+
+    Both arguments are parse_gguf() results. Mirrors llama.cpp's own check:
+    the draft must use the same tokenizer with the same special tokens, and
+    its vocabulary may only differ in size by a few added tokens.
+    """
+    if draft["type"] == "adapter":
+        return "the draft is a LoRA adapter, not a model"
+    if draft["tokenizer_model"] != target["tokenizer_model"]:
+        return f"tokenizer {draft['tokenizer_model']} does not match {target['tokenizer_model']}"
+    difference = abs(draft["vocab_size"] - target["vocab_size"])
+    if difference > SPEC_VOCAB_MAX_SIZE_DIFFERENCE:
+        return f"vocabulary sizes differ by {difference} tokens ({draft['vocab_size']} vs {target['vocab_size']})"
+    if not difference and draft["vocab_hash"] != target["vocab_hash"]:
+        return "vocabularies have the same size but different tokens"
+    for key in ("bos_token_id", "eos_token_id"):
+        if draft[key] != target[key]:
+            return f"{key} {draft[key]} does not match {target[key]}"
+    return None
+
+def format_model_summary(info):
+    """One-line human-readable summary of parse_gguf() output."""
+    parts = [info["architecture"]]
+    parameters = info.get("parameters")
+    if parameters:
+        parts.append(f"{parameters / 1e9:.1f}B" if parameters >= 1e9 else f"{parameters / 1e6:.0f}M")
+    parts.append(info["quantization"])
+    if info.get("layers"):
+        parts.append(f"{info['layers']} layers")
+    if info.get("context_length"):
+        parts.append(f"{info['context_length'] // 1024}K ctx")
+    if info.get("chat_template"):
+        parts.append("chat template")
+    return " | ".join(parts)
+
+# ============================================================================
+# MODEL INDEX
+# ============================================================================
+
+INDEX_PATH = Path(__file__).parent / "model_index.json"
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+def _load_index():
+    global _INDEX
+    if _INDEX is None:
+        try:
+            with open(INDEX_PATH, 'r', encoding='utf-8') as f:
+                _INDEX = json.load(f)
+        except (OSError, ValueError):
+            _INDEX = {}
+    return _INDEX
+
+def _save_index():
+    tmp_path = INDEX_PATH.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_INDEX, f)
+    os.replace(tmp_path, INDEX_PATH)
+
+def _lookup(path, stat):
+    """Return cached info for path if the file is unchanged, else parse it."""
+    key = str(Path(path).resolve())
+    entry = _load_index().get(key)
+    if (entry and entry.get("version") == INDEX_VERSION
+            and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns):
+        return entry["info"], False
+
+    info = parse_gguf(path)
+    _INDEX[key] = {"version": INDEX_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "info": info}
+    return info, True
+
+def get_model_info(path):
+    """Return metadata for one model, using the index when it is current."""
+    with _INDEX_LOCK:
+        info, changed = _lookup(path, os.stat(path))
+        if changed:
+            _save_index()
+        return info
+
+def scan_models(folder):
+    """Return {path: info} for every .gguf file in folder.
+
+    Unchanged files are served from the index, so rescanning a folder only
+    costs a stat() per file. Files that fail to parse map to {"error": ...}.
+    """
+    results = {}
+    changed = False
+    with _INDEX_LOCK:
+        for entry in sorted(os.scandir(folder), key=lambda e: e.name.lower()):
+            if not entry.name.lower().endswith(".gguf") or not entry.is_file():
+                continue
+            try:
+                info, updated = _lookup(entry.path, entry.stat())
+                changed = changed or updated
+            except (OSError, GGUFError) as e:
+                info = {"error": str(e)}
+            results[entry.path] = info
+        if changed:
+            _save_index()
+    return results
+
+def main():
+    """Print the metadata of the given GGUF files."""
+    if len(sys.argv) < 2:
+        print("Usage: python narraider_gguf.py MODEL.gguf [MODEL.gguf ...]")
+        return 1
+
+    for path in sys.argv[1:]:
+        try:
+            info = get_model_info(path)
+        except (OSError, GGUFError) as e:
+            print(f"{path}: ERROR: {e}")
+            continue
+        print(f"{Path(path).name}: {format_model_summary(info)}")
+        for key, value in info.items():
+            if key == "chat_template" and value:
+                value = f"{len(value)} characters"
+            print(f"  {key}: {value}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,7 +21,7 @@ except ImportError:
 # Import core functionality
 from narraider import (
     load_config, ensure_model_loaded, generate_content,
-    save_output, kill_server,
+    save_output, flush_outputs, kill_server,
     TEMPLATES, VERSION
 )
 
@@ -247,18 +247,30 @@ class NarrAiderGUI:
             while True:
                 status, result, content_type = self.gen_queue.get_nowait()
 
+                if status == "saved":
+                    # The output writer finished a save; content_type holds the error if it failed
+                    if result:
+                        self.status_label.config(text=f"Saved to {result}", foreground="green")
+                    else:
+                        self.status_label.config(text="Saving failed", foreground="red")
+                        messagebox.showerror("Error", f"Could not save the output:\n{content_type}")
+                    continue
+
                 if status == "success":
                     # Update output
                     self.output_text.config(state=tk.NORMAL)
                     self.output_text.delete("1.0", tk.END)
-                    self.output_text.insert("1.0", result)
+                    self.output_text.insert("1.0", result or "ERROR: No output generated")
                     self.output_text.config(state=tk.DISABLED)
 
-                    self.status_label.config(text="Generation complete!", foreground="green")
-
-                    # Auto-save
-                    saved_path = save_output(result, content_type)
-                    messagebox.showinfo("Success", f"Generated and saved to:\n{saved_path}")
+                    if result:
+                        self.status_label.config(text="Generation complete - saving...", foreground="green")
+                        # Auto-save on the writer thread; it reports back as "saved"
+                        save_output(result, content_type, wait=False, on_saved=lambda path, error: self.gen_queue.put(
+                            ("saved", path, str(error) if error else None)))
+                    else:
+                        self.status_label.config(text="Generation failed", foreground="red")
+                        messagebox.showerror("Error", "Generation produced no output - see console for details")
 
                 elif status == "error":
                     self.output_text.config(state=tk.NORMAL)
@@ -333,6 +345,7 @@ def main():
     # Handle cleanup on close
     def on_closing():
         if messagebox.askokcancel("Quit", "Quit NarrAider? This will stop any running generation."):
+            flush_outputs()  # Outputs still being written
             kill_server()
             root.destroy()
 
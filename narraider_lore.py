@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+NarrAider lore - Find what earlier outputs established for a new request
+Created by Andreas "Uriel1339" Lopez
+
+Keeps a local full-text index of every file under the output folder, split
+into passages of about a paragraph, so a scene can be told about the
+characters, magic systems and cultures generated before it without pasting
+whole documents into the prompt. The index is an SQLite FTS5 table (an
+inverted index ranked with BM25) stored in the output folder; save_output
+adds each new file as it is written, and files changed or deleted by hand
+are picked up by update(). Nothing leaves the machine.
+MIT License - Free to use, modify, and distribute.
+"""
+
+import argparse
+import html
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+INDEX_NAME = ".lore_index.sqlite"
+SCHEMA_VERSION = 1
+
+# Files that are indexed; hidden files, book state and fact sheets
+# (narraider_facts, which repeat their output file) are not lore
+TEXT_SUFFIXES = {".md", ".txt", ".html", ".json", ".xml"}
+SKIP_NAMES = {"book.json"}
+SKIP_SUFFIXES = (".facts.json",)
+
+# Passages are about this long; headings start a new one
+PASSAGE_WORDS = 120
+
+# BM25 weights of the title (the document's first line) and the passage text
+TITLE_WEIGHT = 3.0
+TEXT_WEIGHT = 1.0
+
+# Passages scoring below this share of the best match are left out
+MIN_RELATIVE_SCORE = 0.25
+
+# At most this many passages of one file, so one long document cannot crowd out the rest
+MAX_PASSAGES_PER_FILE = 2
+
+# Query words that match nearly every passage
+STOPWORDS = set("""
+a about after all also an and any are as at be because been but by can could did do does for from had has
+have her him his how i if in into is it its just more most my no not of on one or our out over she so some
+than that the their them then there these they this those through to too under up very was we were what
+when where which while who why will with would you your
+""".split())
+MAX_QUERY_TERMS = 32
+
+# Query words found in more than this share of all passages are dropped: they
+# barely change the ranking but every passage they match has to be scored
+MAX_TERM_SHARE = 0.02
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_TAG_RE = re.compile(r"<[^>]+>")
+_HEADING_RE = re.compile(r"^\s*(#{1,6}\s|\*\*[^*]+\*\*\s*$|[A-Z][A-Z0-9 ,'&\-]{3,}:?\s*$)")
+
+def document_text(text, suffix):
+    """Plain text of an output file for indexing."""
+    if suffix == ".json":
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return text
+        lines = []
+
+        def walk(value, key=""):
+            if isinstance(value, dict):
+                for k, v in value.items():
+                    walk(v, k)
+            elif isinstance(value, list):
+                for v in value:
+                    walk(v, key)
+                lines.append("")  # Items of a list are separate passages
+            elif value is not None:
+                lines.append(f"{key.replace('_', ' ').title()}: {value}" if key else str(value))
+
+        walk(data)
+        return "\n".join(lines)
+    if suffix in (".html", ".xml"):
+        text = re.sub(r"</(p|h\d|li|tr|div|section|[a-z_]+)>", "\n\n", text, flags=re.IGNORECASE)
+        return html.unescape(_TAG_RE.sub("", text))
+    return text
+
+def split_passages(text, words=PASSAGE_WORDS):
+    """Split plain text into passages of about words words.
+
+    Paragraphs are joined up to the limit and longer ones are cut;
+    a heading always starts a new passage and stays with its text.
+    """
+    passages = []
+    current = []
+    headings = []  # Leading lines of current that are headings
+
+    def flush():
+        if current:
+            passages.append(" ".join(current))
+            current.clear()
+        headings.clear()
+
+    for paragraph in re.split(r"\n\s*\n", text):
+        lines = [line.strip() for line in paragraph.splitlines() if line.strip()]
+        if not lines:
+            continue
+        heading = _HEADING_RE.match(lines[0])
+        if heading and len(current) > len(headings):
+            flush()
+        if heading and len(lines) == 1 and len(current) == len(headings):
+            headings.append(lines[0])
+            current.append(lines[0])
+            continue
+        for line in lines:
+            tokens = line.split()
+            while tokens:
+                room = words - sum(len(p.split()) for p in current)
+                if room <= 0:
+                    flush()
+                    room = words
+                current.append(" ".join(tokens[:room]))
+                tokens = tokens[room:]
+        if sum(len(p.split()) for p in current) >= words // 2:
+            flush()
+    flush()
+    return passages
+
+def _title(text):
+    """A document's first non-empty line, without markup."""
+    for line in text.splitlines():
+        line = line.strip().strip("#*").strip()
+        if line:
+            return line[:100]
+    return ""
+
+def query_terms(text):
+    """The meaningful words of text, in order, without repeats."""
+    terms = []
+    for word in _WORD_RE.findall(text.lower()):
+        if len(word) > 2 and word not in STOPWORDS and word not in terms:
+            terms.append(word)
+    return terms[:MAX_QUERY_TERMS]
+
+class LoreIndex:
+    """Passage index of one output folder."""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.path = self.folder / INDEX_NAME
+        self.lock = threading.Lock()
+        self.updated = False  # Whether update() ran in this process
+        self.term_counts = {}  # Passages per common query word (see search)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")  # The GUI, the CLI and scripts can share the index
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.db.executescript("""
+                DROP TABLE IF EXISTS passages_fts;
+                DROP TABLE IF EXISTS passages;
+                DROP TABLE IF EXISTS files;
+            """)
+        # The passages live in a plain table (deleting a file's passages uses
+        # its index) and the FTS table indexes them, kept in step by triggers
+        self.db.executescript(f"""
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime REAL, size INTEGER, title TEXT
+            );
+            CREATE TABLE IF NOT EXISTS passages (id INTEGER PRIMARY KEY, file_id INTEGER, title TEXT, text TEXT);
+            CREATE INDEX IF NOT EXISTS passages_file ON passages (file_id);
+            CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts USING fts5(
+                title, text, content='passages', content_rowid='id', tokenize='porter unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS passages_insert AFTER INSERT ON passages BEGIN
+                INSERT INTO passages_fts (rowid, title, text) VALUES (new.id, new.title, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS passages_delete AFTER DELETE ON passages BEGIN
+                INSERT INTO passages_fts (passages_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+            END;
+            INSERT INTO passages_fts (passages_fts, rank) VALUES ('rank', 'bm25({TITLE_WEIGHT}, {TEXT_WEIGHT})');
+            PRAGMA user_version={SCHEMA_VERSION};
+        """)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def _key(self, path):
+        """Path of a file relative to the folder, with forward slashes (None if outside it)."""
+        try:
+            return Path(path).resolve().relative_to(self.folder.resolve()).as_posix()
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _indexable(key):
+        parts = key.split("/")
+        return (Path(key).suffix.lower() in TEXT_SUFFIXES and parts[-1] not in SKIP_NAMES
+                and not parts[-1].lower().endswith(SKIP_SUFFIXES)
+                and not any(part.startswith(".") for part in parts))
+
+    def _delete(self, key):
+        """Drop one file and its passages (caller holds the lock and commits)."""
+        row = self.db.execute("SELECT id FROM files WHERE path = ?", (key,)).fetchone()
+        if row:
+            self.db.execute("DELETE FROM passages WHERE file_id = ?", row)
+            self.db.execute("DELETE FROM files WHERE id = ?", row)
+
+    def _replace(self, key, text, suffix, stat):
+        """Put one file's passages in the index (caller holds the lock and commits)."""
+        self._delete(key)
+        plain = document_text(text, suffix)
+        title = _title(plain)
+        file_id = self.db.execute("INSERT INTO files (path, mtime, size, title) VALUES (?, ?, ?, ?)",
+                                  (key, stat.st_mtime, stat.st_size, title)).lastrowid
+        self.db.executemany("INSERT INTO passages (file_id, title, text) VALUES (?, ?, ?)",
+                            ((file_id, title, passage) for passage in split_passages(plain)))
+
+    def add(self, path, text=None):
+        """Index (or re-index) one file; text saves reading it again."""
+        path = Path(path)
+        key = self._key(path)
+        if key is None or not self._indexable(key):
+            return
+        if text is None:
+            text = path.read_text(encoding='utf-8', errors='replace')
+        stat = path.stat()
+        with self.lock, self.db:
+            self._replace(key, text, path.suffix.lower(), stat)
+
+    def remove(self, path):
+        """Drop a file from the index."""
+        key = self._key(path)
+        if key is None:
+            return
+        with self.lock, self.db:
+            self._delete(key)
+
+    def update(self):
+        """Bring the index in line with the folder: add new and changed files, drop deleted ones.
+
+        Unchanged files (same size and modification time) are not read.
+        Returns (added_or_changed, removed).
+        """
+        with self.lock:
+            known = {path: (mtime, size) for path, mtime, size in self.db.execute("SELECT path, mtime, size FROM files")}
+        changed = []
+        seen = set()
+        for root, dirs, files in os.walk(self.folder):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            prefix = Path(root).relative_to(self.folder).as_posix()
+            for name in files:
+                key = name if prefix == "." else f"{prefix}/{name}"
+                if not self._indexable(key):
+                    continue
+                path = Path(root) / name
+                seen.add(key)
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                if known.get(key) != (stat.st_mtime, stat.st_size):
+                    changed.append((path, key, stat))
+
+        removed = [key for key in known if key not in seen]
+        with self.lock, self.db:
+            for key in removed:
+                self._delete(key)
+            for path, key, stat in changed:
+                try:
+                    text = path.read_text(encoding='utf-8', errors='replace')
+                except OSError:
+                    continue
+                self._replace(key, text, path.suffix.lower(), stat)
+        self.updated = True
+        if changed or removed:
+            self.term_counts.clear()
+        return len(changed), len(removed)
+
+    def rebuild(self):
+        """Index the whole folder from scratch."""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM passages")
+            self.db.execute("DELETE FROM files")
+            self.db.execute("INSERT INTO passages_fts (passages_fts) VALUES ('rebuild')")
+        result = self.update()
+        with self.lock, self.db:
+            self.db.execute("INSERT INTO passages_fts (passages_fts) VALUES ('optimize')")
+        return result
+
+    def search(self, query, limit=20, exclude=()):
+        """Best passages for query, best first.
+
+        Each hit is a dict with path (relative to the folder), title, text
+        and score (BM25, higher is better). Files in exclude are skipped.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        with self.lock:
+            total = self.db.execute("SELECT MAX(id) FROM passages").fetchone()[0] or 0
+            counts = []
+            for term in terms:
+                count = self.term_counts.get(term)
+                if count is None:
+                    count = self.db.execute("SELECT COUNT(*) FROM passages_fts WHERE passages_fts MATCH ?",
+                                            (f'"{term}"',)).fetchone()[0]
+                    # Counting a common word is slow, and new files hardly change it
+                    if count > total * MAX_TERM_SHARE:
+                        self.term_counts[term] = count
+                counts.append((count, term))
+        found = sorted((count, term) for count, term in counts if count)
+        if not found:
+            return []
+        # Keep the distinctive words; if all are common, the two rarest
+        kept = [term for count, term in found if count <= total * MAX_TERM_SHARE] or [t for _, t in found[:2]]
+        expression = " OR ".join(f'"{term}"' for term in kept)
+        excluded = {self._key(path) for path in exclude} - {None}
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT files.path, passages.title, passages.text, -passages_fts.rank FROM passages_fts "
+                "JOIN passages ON passages.id = passages_fts.rowid JOIN files ON files.id = passages.file_id "
+                "WHERE passages_fts MATCH ? ORDER BY passages_fts.rank LIMIT ?",
+                (expression, limit + len(excluded) * MAX_PASSAGES_PER_FILE)
+            ).fetchall()
+        hits = [{"path": path, "title": title, "text": text, "score": score}
+                for path, title, text, score in rows if path not in excluded]
+        return hits[:limit]
+
+    def context(self, query, budget_tokens, tokens_per_word=1.4, exclude=(), card_for=None):
+        """The most relevant passages for query that fit in budget_tokens.
+
+        Passages scoring below MIN_RELATIVE_SCORE of the best one are left
+        out, and at most MAX_PASSAGES_PER_FILE come from the same file.
+        card_for(path) may return a short summary of a whole file (see
+        narraider_facts), used once in place of that file's passages.
+        Returns the passages formatted for a prompt ("" if nothing is
+        relevant) and the list of hits used.
+        """
+        hits = self.search(query, exclude=exclude)
+        if not hits:
+            return "", []
+        floor = hits[0]["score"] * MIN_RELATIVE_SCORE
+        used = []
+        per_file = {}
+        seen = set()
+        spent = 0
+        cards = {}
+        for hit in hits:
+            if hit["score"] < floor or per_file.get(hit["path"], 0) >= MAX_PASSAGES_PER_FILE or hit["text"] in seen:
+                continue
+            if card_for and hit["path"] not in cards:
+                cards[hit["path"]] = card_for(hit["path"])
+            card = cards.get(hit["path"])
+            block = card or f"[{hit['title'] or hit['path']}] {hit['text']}"
+            cost = int(len(block.split()) * tokens_per_word) + 1
+            if spent + cost > budget_tokens:
+                continue
+            spent += cost
+            seen.add(hit["text"])
+            per_file[hit["path"]] = MAX_PASSAGES_PER_FILE if card else per_file.get(hit["path"], 0) + 1
+            used.append(dict(hit, block=block, card=bool(card)))
+        return "\n\n".join(hit["block"] for hit in used), used
+
+    def stats(self):
+        """Number of indexed files and passages."""
+        with self.lock:
+            files = self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            passages = self.db.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+        return {"files": files, "passages": passages}
+
+def main():
+    """Update or rebuild the lore index, or show what a prompt would retrieve."""
+    parser = argparse.ArgumentParser(description="Search earlier NarrAider outputs for lore")
+    parser.add_argument("query", nargs="?", help="Prompt to find relevant lore for")
+    parser.add_argument("--budget", type=int, default=600, help="Token budget of the retrieved lore (default: 600)")
+    parser.add_argument("--rebuild", action="store_true", help="Index the output folder from scratch")
+    parser.add_argument("--folder", help="Output folder (default: output_folder from the config)")
+    args = parser.parse_args()
+
+    folder = args.folder
+    if not folder:
+        import narraider
+        narraider.load_config()
+        folder = narraider.CONFIG["output_folder"]
+    index = LoreIndex(folder)
+
+    start = time.perf_counter()
+    changed, removed = index.rebuild() if args.rebuild else index.update()
+    stats = index.stats()
+    print(f"{stats['files']} files, {stats['passages']} passages in {index.path} "
+          f"({changed} indexed, {removed} removed in {time.perf_counter() - start:.2f}s)")
+
+    if args.query:
+        start = time.perf_counter()
+        text, hits = index.context(args.query, args.budget)
+        elapsed = (time.perf_counter() - start) * 1000
+        for hit in hits:
+            print(f"{hit['score']:7.2f}  {hit['path']}  {hit['title']}")
+        print(f"{len(hits)} passage(s) in {elapsed:.1f} ms\n")
+        print(text or "(nothing relevant)")
+    index.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
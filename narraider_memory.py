@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+NarrAider memory planner - Pick context size and GPU layers from model metadata
+Created by Andreas "Uriel1339" Lopez
+
+Estimates weight, KV-cache and compute-buffer memory from GGUF metadata (see
+narraider_gguf.py) and derives the largest safe --ctx-size, the -ngl split and
+the number of parallel slots for a given amount of VRAM. Works on metadata
+dicts alone, so plans can be checked without a GPU.
+MIT License - Free to use, modify, and distribute.
+"""
+
+import argparse
+import subprocess
+import sys
+
+from narraider_gguf import get_model_info, GGUFError
+
+GIB = 1024 ** 3
+
+# Bytes per element for llama-server's --cache-type-k / --cache-type-v values
+KV_CACHE_TYPES = {
+    "f32": 4.0,
+    "f16": 2.0,
+    "bf16": 2.0,
+    "q8_0": 34 / 32,
+    "q5_1": 24 / 32,
+    "q5_0": 22 / 32,
+    "q4_1": 20 / 32,
+    "q4_0": 18 / 32,
+    "iq4_nl": 18 / 32,
+}
+
+# CUDA/Metal context, desktop compositor and allocator slack
+DEFAULT_RESERVE_BYTES = GIB // 2
+
+# llama-server's default physical batch size; sizes the compute buffers
+UBATCH_SIZE = 512
+
+# Context sizes are rounded down to a multiple of this
+CONTEXT_GRANULARITY = 256
+
+def kv_bytes_per_token(info, cache_type_k="f16", cache_type_v="f16"):
+    """KV-cache bytes per token for a single layer.
+
+    Sliding-window layers are counted at full size, which over-estimates
+    models like Gemma 3 but keeps the plan on the safe side.
+    """
+    if cache_type_k not in KV_CACHE_TYPES or cache_type_v not in KV_CACHE_TYPES:
+        raise ValueError(f"Unknown KV cache type: {cache_type_k}/{cache_type_v}")
+    return info["head_count_kv"] * (
+        info["key_length"] * KV_CACHE_TYPES[cache_type_k]
+        + info["value_length"] * KV_CACHE_TYPES[cache_type_v]
+    )
+
+def compute_buffer_bytes(info):
+    """Rough size of llama.cpp's compute buffers (activations and logits)."""
+    return UBATCH_SIZE * (info.get("vocab_size", 0) + 4 * info["embedding_length"]) * 4
+
+def estimate_memory(info, context_size, gpu_layers, cache_type_k="f16", cache_type_v="f16"):
+    """GPU bytes a server with these settings needs, excluding the fixed reserve."""
+    layers = info["layers"]
+    offloaded = min(gpu_layers, layers)
+    weights = info["layer_bytes"] / layers * offloaded
+    if gpu_layers > layers:
+        weights += info.get("output_bytes", 0)
+    kv_cache = kv_bytes_per_token(info, cache_type_k, cache_type_v) * context_size * offloaded
+    return int(weights + kv_cache + compute_buffer_bytes(info))
+
+def plan_memory(info, available_bytes, context_per_slot=8192, cache_type_k="f16",
+                cache_type_v="f16", max_slots=4, reserve_bytes=DEFAULT_RESERVE_BYTES):
+    """Plan --ctx-size, -ngl and --parallel for one model.
+
+    info is the dict returned by narraider_gguf.parse_gguf(). If the whole
+    model fits with at least one slot of context_per_slot tokens, every layer
+    is offloaded and the leftover memory becomes extra context, split into up
+    to max_slots parallel slots. Otherwise one slot is used and as many layers
+    as fit are offloaded; the rest run on the CPU with their KV cache in RAM.
+    """
+    required = ("layers", "layer_bytes", "head_count_kv", "key_length", "value_length", "embedding_length")
+    missing = [key for key in required if not info.get(key)]
+    if missing:
+        raise ValueError(f"Model metadata lacks {', '.join(missing)}")
+
+    layers = info["layers"]
+    train_context = info.get("context_length") or context_per_slot
+    slot_context = min(context_per_slot, train_context)
+
+    kv_layer = kv_bytes_per_token(info, cache_type_k, cache_type_v)
+    kv_token = kv_layer * layers
+    weights = info["layer_bytes"] + info.get("output_bytes", 0)
+    compute = compute_buffer_bytes(info)
+    budget = available_bytes - reserve_bytes - compute
+
+    if budget >= weights + kv_token * slot_context:
+        context_fit = int((budget - weights) // kv_token)
+        context_fit -= context_fit % CONTEXT_GRANULARITY
+        slots = max(1, min(max_slots, context_fit // slot_context))
+        context_size = min(context_fit, slots * train_context)
+        gpu_layers = layers + 1  # One past the last block also offloads the output layer
+        gpu_weights = weights
+        gpu_kv = kv_token * context_size
+    else:
+        slots = 1
+        context_size = slot_context
+        per_layer = info["layer_bytes"] / layers + kv_layer * context_size
+        gpu_layers = int(max(0, budget) // per_layer)
+        gpu_layers = min(gpu_layers, layers)
+        gpu_weights = info["layer_bytes"] / layers * gpu_layers
+        gpu_kv = kv_layer * context_size * gpu_layers
+
+    return {
+        "context_size": context_size,
+        "gpu_layers": gpu_layers,
+        "parallel": slots,
+        "full_offload": gpu_layers > layers,
+        "weights_bytes": int(gpu_weights),
+        "kv_cache_bytes": int(gpu_kv),
+        "compute_bytes": int(compute),
+        "total_bytes": int(gpu_weights + gpu_kv + compute + reserve_bytes),
+    }
+
+def plan_for_models(model_paths, available_bytes, **kwargs):
+    """Plan shared server settings that are safe for every given model.
+
+    NarrAider uses one context_size/gpu_layers pair for all models, so the
+    most conservative plan wins. Returns (plan, {path: error}) where plan is
+    None if no model could be read.
+    """
+    plans = []
+    errors = {}
+    for path in model_paths:
+        try:
+            plans.append(plan_memory(get_model_info(path), available_bytes, **kwargs))
+        except (OSError, GGUFError, ValueError) as e:
+            errors[path] = str(e)
+
+    if not plans:
+        return None, errors
+
+    plan = dict(max(plans, key=lambda p: p["total_bytes"]))
+    plan["context_size"] = min(p["context_size"] for p in plans)
+    plan["parallel"] = min(p["parallel"] for p in plans)
+    partial = [p["gpu_layers"] for p in plans if not p["full_offload"]]
+    plan["gpu_layers"] = min(partial) if partial else max(p["gpu_layers"] for p in plans)
+    plan["full_offload"] = not partial
+    return plan, errors
+
+def detect_gpu_memory():
+    """Total VRAM in bytes across NVIDIA GPUs, or None if nvidia-smi is unavailable."""
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=memory.total", "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0:
+        return None
+    try:
+        return sum(int(line) for line in result.stdout.split()) * 1024 ** 2 or None
+    except ValueError:
+        return None
+
+def format_plan(plan):
+    """Human-readable summary of a plan."""
+    offload = "all layers" if plan["full_offload"] else f"{plan['gpu_layers']} layers"
+    return (f"ctx {plan['context_size']}, -ngl {plan['gpu_layers']} ({offload} on GPU), "
+            f"{plan['parallel']} slot(s) | weights {plan['weights_bytes'] / GIB:.1f} GB + "
+            f"KV {plan['kv_cache_bytes'] / GIB:.1f} GB + compute {plan['compute_bytes'] / GIB:.1f} GB "
+            f"= {plan['total_bytes'] / GIB:.1f} GB")
+
+def main():
+    """Print a memory plan for the given models."""
+    parser = argparse.ArgumentParser(description="Plan context size and GPU layers for GGUF models")
+    parser.add_argument("models", nargs="+", help="GGUF model files")
+    parser.add_argument("--vram", type=float, help="Available VRAM in GB (default: detect with nvidia-smi)")
+    parser.add_argument("--context", type=int, default=8192, help="Context per slot (default: 8192)")
+    parser.add_argument("--cache-type", default="f16", choices=sorted(KV_CACHE_TYPES),
+                        help="KV cache type for keys and values (default: f16)")
+    parser.add_argument("--max-slots", type=int, default=4, help="Maximum parallel slots (default: 4)")
+    args = parser.parse_args()
+
+    available = args.vram * GIB if args.vram else detect_gpu_memory()
+    if not available:
+        print("ERROR: Could not detect GPU memory, pass --vram")
+        return 1
+
+    for path in args.models:
+        try:
+            plan = plan_memory(get_model_info(path), available, args.context,
+                               args.cache_type, args.cache_type, args.max_slots)
+        except (OSError, GGUFError, ValueError) as e:
+            print(f"{path}: ERROR: {e}")
+            continue
+        print(f"{path}: {format_plan(plan)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
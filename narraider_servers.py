@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+NarrAider server registry - Share llama-server instances between processes
+Created by Andreas "Uriel1339" Lopez
+
+Every llama-server started by a NarrAider process (GUI, CLI, scripts) is
+recorded in narraider_servers.json next to the config, guarded by a lock
+file. Other processes attach to a running server with the same model
+instead of loading it a second time, and pick a free port when they need
+a different one. Records of crashed processes are cleaned up on access.
+MIT License - Free to use, modify, and distribute.
+"""
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+REGISTRY_PATH = Path(__file__).parent / "narraider_servers.json"
+LOCK_PATH = Path(__file__).parent / "narraider_servers.lock"
+
+# Ports tried after the preferred one before giving up
+PORT_SEARCH_RANGE = 20
+
+@contextmanager
+def _registry_lock():
+    """Hold the cross-process registry lock."""
+    with open(LOCK_PATH, "a+") as f:
+        if os.name == "nt":
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after ~10 seconds; keep waiting
+        else:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def pid_alive(pid):
+    """True if a process with this pid is running."""
+    if os.name == "nt":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def pid_started(pid):
+    """When the process with this pid started, as an opaque string; None if unknown.
+
+    A pid can be reused after its process exits or the machine reboots;
+    a different start time means a different process.
+    """
+    if os.name == "nt":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return None
+        times = [ctypes.c_ulonglong() for _ in range(4)]  # creation, exit, kernel, user
+        ok = kernel32.GetProcessTimes(handle, *(ctypes.byref(t) for t in times))
+        kernel32.CloseHandle(handle)
+        return str(times[0].value) if ok else None
+    try:
+        # Field 22 is the start time in clock ticks since boot; the boot id tells boots apart
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            start = f.read().rsplit(")", 1)[1].split()[19]
+        with open("/proc/sys/kernel/random/boot_id", 'r') as f:
+            return f"{f.read().strip()}:{start}"
+    except (OSError, IndexError):
+        pass
+    try:
+        # No /proc (macOS, BSD)
+        result = subprocess.run(["ps", "-o", "lstart=", "-p", str(pid)],
+                                capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+def terminate_pid(pid, started):
+    """Stop a server process that is not a child of this process.
+
+    Only if it is still the process that started at started (see
+    pid_started), so a reused pid is never signalled. Returns True if
+    the process was signalled.
+    """
+    if started is None or pid_started(pid) != started:
+        return False
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except OSError:
+        return False
+    return True
+
+def server_alive(record):
+    """True if the record's llama-server is still running (and its pid not reused)."""
+    if not pid_alive(record["server_pid"]):
+        return False
+    started = record.get("server_started")
+    return started is None or pid_started(record["server_pid"]) in (None, started)
+
+def port_in_use(port):
+    """True if something accepts connections on the local port."""
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            return True
+    except OSError:
+        return False
+
+def _read():
+    try:
+        with open(REGISTRY_PATH, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return records if isinstance(records, list) else []
+
+def _write(records):
+    tmp_path = REGISTRY_PATH.with_suffix(".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(records, f, indent=2)
+    os.replace(tmp_path, REGISTRY_PATH)
+
+def _clean(records):
+    """Drop records of dead servers and re-home servers whose owner died.
+
+    A server outlives a crashed owner. If other processes still use it, one
+    of them becomes the owner; otherwise the orphan is stopped.
+    """
+    live = []
+    for record in records:
+        if not server_alive(record):
+            continue
+        record["clients"] = [pid for pid in record.get("clients", []) if pid_alive(pid)]
+        if not pid_alive(record["owner_pid"]):
+            if not record["clients"]:
+                terminate_pid(record["server_pid"], record.get("server_started"))
+                continue
+            record["owner_pid"] = record["clients"].pop(0)
+        live.append(record)
+    return live
+
+def _update(change):
+    """Apply change(records) to the cleaned registry under the lock; returns its result."""
+    with _registry_lock():
+        records = _clean(_read())
+        result = change(records)
+        _write(records)
+        return result
+
+def list_servers():
+    """All live server records."""
+    return _update(lambda records: [dict(r) for r in records])
+
+def find_server(key, context_size, exclude_pid=None):
+    """A server started by another process with the same key and at least context_size.
+
+    key identifies what the server was launched with (see narraider._server_key).
+    """
+    key = json.loads(json.dumps(key))
+
+    def find(records):
+        for record in records:
+            if (record["key"] == key and record["context_size"] >= context_size
+                    and record["owner_pid"] != exclude_pid):
+                return dict(record)
+        return None
+
+    return _update(find)
+
+def register_server(port, server_pid, key, model, context_size, slots):
+    """Record a server this process started and owns."""
+    record = {
+        "port": port,
+        "server_pid": server_pid,
+        "server_started": pid_started(server_pid),
+        "owner_pid": os.getpid(),
+        "clients": [],
+        "key": json.loads(json.dumps(key)),
+        "model": model,
+        "context_size": context_size,
+        "slots": slots,
+        "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+    def register(records):
+        records[:] = [r for r in records if r["port"] != port]
+        records.append(record)
+
+    _update(register)
+
+def attach_server(port):
+    """Register this process as a user of another process's server.
+
+    Returns False if the server is gone.
+    """
+    def attach(records):
+        for record in records:
+            if record["port"] == port:
+                if os.getpid() not in record["clients"] and record["owner_pid"] != os.getpid():
+                    record["clients"].append(os.getpid())
+                return True
+        return False
+
+    return _update(attach)
+
+def release_server(port):
+    """Stop using the server on port.
+
+    Returns the record if this process owns the server and nobody else
+    uses it, meaning the caller should stop it, and False if another
+    process owns or still uses it (ownership is handed over to one of
+    them). Returns None for servers that are not registered.
+    """
+    pid = os.getpid()
+
+    def release(records):
+        for record in records:
+            if record["port"] != port:
+                continue
+            if pid in record["clients"]:
+                record["clients"].remove(pid)
+            if record["owner_pid"] != pid:
+                return False
+            if record["clients"]:
+                record["owner_pid"] = record["clients"].pop(0)
+                return False
+            records.remove(record)
+            return record
+        return None
+
+    return _update(release)
+
+def unregister_server(port):
+    """Forget the server on port (it crashed or was stopped)."""
+    def unregister(records):
+        records[:] = [r for r in records if r["port"] != port]
+
+    _update(unregister)
+
+def allocate_port(preferred, exclude=()):
+    """preferred if it is free, else the next free port above it.
+
+    Ports in exclude, registered by any process, or answering connections
+    count as taken. Returns None if no port in range is free.
+    """
+    taken = {record["port"] for record in list_servers()} | set(exclude)
+    for port in range(preferred, preferred + PORT_SEARCH_RANGE):
+        if port not in taken and not port_in_use(port):
+            return port
+    return None
+
+def main():
+    """List the llama-server instances NarrAider processes are running."""
+    servers = list_servers()
+    if not servers:
+        print("No NarrAider servers running.")
+        return 0
+    for record in servers:
+        clients = ", ".join(str(pid) for pid in record["clients"]) or "none"
+        print(f"Port {record['port']}: {record['model']} ({Path(record['key'][0]).name}), "
+              f"ctx {record['context_size']}, {record['slots']} slot(s)")
+        print(f"   server pid {record['server_pid']}, owner pid {record['owner_pid']}, "
+              f"other users: {clients}, started {record['started']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,11 +12,13 @@ from tkinter import ttk, scrolledtext, filedialog, messagebox
 import threading
 import queue
 import json
+import sqlite3
 import subprocess
 import os
 import sys
 import urllib.request
 import hashlib
+import time
 from pathlib import Path
 from datetime import datetime
 try:
@@ -28,15 +30,34 @@ except ImportError:
 # Version
 VERSION = "2.0.0"
 
+# Delay after the last content type/model change before the model is preloaded
+PRELOAD_DELAY_MS = 1500
+
+# Most variants the Generate tab runs side by side
+MAX_VARIANTS = 5
+
+# Display names of the built-in model roles; other roles show their config name
+MODEL_ROLE_LABELS = {"worldbuilding": "Creative Writing", "explicit": "Explicit/Adult"}
+AUTO_MODEL_LABEL = "Auto (routing table)"
+
+# History tab: results shown per search, and the pause after typing before it searches
+HISTORY_LIMIT = 200
+HISTORY_SEARCH_DELAY_MS = 150
+ALL_TYPES_LABEL = "All types"
+
 # Import core functionality
 try:
     from narraider import (
-        load_config, ensure_model_loaded, generate_content,
-        save_output, kill_server,
+        load_config, ensure_model_loaded, generate_content, generate_variants, save_variants,
+        save_output, flush_outputs, kill_server, prewarm_model_type, get_model_path, route_model,
+        model_roles, backend_status, get_request_style,
+        CancellationToken, GenerationCancelled,
         TEMPLATES, SYSTEM_PROMPTS,
         save_custom_system_prompt, delete_custom_system_prompt, is_custom_system_prompt
     )
     import narraider
+    from narraider_gguf import scan_models, get_model_info, format_model_summary, GGUFError
+    from narraider_memory import plan_for_models, detect_gpu_memory, format_plan, GIB
     # Load config immediately (load_config sets narraider.CONFIG as a side effect)
     load_config()
     CONFIG = narraider.CONFIG
@@ -614,6 +635,18 @@ class NarrAiderUnified:
         # Generation queue
         self.gen_queue = queue.Queue()
         self.generating = False
+        self.streaming = False
+        self.cancel_token = None
+
+        # History tab search (see schedule_history_search)
+        self.history_after_id = None
+        self.history_results = {}
+
+        # Predictive model preload (see schedule_preload)
+        self.preload_after_id = None
+        self.preload_token = None
+        self.preload_model = None
+        self.preload_started = None
 
         self.setup_ui()
         self.check_queue()
@@ -630,17 +663,22 @@ class NarrAiderUnified:
         self.notebook.add(self.tab_generate, text="Generate Content")
         self.setup_generate_tab()
 
-        # Tab 2: Model Manager
+        # Tab 2: History (every saved output, searchable)
+        self.tab_history = ttk.Frame(self.notebook)
+        self.notebook.add(self.tab_history, text="History")
+        self.setup_history_tab()
+
+        # Tab 3: Model Manager
         self.tab_models = ttk.Frame(self.notebook)
         self.notebook.add(self.tab_models, text="Model Manager")
         self.setup_models_tab()
 
-        # Tab 3: Settings
+        # Tab 4: Settings
         self.tab_settings = ttk.Frame(self.notebook)
         self.notebook.add(self.tab_settings, text="Settings")
         self.setup_settings_tab()
 
-        # Tab 4: Help & Guides
+        # Tab 5: Help & Guides
         self.tab_help = ttk.Frame(self.notebook)
         self.notebook.add(self.tab_help, text="[?] Help")
         self.setup_help_tab()
@@ -717,15 +755,17 @@ class NarrAiderUnified:
         # Model selection
         ttk.Label(left_panel, text="Model:").pack(anchor=tk.W, pady=(5, 2))
 
-        self.model_type = tk.StringVar(value="Creative Writing")
+        self.model_labels = {self.model_label(m): m for m in model_roles()}
+        self.model_type = tk.StringVar(value=AUTO_MODEL_LABEL)
         model_combo = ttk.Combobox(
             left_panel,
             textvariable=self.model_type,
-            values=["Creative Writing", "Explicit/Adult"],
+            values=[AUTO_MODEL_LABEL] + list(self.model_labels),
             state="readonly",
             width=28
         )
         model_combo.pack(fill=tk.X, pady=(0, 5))
+        model_combo.bind("<<ComboboxSelected>>", lambda e: self.schedule_preload())
 
         # Model settings indicator
         self.model_settings_label = tk.Label(
@@ -798,6 +838,21 @@ class NarrAiderUnified:
         format_combo.bind("<<ComboboxSelected>>",
                          lambda e: self.format_hint.config(text=format_descriptions[self.output_format.get()]))
 
+        # Variants: several versions of the same request, generated together
+        variants_frame = ttk.Frame(left_panel)
+        variants_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Label(variants_frame, text="Variants:").pack(side=tk.LEFT)
+        self.variants = tk.IntVar(value=1)
+        ttk.Spinbox(
+            variants_frame,
+            from_=1,
+            to=MAX_VARIANTS,
+            textvariable=self.variants,
+            state="readonly",
+            width=5
+        ).pack(side=tk.LEFT, padx=(5, 0))
+
         # Description tooltip
         self.type_description = tk.Text(
             left_panel,
@@ -825,6 +880,13 @@ class NarrAiderUnified:
         )
         self.generate_btn.pack(fill=tk.X, pady=(10, 5))
 
+        # Cancel button (only shown while generating)
+        self.cancel_btn = ttk.Button(
+            left_panel,
+            text="[X] Cancel",
+            command=self.cancel_generation
+        )
+
         # Progress bar
         self.progress = ttk.Progressbar(left_panel, mode='indeterminate')
 
@@ -864,9 +926,14 @@ class NarrAiderUnified:
         )
         self.output_text.pack(fill=tk.BOTH, expand=True)
 
+        # Side-by-side panes, shown instead of output_text when generating variants
+        self.variant_frame = ttk.Frame(output_frame)
+        self.variant_texts = []
+
         # Output buttons
         output_btn_frame = ttk.Frame(output_frame)
         output_btn_frame.pack(fill=tk.X, pady=(10, 0))
+        self.output_btn_frame = output_btn_frame
 
         ttk.Button(
             output_btn_frame,
@@ -889,6 +956,175 @@ class NarrAiderUnified:
         # Update type description
         self.on_type_changed()
 
+    def setup_history_tab(self):
+        """Setup the history tab: search every saved output by text, prompt, type or model."""
+        search_frame = ttk.Frame(self.tab_history)
+        search_frame.pack(fill=tk.X, padx=10, pady=(10, 5))
+
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT)
+        self.history_query = tk.StringVar()
+        self.history_query.trace_add("write", lambda *args: self.schedule_history_search())
+        search_entry = ttk.Entry(search_frame, textvariable=self.history_query, width=50)
+        search_entry.pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+
+        self.history_type = tk.StringVar(value=ALL_TYPES_LABEL)
+        type_combo = ttk.Combobox(
+            search_frame,
+            textvariable=self.history_type,
+            values=[ALL_TYPES_LABEL] + sorted(set(TEMPLATES) | {"chapter", "book", "misc"}),
+            state="readonly",
+            width=16
+        )
+        type_combo.pack(side=tk.LEFT, padx=5)
+        type_combo.bind("<<ComboboxSelected>>", lambda e: self.search_history())
+
+        ttk.Button(search_frame, text="Rescan Folder", command=self.rescan_history).pack(side=tk.LEFT, padx=5)
+
+        self.history_status = ttk.Label(self.tab_history, text="", foreground="#666")
+        self.history_status.pack(fill=tk.X, padx=10)
+
+        panes = ttk.PanedWindow(self.tab_history, orient=tk.VERTICAL)
+        panes.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+        list_frame = ttk.Frame(panes)
+        columns = {"when": ("Created", 130), "type": ("Type", 110), "model": ("Model", 110),
+                   "title": ("Title / Prompt", 420), "path": ("File", 280)}
+        self.history_tree = ttk.Treeview(list_frame, columns=list(columns), show="headings", selectmode="browse")
+        for column, (heading, width) in columns.items():
+            self.history_tree.heading(column, text=heading)
+            self.history_tree.column(column, width=width, stretch=column in ("title", "path"))
+        tree_scroll = ttk.Scrollbar(list_frame, orient="vertical", command=self.history_tree.yview)
+        self.history_tree.configure(yscrollcommand=tree_scroll.set)
+        self.history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        tree_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.history_tree.bind("<<TreeviewSelect>>", lambda e: self.show_history_entry())
+        panes.add(list_frame, weight=3)
+
+        preview_frame = ttk.Frame(panes)
+        self.history_preview = scrolledtext.ScrolledText(preview_frame, wrap=tk.WORD, state=tk.DISABLED,
+                                                         font=("Consolas", 9), height=12)
+        self.history_preview.pack(fill=tk.BOTH, expand=True)
+        button_frame = ttk.Frame(preview_frame)
+        button_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Button(button_frame, text="Use This Prompt", command=self.reuse_history_prompt).pack(side=tk.LEFT)
+        ttk.Button(button_frame, text="Open Folder", command=self.open_history_folder).pack(side=tk.LEFT, padx=5)
+        panes.add(preview_frame, weight=2)
+
+        # Show the latest outputs whenever the tab is opened
+        self.notebook.bind("<<NotebookTabChanged>>",
+                           lambda e: self.search_history() if self.notebook.select() == str(self.tab_history) else None)
+
+    def schedule_history_search(self):
+        """Search the history shortly after typing stops."""
+        if self.history_after_id:
+            self.root.after_cancel(self.history_after_id)
+        self.history_after_id = self.root.after(HISTORY_SEARCH_DELAY_MS, self.search_history)
+
+    def search_history(self):
+        """Fill the history list with the outputs matching the search."""
+        self.history_after_id = None
+        catalog = narraider._catalog()
+        if catalog is None:
+            self.history_status.config(text="[ERROR] Output catalog unavailable - see console for details")
+            return
+        content_type = self.history_type.get()
+        start = time.perf_counter()
+        try:
+            results = catalog.search(self.history_query.get(), None if content_type == ALL_TYPES_LABEL else content_type,
+                                     limit=HISTORY_LIMIT)
+        except sqlite3.Error as e:
+            self.history_status.config(text=f"[ERROR] Search failed: {e}")
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+
+        self.history_tree.delete(*self.history_tree.get_children())
+        self.history_results = {}
+        for entry in results:
+            item = self.history_tree.insert("", tk.END, values=(
+                datetime.fromtimestamp(entry["created"]).strftime("%Y-%m-%d %H:%M"),
+                entry["content_type"],
+                self.model_label(entry["model"]) if entry["model"] else "-",
+                entry["title"] or entry["prompt"],
+                entry["path"]
+            ))
+            self.history_results[item] = entry
+        more = " (newest shown, refine the search for more)" if len(results) == HISTORY_LIMIT else ""
+        self.history_status.config(text=f"{len(results)} output(s) in {elapsed:.0f} ms{more}")
+
+    def selected_history_entry(self):
+        """Catalog entry of the selected history row, or None."""
+        selection = self.history_tree.selection()
+        return self.history_results.get(selection[0]) if selection else None
+
+    def show_history_entry(self):
+        """Show how the selected output was made, followed by its text."""
+        entry = self.selected_history_entry()
+        if not entry:
+            return
+        path = Path(CONFIG["output_folder"]) / entry["path"]
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                text = f.read()
+        except OSError as e:
+            text = f"[File not found: {e}] - use Rescan Folder to update the history"
+        timings = entry["timings"]
+        details = [f"File:    {path}", f"Prompt:  {entry['prompt'] or '-'}"]
+        if entry["model"]:
+            details.append(f"Model:   {self.model_label(entry['model'])} ({entry['system_prompt'] or 'Default'} system prompt)")
+        if entry["params"]:
+            details.append("Params:  " + ", ".join(f"{k}={v}" for k, v in entry["params"].items()))
+        if timings.get("seconds") is not None:
+            details.append(f"Timing:  {timings['seconds']}s, {timings.get('words', '?')} words"
+                           + (f", {timings['tokens_per_second']} tokens/s" if timings.get("tokens_per_second") else ""))
+
+        self.history_preview.config(state=tk.NORMAL)
+        self.history_preview.delete("1.0", tk.END)
+        self.history_preview.insert("1.0", "\n".join(details) + "\n" + "-" * 80 + "\n\n" + text)
+        self.history_preview.config(state=tk.DISABLED)
+
+    def reuse_history_prompt(self):
+        """Put the selected output's type and prompt into the Generate tab."""
+        entry = self.selected_history_entry()
+        if not entry or not entry["prompt"]:
+            messagebox.showwarning("No Prompt", "This output has no recorded prompt.")
+            return
+        label = next((display for display, value in self.type_map.items() if value == entry["content_type"]), None)
+        if label:
+            self.content_type.set(label)
+            self.on_type_changed()
+        self.prompt_text.delete("1.0", tk.END)
+        self.prompt_text.insert("1.0", entry["prompt"])
+        self.notebook.select(self.tab_generate)
+
+    def open_history_folder(self):
+        """Open the folder of the selected output."""
+        entry = self.selected_history_entry()
+        folder = (Path(CONFIG["output_folder"]) / entry["path"]).parent if entry else Path(CONFIG["output_folder"])
+        if folder.exists():
+            if os.name == 'nt':  # Windows
+                os.startfile(folder)
+            elif os.name == 'posix':  # Mac/Linux
+                subprocess.run(['open' if sys.platform == 'darwin' else 'xdg-open', str(folder)])
+
+    def rescan_history(self):
+        """Catalog files added, changed or deleted outside NarrAider, in the background."""
+        catalog = narraider._catalog()
+        if catalog is None:
+            return
+        self.history_status.config(text="Scanning the output folder...")
+
+        def scan():
+            try:
+                self.gen_queue.put(("catalog", catalog.update(), None, None))
+            except (sqlite3.Error, OSError) as e:
+                self.gen_queue.put(("catalog", str(e), None, None))
+
+        threading.Thread(target=scan, daemon=True).start()
+
+    def report_saved(self, path, error):
+        """on_saved callback of save_output; runs on the writer thread, so it only queues."""
+        self.gen_queue.put(("saved", path, str(error) if error else None, None))
+
     def setup_models_tab(self):
         """Setup model management tab."""
         # Create scrollable container
@@ -918,14 +1154,9 @@ class NarrAiderUnified:
         active_frame = ttk.LabelFrame(scrollable_frame, text="Configured Models", padding=10)
         active_frame.pack(fill=tk.X, padx=20, pady=10)
 
-        # Get models from config
-        models = CONFIG.get("models", {})
-
-        # Creative Writing Model Card
-        self.create_model_card(active_frame, "Creative Writing", models.get("worldbuilding", ""))
-
-        # Explicit/Adult Model Card
-        self.create_model_card(active_frame, "Explicit/Adult", models.get("explicit", ""))
+        # One card per model role in the config
+        for model_type in model_roles():
+            self.create_model_card(active_frame, model_type, get_model_path(model_type) or "")
 
         # Detected Models Section
         detect_frame = ttk.LabelFrame(scrollable_frame, text="Detected Models in Folder", padding=10)
@@ -956,8 +1187,9 @@ class NarrAiderUnified:
             command=lambda: SetupWizard(self.root)
         ).pack(pady=5)
 
-    def create_model_card(self, parent, model_name, model_path):
+    def create_model_card(self, parent, model_type, model_path):
         """Create a model info card with preset management."""
+        model_name = self.model_label(model_type)
         card = ttk.Frame(parent, relief=tk.RAISED, borderwidth=1)
         card.pack(fill=tk.X, pady=5, padx=5)
 
@@ -973,7 +1205,15 @@ class NarrAiderUnified:
 
         # Check if model exists
         model_file = Path(model_path) if model_path else None
-        if model_file and model_file.exists():
+        backends = backend_status(model_type)
+        if backends:
+            healthy = sum(1 for b in backends if b["state"] == "healthy")
+            status_label = ttk.Label(
+                header_frame,
+                text=f"{healthy}/{len(backends)} backends healthy",
+                foreground="green" if healthy else "red"
+            )
+        elif model_file and model_file.exists():
             size_gb = model_file.stat().st_size / (1024**3)
             status_label = ttk.Label(
                 header_frame,
@@ -996,6 +1236,42 @@ class NarrAiderUnified:
             foreground="#666"
         ).pack(anchor=tk.W, padx=10)
 
+        # Metadata read from the GGUF header (cached in model_index.json)
+        if model_file and model_file.exists():
+            try:
+                summary = format_model_summary(get_model_info(model_file))
+            except (OSError, GGUFError) as e:
+                summary = f"Could not read model metadata: {e}"
+            ttk.Label(
+                card,
+                text=summary,
+                font=("Arial", 9),
+                foreground="#666"
+            ).pack(anchor=tk.W, padx=10)
+
+        # Servers the role is spread over (see "backends" in the config)
+        for backend in backends:
+            serves = ""
+            if backend["capabilities"]:
+                serves = f", {Path(backend['capabilities']['model']).name}"
+            ttk.Label(
+                card,
+                text=f"Backend: {backend['url']} ({backend['api']}, {backend['slots']} slot(s){serves}) - {backend['state']}",
+                font=("Arial", 9),
+                foreground="#666"
+            ).pack(anchor=tk.W, padx=10)
+
+        # Content types the routing table sends to this role
+        routed = [t for t in TEMPLATES if route_model(t) == model_type]
+        ttk.Label(
+            card,
+            text=f"Requests: {get_request_style(model_type)} API "
+                 f"| Auto routing: {', '.join(routed) if routed else 'no content types'}",
+            font=("Arial", 9),
+            foreground="#666",
+            wraplength=600
+        ).pack(anchor=tk.W, padx=10)
+
         # Preset management
         preset_frame = ttk.Frame(card)
         preset_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -1031,7 +1307,7 @@ class NarrAiderUnified:
         ttk.Button(
             btn_frame,
             text="Change Model",
-            command=lambda: self.change_model(model_name)
+            command=lambda: self.change_model(model_type)
         ).pack(side=tk.LEFT, padx=2)
 
     def scan_for_models(self):
@@ -1040,7 +1316,7 @@ class NarrAiderUnified:
             # Get models folder from config
             models = CONFIG.get("models", {})
             if models:
-                first_model = list(models.values())[0]
+                first_model = get_model_path(list(models)[0])
                 models_folder = Path(first_model).parent
             else:
                 models_folder = Path.home() / "ai-models"
@@ -1052,23 +1328,27 @@ class NarrAiderUnified:
                 self.detected_models_text.config(state=tk.DISABLED)
                 return
 
-            # Find all .gguf files
-            gguf_files = list(models_folder.glob("*.gguf"))
+            # Read metadata for all .gguf files (unchanged files come from the index)
+            gguf_files = scan_models(models_folder)
 
             # Get currently configured models
-            configured = set(Path(m).name for m in models.values() if Path(m).exists())
+            configured = set(Path(get_model_path(m)).name for m in models if Path(get_model_path(m)).exists())
 
             # Find unconfigured models
-            unconfigured = [f for f in gguf_files if f.name not in configured]
+            unconfigured = [(Path(f), info) for f, info in gguf_files.items() if Path(f).name not in configured]
 
             self.detected_models_text.config(state=tk.NORMAL)
             self.detected_models_text.delete("1.0", tk.END)
 
             if unconfigured:
                 self.detected_models_text.insert("1.0", f"Found {len(unconfigured)} unconfigured model(s):\n\n")
-                for model in unconfigured:
-                    size_gb = model.stat().st_size / (1024**3)
+                for model, info in unconfigured:
+                    if "error" in info:
+                        self.detected_models_text.insert(tk.END, f"• {model.name} (unreadable: {info['error']})\n")
+                        continue
+                    size_gb = info["file_size"] / (1024**3)
                     self.detected_models_text.insert(tk.END, f"• {model.name} ({size_gb:.1f} GB)\n")
+                    self.detected_models_text.insert(tk.END, f"    {format_model_summary(info)}\n")
                 self.detected_models_text.insert(tk.END, "\n[Use 'Change Model' buttons above to configure]")
             else:
                 self.detected_models_text.insert("1.0", "No unconfigured models found.\n\nAll .gguf files in the folder are already configured.")
@@ -1094,20 +1374,25 @@ class NarrAiderUnified:
         else:
             messagebox.showwarning("No Path", "Model path not configured.")
 
-    def change_model(self, model_name):
+    def change_model(self, model_type):
         """Change the model file for a specific model type."""
+        model_name = self.model_label(model_type)
         filename = filedialog.askopenfilename(
             title=f"Select {model_name} model",
             filetypes=[("GGUF Model", "*.gguf"), ("All Files", "*.*")]
         )
         if filename:
-            # Update config based on model name
-            model_type = "worldbuilding" if "Creative" in model_name else "explicit"
-
             if model_type == "worldbuilding":
                 self.worldbuilding_model_var.set(filename)
-            else:
+            elif model_type == "explicit":
                 self.explicit_model_var.set(filename)
+            else:
+                # Roles without a Settings field are updated in the config directly
+                models = CONFIG["models"]
+                if isinstance(models.get(model_type), dict):
+                    models[model_type] = {**models[model_type], "base": filename}
+                else:
+                    models[model_type] = filename
 
             # Save config
             self.save_config()
@@ -1150,7 +1435,7 @@ class NarrAiderUnified:
         preset_combo = ttk.Combobox(
             preset_frame,
             textvariable=self.gpu_preset_var,
-            values=["8GB VRAM", "12GB VRAM", "16GB VRAM", "24GB VRAM", "Custom"],
+            values=["Auto-detect GPU", "8GB VRAM", "12GB VRAM", "16GB VRAM", "24GB VRAM", "Custom"],
             state="readonly",
             width=20
         )
@@ -1166,7 +1451,7 @@ class NarrAiderUnified:
         # Warning note
         warning_text = tk.Text(preset_frame, height=4, wrap=tk.WORD, font=("Arial", 9), relief=tk.FLAT, bg="#FFF3CD", fg="#856404")
         warning_text.grid(row=1, column=0, columnspan=3, sticky=tk.EW, padx=5, pady=10)
-        warning_text.insert("1.0", "NOTE: These are conservative recommendations based on llama.cpp community benchmarks (2025-2026). Always test with your specific GPU and model. KV cache grows with context size - if you get out-of-memory errors, reduce Context Size first (e.g., 8192→4096), then GPU Layers. Settings optimized for Q4_K_M quantization.")
+        warning_text.insert("1.0", "NOTE: Presets are planned from your configured models' metadata (layers, attention heads, quantization) and the selected VRAM, picking the largest context that fits with all layers on the GPU, or as many layers as fit. The KV Cache Type below is taken into account. Always test with your specific GPU - if you get out-of-memory errors, reduce Context Size first (e.g., 8192→4096), then GPU Layers.")
         warning_text.config(state=tk.DISABLED)
 
         # llama.cpp Server Settings
@@ -1191,14 +1476,14 @@ class NarrAiderUnified:
 
         # Worldbuilding model
         ttk.Label(model_frame, text="Creative Writing Model:").grid(row=0, column=0, sticky=tk.W, pady=5)
-        self.worldbuilding_model_var = tk.StringVar(value=CONFIG.get("models", {}).get("worldbuilding", ""))
+        self.worldbuilding_model_var = tk.StringVar(value=get_model_path("worldbuilding") or "")
         wb_entry = ttk.Entry(model_frame, textvariable=self.worldbuilding_model_var, width=50)
         wb_entry.grid(row=0, column=1, padx=5, pady=5)
         ttk.Button(model_frame, text="Browse...", command=lambda: self.browse_model("worldbuilding")).grid(row=0, column=2, padx=5)
 
         # Explicit model
         ttk.Label(model_frame, text="Explicit/Adult Model:").grid(row=1, column=0, sticky=tk.W, pady=5)
-        self.explicit_model_var = tk.StringVar(value=CONFIG.get("models", {}).get("explicit", ""))
+        self.explicit_model_var = tk.StringVar(value=get_model_path("explicit") or "")
         exp_entry = ttk.Entry(model_frame, textvariable=self.explicit_model_var, width=50)
         exp_entry.grid(row=1, column=1, padx=5, pady=5)
         ttk.Button(model_frame, text="Browse...", command=lambda: self.browse_model("explicit")).grid(row=1, column=2, padx=5)
@@ -1230,6 +1515,18 @@ class NarrAiderUnified:
         )
         keep_server_check.grid(row=2, column=0, columnspan=3, sticky=tk.W, pady=10)
 
+        # KV cache type
+        ttk.Label(perf_frame, text="KV Cache Type:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        self.kv_cache_var = tk.StringVar(value=CONFIG.get("cache_type_k", "f16"))
+        ttk.Combobox(perf_frame, textvariable=self.kv_cache_var, values=["f16", "q8_0", "q4_0"], state="readonly", width=10).grid(row=3, column=1, sticky=tk.W, padx=5, pady=5)
+        ttk.Label(perf_frame, text="(q8_0 halves KV memory with minimal quality loss)").grid(row=3, column=2, sticky=tk.W, padx=5)
+
+        # Parallel slots
+        ttk.Label(perf_frame, text="Parallel Slots:").grid(row=4, column=0, sticky=tk.W, pady=5)
+        self.parallel_var = tk.StringVar(value=str(CONFIG.get("parallel", 1)))
+        ttk.Entry(perf_frame, textvariable=self.parallel_var, width=10).grid(row=4, column=1, sticky=tk.W, padx=5, pady=5)
+        ttk.Label(perf_frame, text="(Context Size is shared between slots)").grid(row=4, column=2, sticky=tk.W, padx=5)
+
         # Generation Parameters
         gen_frame = ttk.LabelFrame(scrollable_frame, text="Generation Parameters", padding=10)
         gen_frame.pack(fill=tk.X, padx=20, pady=10)
@@ -1326,13 +1623,39 @@ class NarrAiderUnified:
             }
         }
 
-        if preset in presets:
+        if preset == "Auto-detect GPU":
+            available = detect_gpu_memory()
+            if not available:
+                messagebox.showwarning("Auto-detect GPU", "Could not detect GPU memory (nvidia-smi not found).\n\nPlease pick your VRAM size from the list.")
+                return
+        elif preset in presets:
+            available = float(preset.split("GB")[0]) * GIB
+        else:
+            return
+
+        # Plan from the configured models' metadata; fall back to the fixed presets
+        model_paths = [p for p in (self.worldbuilding_model_var.get(), self.explicit_model_var.get()) if p and Path(p).exists()]
+        cache_type = self.kv_cache_var.get()
+        plan, errors = plan_for_models(model_paths, available, cache_type_k=cache_type, cache_type_v=cache_type)
+        for path, error in errors.items():
+            print(f"[WARNING] Could not plan memory for {path}: {error}")
+
+        if plan:
+            self.context_var.set(str(plan["context_size"]))
+            self.gpu_layers_var.set(str(plan["gpu_layers"]))
+            self.parallel_var.set(str(plan["parallel"]))
+            if preset in presets:
+                self.max_tokens_var.set(presets[preset]["max_tokens"])
+            self.status_bar.config(text=f"Planned for {available / GIB:.0f} GB: {format_plan(plan)}")
+        elif preset in presets:
             config = presets[preset]
             self.context_var.set(config["context_size"])
             self.gpu_layers_var.set(config["gpu_layers"])
             self.max_tokens_var.set(config["max_tokens"])
 
             self.status_bar.config(text=f"Applied preset: {preset} - {config['description']}")
+        else:
+            self.status_bar.config(text="Could not read the configured models - set the model paths first")
 
     def browse_server(self):
         """Browse for llama-server executable."""
@@ -1363,16 +1686,29 @@ class NarrAiderUnified:
 
     def save_config(self):
         """Save configuration to file."""
+        global CONFIG
         try:
-            config = {
+            # Start from the current config so settings without a widget survive
+            config = dict(CONFIG)
+
+            # LoRA roles keep their adapters; only the base model path is edited here
+            models = dict(CONFIG.get("models", {}))
+            for model_type, path in (("worldbuilding", self.worldbuilding_model_var.get()),
+                                     ("explicit", self.explicit_model_var.get())):
+                if isinstance(models.get(model_type), dict):
+                    models[model_type] = {**models[model_type], "base": path}
+                else:
+                    models[model_type] = path
+
+            config.update({
                 "llama_server_path": self.server_path_var.get(),
-                "models": {
-                    "worldbuilding": self.worldbuilding_model_var.get(),
-                    "explicit": self.explicit_model_var.get()
-                },
+                "models": models,
                 "server_port": int(self.port_var.get()),
                 "context_size": int(self.context_var.get()),
                 "gpu_layers": int(self.gpu_layers_var.get()),
+                "cache_type_k": self.kv_cache_var.get(),
+                "cache_type_v": self.kv_cache_var.get(),
+                "parallel": int(self.parallel_var.get()),
                 "output_folder": self.output_folder_var.get(),
                 "keep_server_loaded": self.keep_server_var.get(),
                 "generation_params": {
@@ -1382,7 +1718,7 @@ class NarrAiderUnified:
                     "repeat_penalty": float(self.repeat_penalty_var.get()),
                     "max_tokens": int(self.max_tokens_var.get())
                 }
-            }
+            })
 
             config_path = Path(__file__).parent / "narraider_config.json"
             print(f"[DEBUG] Saving config to: {config_path}")
@@ -1394,7 +1730,6 @@ class NarrAiderUnified:
             print("[DEBUG] Config file written successfully")
 
             # Reload config in memory
-            global CONFIG
             import narraider
             CONFIG = config
             narraider.CONFIG = config
@@ -1419,6 +1754,8 @@ class NarrAiderUnified:
             self.port_var.set("8081")
             self.context_var.set("8192")
             self.gpu_layers_var.set("99")
+            self.kv_cache_var.set("f16")
+            self.parallel_var.set("1")
             self.temp_var.set(0.8)
             self.top_p_var.set(0.9)
             self.top_k_var.set("40")
@@ -1473,6 +1810,7 @@ For Scenes:
 - Example: "Tense dialogue in rain-soaked alley, former allies now enemies"
 
 *** MODELS:
+- Auto (routing table): Picks the model for each content type ("routing" in narraider_config.json)
 - Creative Writing: For characters, worldbuilding, general scenes
 - Explicit/Adult: For mature content and adult scenes
 
@@ -1487,6 +1825,7 @@ NarrAider/outputs/[content_type]/
 
 *** KEYBOARD SHORTCUTS:
 Ctrl+G: Generate
+Esc: Cancel generation
 Ctrl+S: Save
 Ctrl+C: Copy
 Ctrl+Q: Quit
@@ -1533,6 +1872,84 @@ Just keep your targeting systems locked on your story goals!" - Trowa Barton (pr
         self.type_description.insert("1.0", desc)
         self.type_description.config(state=tk.DISABLED)
 
+        self.schedule_preload()
+
+    def model_label(self, model_type):
+        """Display name of a model role."""
+        return MODEL_ROLE_LABELS.get(model_type, model_type)
+
+    def selected_model(self):
+        """Model type for the current Model dropdown and content type selection."""
+        label = self.model_type.get()
+        if label in self.model_labels:
+            return self.model_labels[label]
+        return route_model(self.type_map.get(self.content_type.get(), "character"))
+
+    def schedule_preload(self):
+        """Get the selected model ready while the user is still writing the prompt.
+
+        The model file is prewarmed right away; the server is started once the
+        selection has been stable for PRELOAD_DELAY_MS. A preload of a model
+        that is no longer selected is cancelled immediately.
+        """
+        model = self.selected_model()
+        prewarm_model_type(model)
+
+        if self.preload_token and self.preload_model != model:
+            self.preload_token.cancel()
+            self.preload_token = None
+            self.preload_model = None
+            self.status_bar.config(text="Ready")
+
+        if self.preload_after_id:
+            self.root.after_cancel(self.preload_after_id)
+        self.preload_after_id = self.root.after(PRELOAD_DELAY_MS, self.start_preload)
+
+    def start_preload(self):
+        """Start loading the selected model in the background."""
+        self.preload_after_id = None
+        model = self.selected_model()
+        if (self.generating or self.preload_token or narraider.CURRENT_MODEL == model
+                or not CONFIG.get("preload_models", True)):
+            return
+
+        token = CancellationToken()
+        self.preload_token = token
+        self.preload_model = model
+        self.preload_started = time.time()
+
+        thread = threading.Thread(target=self.preload_thread, args=(model, token))
+        thread.daemon = True
+        thread.start()
+        self.update_preload_status(token)
+
+    def preload_thread(self, model, token):
+        """Background model preload thread."""
+        try:
+            ready = ensure_model_loaded(model, token)
+        except GenerationCancelled:
+            return
+        except Exception as e:
+            print(f"[WARNING] Model preload failed: {e}")
+            ready = False
+        self.gen_queue.put(("preload", ready, model, token))
+
+    def update_preload_status(self, token):
+        """Show preload progress in the status bar until it finishes."""
+        if token is not self.preload_token or self.generating:
+            return
+
+        label = self.model_label(self.preload_model)
+        elapsed = int(time.time() - self.preload_started)
+        prewarmer = narraider.PREWARMER
+        model_path = get_model_path(self.preload_model) or ""
+        if prewarmer and not prewarmer.finished and prewarmer.path == str(Path(model_path).resolve()):
+            text = f"Preloading {label} model: reading from disk {prewarmer.progress:.0%} ({elapsed}s)"
+        else:
+            text = f"Preloading {label} model: loading into memory ({elapsed}s)"
+        self.status_bar.config(text=text)
+        self.root.after(500, self.update_preload_status, token)
+
     def show_example(self):
         """Show example prompt for current content type."""
         selected = self.content_type.get()
@@ -1866,11 +2283,18 @@ Custom prompts appear below built-in ones. Edit them and click 'Save Changes' to
             messagebox.showerror("Error", "Please enter a prompt.")
             return
 
-        model_display = self.model_type.get()
-        model = "explicit" if "Explicit" in model_display else "worldbuilding"
+        model = self.selected_model()
+
+        # Generation takes over a running preload (it waits for it to finish)
+        if self.preload_after_id:
+            self.root.after_cancel(self.preload_after_id)
+            self.preload_after_id = None
+        self.preload_token = None
+        self.preload_model = None
 
         output_format = self.output_format.get()
         system_prompt = self.system_prompt.get()
+        variants = self.variants.get()
 
         # Update UI
         self.generating = True
@@ -1878,26 +2302,83 @@ Custom prompts appear below built-in ones. Edit them and click 'Save Changes' to
         self.status_bar.config(text="Generating...")
         self.progress.pack(fill=tk.X, pady=(5, 0))
         self.progress.start()
+        self.cancel_token = CancellationToken()
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.cancel_btn.pack(fill=tk.X, pady=(5, 0))
 
         # Clear output
         self.output_text.config(state=tk.NORMAL)
         self.output_text.delete("1.0", tk.END)
         self.output_text.insert("1.0", "[...] Generating, please wait...\n\nThis may take 30-120 seconds.\n\nModel is processing your request...")
         self.output_text.config(state=tk.DISABLED)
+        self.streaming = False
+        self.show_variant_panes(variants)
 
         # Start thread
         thread = threading.Thread(
             target=self.generate_thread,
-            args=(content_type, prompt, model, output_format, system_prompt)
+            args=(content_type, prompt, model, output_format, system_prompt, self.cancel_token, variants)
         )
         thread.daemon = True
         thread.start()
 
-    def generate_thread(self, content_type, prompt, model, output_format, system_prompt):
+    def cancel_generation(self):
+        """Cancel the running generation; the model stays loaded."""
+        if self.generating and self.cancel_token:
+            self.cancel_token.cancel()
+            self.cancel_btn.config(state=tk.DISABLED)
+            self.status_bar.config(text="Cancelling...")
+
+    def show_variant_panes(self, count):
+        """Show count output panes side by side, or the single output box for one."""
+        for widget in self.variant_frame.winfo_children():
+            widget.destroy()
+        self.variant_texts = []
+        if count < 2:
+            self.variant_frame.pack_forget()
+            self.output_text.pack(fill=tk.BOTH, expand=True, before=self.output_btn_frame)
+            return
+
+        self.output_text.pack_forget()
+        self.variant_frame.pack(fill=tk.BOTH, expand=True, before=self.output_btn_frame)
+        for number in range(1, count + 1):
+            pane = ttk.LabelFrame(self.variant_frame, text=f"Variant {number}", padding=2)
+            pane.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=2)
+            text = scrolledtext.ScrolledText(pane, wrap=tk.WORD, state=tk.DISABLED, font=("Consolas", 9), width=20)
+            text.pack(fill=tk.BOTH, expand=True)
+            self.variant_texts.append(text)
+
+    def set_variant_text(self, index, text, append=False):
+        """Replace (or append to) the text of one variant pane."""
+        pane = self.variant_texts[index]
+        pane.config(state=tk.NORMAL)
+        if not append:
+            pane.delete("1.0", tk.END)
+        pane.insert(tk.END, text)
+        pane.see(tk.END)
+        pane.config(state=tk.DISABLED)
+
+    def generate_thread(self, content_type, prompt, model, output_format, system_prompt, cancel_token, variants=1):
         """Background generation thread."""
         try:
-            result = generate_content(content_type, prompt, model, output_format, system_prompt)
+            if variants > 1:
+                results = generate_variants(
+                    content_type, prompt, variants, model, output_format, system_prompt,
+                    on_text=lambda index, text: self.gen_queue.put(("variant-stream", text, index, None)),
+                    on_retry=lambda index, reason: self.gen_queue.put(("variant-restart", reason, index, None)),
+                    cancel_token=cancel_token
+                )
+                self.gen_queue.put(("variants", results, content_type, output_format))
+                return
+            result = generate_content(
+                content_type, prompt, model, output_format, system_prompt,
+                on_text=lambda text: self.gen_queue.put(("stream", text, None, None)),
+                on_retry=lambda reason: self.gen_queue.put(("restart", reason, None, None)),
+                cancel_token=cancel_token
+            )
             self.gen_queue.put(("success", result, content_type, output_format))
+        except GenerationCancelled:
+            self.gen_queue.put(("cancelled", None, None, None))
         except Exception as e:
             self.gen_queue.put(("error", str(e), None, None))
 
@@ -1907,6 +2388,69 @@ Custom prompts appear below built-in ones. Edit them and click 'Save Changes' to
             while True:
                 status, result, content_type, output_format = self.gen_queue.get_nowait()
 
+                if status == "stream":
+                    # Append sanitized text as it is generated
+                    self.output_text.config(state=tk.NORMAL)
+                    if not self.streaming:
+                        self.output_text.delete("1.0", tk.END)
+                        self.streaming = True
+                    self.output_text.insert(tk.END, result)
+                    self.output_text.see(tk.END)
+                    self.output_text.config(state=tk.DISABLED)
+                    continue
+
+                if status == "variant-stream":
+                    self.set_variant_text(content_type, result, append=True)
+                    continue
+
+                if status == "variant-restart":
+                    # Only this variant starts over
+                    self.set_variant_text(content_type, "")
+                    continue
+
+                if status == "preload":
+                    # Ignore preloads that were cancelled or taken over by a generation
+                    if output_format is self.preload_token:
+                        self.preload_token = None
+                        self.preload_model = None
+                        if result:
+                            self.status_bar.config(text=f"[OK] {self.model_label(content_type)} model loaded and ready")
+                        else:
+                            self.status_bar.config(text="[ERROR] Model preload failed - see console for details")
+                    continue
+
+                if status == "catalog":
+                    # Rescan Folder finished (see rescan_history)
+                    self.search_history()
+                    if isinstance(result, str):
+                        self.history_status.config(text=f"[ERROR] Rescan failed: {result}")
+                    else:
+                        self.history_status.config(text=f"[OK] Rescan: {result[0]} output(s) catalogued, {result[1]} removed")
+                    continue
+
+                if status == "saved":
+                    # The output writer finished a save (see report_saved)
+                    if result:
+                        self.status_bar.config(text=f"[OK] Saved to {result}")
+                        if self.notebook.select() == str(self.tab_history):
+                            self.search_history()
+                    else:
+                        self.status_bar.config(text="[ERROR] Saving failed - see console for details")
+                        messagebox.showerror("Error", f"Could not save the output:\n{content_type}")
+                    continue
+
+                if status == "restart":
+                    # Runaway generation was aborted, or the server crashed, and it is being retried
+                    self.output_text.config(state=tk.NORMAL)
+                    self.output_text.delete("1.0", tk.END)
+                    self.output_text.config(state=tk.DISABLED)
+                    self.streaming = False
+                    if result.startswith("server crashed"):
+                        self.status_bar.config(text=f"The model {result} - restarting it and generating again...")
+                    else:
+                        self.status_bar.config(text=f"Output degenerated ({result}) - retrying with adjusted sampling...")
+                    continue
+
                 if status == "success":
                     # Update output
                     try:
@@ -1923,11 +2467,32 @@ Custom prompts appear below built-in ones. Edit them and click 'Save Changes' to
                         self.output_text.insert(tk.END, str(result) if result else "Error: No output generated")
                         self.output_text.config(state=tk.DISABLED)
 
-                    self.status_bar.config(text="[OK] Generation complete!")
-
-                    # Auto-save
-                    saved_path = save_output(result, content_type, output_format)
-                    messagebox.showinfo("Success", f"Generated and saved to:\n{saved_path}")
+                    if result:
+                        self.status_bar.config(text="[OK] Generation complete - saving...")
+                        # Auto-save on the writer thread; "saved" reports back
+                        save_output(result, content_type, output_format, wait=False, on_saved=self.report_saved)
+                    else:
+                        self.status_bar.config(text="[ERROR] Generation failed - no output")
+                        messagebox.showerror("Error", "Generation produced no output - see console for details")
+
+                elif status == "variants":
+                    for index, variant in enumerate(result):
+                        self.set_variant_text(index, variant or "[ERROR] This variant failed - see console")
+
+                    # All variants in the (hidden) single output box, for Save and Copy
+                    self.output_text.config(state=tk.NORMAL)
+                    self.output_text.delete("1.0", tk.END)
+                    self.output_text.insert(tk.END, "\n\n".join(
+                        f"===== Variant {number} =====\n\n{variant or ''}" for number, variant in enumerate(result, 1)
+                    ))
+                    self.output_text.config(state=tk.DISABLED)
+
+                    saved = save_variants(result, content_type, output_format, wait=False, on_saved=self.report_saved)
+                    if saved:
+                        self.status_bar.config(text=f"[OK] {len(saved)} of {len(result)} variants generated - saving...")
+                    else:
+                        self.status_bar.config(text="[ERROR] Generation failed")
+                        messagebox.showerror("Error", "All variants failed - see console for details")
 
                 elif status == "error":
                     try:
@@ -1941,11 +2506,21 @@ Custom prompts appear below built-in ones. Edit them and click 'Save Changes' to
                     self.status_bar.config(text="[ERROR] Generation failed")
                     messagebox.showerror("Error", f"Generation failed:\n{result}")
 
+                elif status == "cancelled":
+                    # Keep whatever was streamed so far; nothing is saved
+                    if not self.streaming:
+                        self.output_text.config(state=tk.NORMAL)
+                        self.output_text.delete("1.0", tk.END)
+                        self.output_text.config(state=tk.DISABLED)
+                    self.status_bar.config(text="[X] Generation cancelled (model stays loaded)")
+
                 # Reset UI
                 self.generating = False
+                self.cancel_token = None
                 self.generate_btn.config(state=tk.NORMAL)
                 self.progress.stop()
                 self.progress.pack_forget()
+                self.cancel_btn.pack_forget()
 
         except queue.Empty:
             pass
@@ -1982,6 +2557,7 @@ Custom prompts appear below built-in ones. Edit them and click 'Save Changes' to
 
     def clear_output(self):
         """Clear output."""
+        self.show_variant_panes(1)
         self.output_text.config(state=tk.NORMAL)
         self.output_text.delete("1.0", tk.END)
         self.output_text.config(state=tk.DISABLED)
@@ -2005,6 +2581,7 @@ def main():
     # Handle close
     def on_closing():
         if messagebox.askokcancel("Quit", "Quit NarrAider?"):
+            flush_outputs()  # Outputs still being written
             kill_server()
             root.destroy()
 
@@ -2012,6 +2589,7 @@ def main():
 
     # Bind keyboard shortcuts
     root.bind('<Control-g>', lambda e: app.generate_btn.invoke())
+    root.bind('<Escape>', lambda e: app.cancel_generation())
     root.bind('<Control-s>', lambda e: app.save_file())
     root.bind('<Control-q>', lambda e: on_closing())
 
@@ -51,7 +51,9 @@ def test_installation():
 
         # Check llama server path
         server_path = Path(config.get("llama_server_path", ""))
-        if server_path.exists():
+        if config.get("attach_only", False):
+            print(f"   [OK] attach_only: using running servers, llama-server is not started")
+        elif server_path.exists():
             print(f"   [OK] llama-server found: {server_path}")
         else:
             print(f"   [X] llama-server NOT found: {server_path}")
@@ -61,6 +63,22 @@ def test_installation():
         # Check models
         models = config.get("models", {})
         for model_type, model_path in models.items():
+            if isinstance(model_path, dict):
+                # Role with LoRA adapters and/or a draft model on a base model
+                for adapter in model_path.get("adapters", []):
+                    adapter_path = Path(adapter if isinstance(adapter, str) else adapter.get("path", ""))
+                    if adapter_path.exists():
+                        print(f"   [OK] LoRA adapter for '{model_type}': {adapter_path.name}")
+                    else:
+                        print(f"   [X] LoRA adapter for '{model_type}' NOT found: {adapter_path}")
+                        all_good = False
+                draft = model_path.get("draft")
+                if draft and Path(draft).exists():
+                    print(f"   [OK] Draft model for '{model_type}': {Path(draft).name}")
+                elif draft:
+                    print(f"   [X] Draft model for '{model_type}' NOT found: {draft}")
+                    all_good = False
+                model_path = model_path.get("base", "")
             model_file = Path(model_path)
             if model_file.exists():
                 size_gb = model_file.stat().st_size / (1024**3)
@@ -70,6 +88,38 @@ def test_installation():
                 print(f"      Download from HuggingFace (see README.md)")
                 all_good = False
 
+        # Check that the backends answer
+        backends = config.get("backends", [])
+        pool = None
+        if backends:
+            from narraider_backends import BackendPool
+
+            def role_for(model):
+                # Same naming as narraider._role_for_model: the role with that model file, else the file's name
+                for model_type, entry in models.items():
+                    path = entry.get("base") if isinstance(entry, dict) else entry
+                    if path and Path(path).name == Path(model).name:
+                        return model_type
+                return Path(model).stem
+
+            pool = BackendPool.from_config(backends, role_for)
+            for backend in pool.backends:
+                if backend.probe():
+                    print(f"   [OK] Backend for '{backend.model or '?'}': {backend.url}")
+                else:
+                    print(f"   [!] Backend for '{backend.model or '?'}' not answering: {backend.url}")
+
+        # Check that the routing table only refers to configured roles
+        routing = config.get("routing", {})
+        routed = [routing.get("default")] + list(routing.get("content_types", {}).values())
+        routed += [rule.get("model") for rule in routing.get("length_targets", [])]
+        # Attach-only backends may leave the role to discovery (None if they did not answer)
+        roles = set(models) | {backend.model for backend in (pool.backends if pool else []) if backend.model}
+        for model_type in sorted({m for m in routed if m}):
+            if model_type not in roles:
+                print(f"   [X] Routing refers to unknown model role '{model_type}'")
+                all_good = False
+
     else:
         print(f"   [X] Config file NOT found")
         print(f"      Run narraider.py once to create default config")
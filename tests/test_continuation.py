@@ -0,0 +1,87 @@
+"""Generations that hit max_tokens are continued, whichever way the server reports the limit."""
+
+import json
+
+import pytest
+
+import narraider
+
+# How llama-server reported the token limit before and after stop_type
+LIMIT_SHAPES = [{"stopped_limit": True}, {"stop_type": "limit", "stopped_limit": False}]
+
+
+class FakeResponse:
+    def __init__(self, events, stream):
+        self.events = events
+        self.stream = stream
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        # A non-streamed reply is the content plus the final fields
+        reply = dict(self.events[-1])
+        reply["content"] = "".join(event.get("content", "") for event in self.events)
+        return reply
+
+    def iter_lines(self):
+        for event in self.events:
+            yield f"data: {json.dumps(event)}".encode("utf-8")
+
+
+class FakeServer:
+    """Answers the first request at the token limit and the continuation with a normal stop."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.prompts = []
+
+    def post(self, url, json=None, stream=False, timeout=None):
+        self.prompts.append(json["prompt"])
+        if len(self.prompts) == 1:
+            final = {"stop": True, "tokens_predicted": 100, "tokens_evaluated": 20, **self.limit}
+            events = [{"content": "The tower stood alone."}, {"content": "", **final}]
+        else:
+            final = {"stop": True, "tokens_predicted": 5, "tokens_evaluated": 120, "stop_type": "eos"}
+            events = [{"content": " Nobody came back."}, {"content": "", **final}]
+        return FakeResponse(events, stream)
+
+
+@pytest.fixture
+def server(monkeypatch, request):
+    fake = FakeServer(request.param)
+    config = narraider.get_default_config()
+    config["degeneration_guard"]["enabled"] = False
+    monkeypatch.setattr(narraider, "CONFIG", config)
+    monkeypatch.setattr(narraider, "ACTIVE_PORT", 8081)
+    monkeypatch.setattr(narraider, "_http", lambda: fake)
+    monkeypatch.setattr(narraider, "record_metric", lambda *args, **fields: None)
+    monkeypatch.setattr(narraider, "update_tokens_per_word", lambda *args: None)
+    return fake
+
+
+@pytest.mark.parametrize("server", LIMIT_SHAPES, indirect=True)
+def test_streamed_generation_is_continued(server):
+    pieces = []
+    text = narraider.generate_completion("Write.", on_token=pieces.append)
+    assert text == "The tower stood alone. Nobody came back."
+    assert len(server.prompts) == 2
+    assert server.prompts[1].endswith("The tower stood alone.")
+
+
+@pytest.mark.parametrize("server", LIMIT_SHAPES, indirect=True)
+def test_plain_generation_is_continued(server):
+    text = narraider.generate_completion("Write.")
+    assert text == "The tower stood alone. Nobody came back."
+    assert len(server.prompts) == 2
+
+
+@pytest.mark.parametrize("event", [{"stop": True, "stop_type": "eos"}, {"stop": True, "stop_type": "word"}])
+def test_other_stops_are_not_limits(event):
+    assert not narraider._completion_event(event).get("stopped_limit")
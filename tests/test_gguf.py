@@ -0,0 +1,69 @@
+"""GGUF header parsing, including damaged files."""
+
+import struct
+from pathlib import Path
+
+import pytest
+
+import narraider_gguf
+from narraider_gguf import GGUFError, read_gguf_metadata, scan_models
+
+
+def gguf_string(text):
+    data = text.encode("utf-8")
+    return struct.pack("<Q", len(data)) + data
+
+
+def gguf_file(metadata_bytes=None, tensor_data=64):
+    """A minimal GGUF v3 file: a few metadata keys and one F32 tensor."""
+    if metadata_bytes is None:
+        metadata_bytes = [
+            gguf_string("general.architecture") + struct.pack("<I", 8) + gguf_string("llama"),
+            gguf_string("llama.block_count") + struct.pack("<I", 4) + struct.pack("<I", 2),
+            gguf_string("llama.context_length") + struct.pack("<I", 4) + struct.pack("<I", 4096),
+        ]
+    header = b"GGUF" + struct.pack("<IQQ", 3, 1, len(metadata_bytes)) + b"".join(metadata_bytes)
+    header += gguf_string("output.weight") + struct.pack("<I", 1) + struct.pack("<Q", 16)
+    header += struct.pack("<I", 0) + struct.pack("<Q", 0)  # F32, offset 0
+    padding = -len(header) % 32
+    return header + b"\0" * padding + b"\0" * tensor_data
+
+
+@pytest.fixture(autouse=True)
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(narraider_gguf, "INDEX_PATH", tmp_path / "model_index.json")
+    monkeypatch.setattr(narraider_gguf, "_INDEX", None)
+
+
+def test_reads_metadata_and_tensors(tmp_path):
+    path = tmp_path / "good.gguf"
+    path.write_bytes(gguf_file())
+    metadata, tensors = read_gguf_metadata(path)
+    assert metadata["general.architecture"] == "llama"
+    assert metadata["llama.context_length"] == 4096
+    assert tensors["output.weight"] == {"shape": [16], "bytes": 64}
+
+
+@pytest.mark.parametrize("cut", [3, 10, 30, 60, 120])
+def test_truncated_header(tmp_path, cut):
+    path = tmp_path / "truncated.gguf"
+    path.write_bytes(gguf_file()[:cut])
+    with pytest.raises(GGUFError):
+        read_gguf_metadata(path)
+
+
+def test_unknown_value_type(tmp_path):
+    path = tmp_path / "corrupt.gguf"
+    path.write_bytes(gguf_file([gguf_string("general.name") + struct.pack("<I", 99) + b"\0" * 8]))
+    with pytest.raises(GGUFError, match="Unknown GGUF value type 99"):
+        read_gguf_metadata(path)
+
+
+def test_scan_reports_damaged_files(tmp_path):
+    (tmp_path / "good.gguf").write_bytes(gguf_file())
+    (tmp_path / "corrupt.gguf").write_bytes(gguf_file([gguf_string("x") + struct.pack("<I", 250)]))
+    (tmp_path / "empty.gguf").write_bytes(b"")
+    results = {Path(path).name: info for path, info in scan_models(tmp_path).items()}
+    assert results["good.gguf"]["layers"] == 2
+    assert "error" in results["corrupt.gguf"]
+    assert "error" in results["empty.gguf"]
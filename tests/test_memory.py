@@ -0,0 +1,70 @@
+"""Memory planning from model metadata alone (no GPU, no model file)."""
+
+import pytest
+
+from narraider_memory import (
+    CONTEXT_GRANULARITY, DEFAULT_RESERVE_BYTES, GIB, estimate_memory, kv_bytes_per_token, plan_memory
+)
+
+MIB = 1024 ** 2
+
+# What narraider_gguf.parse_gguf() reports, for a small made-up model
+INFO = {
+    "layers": 10,
+    "layer_bytes": 1000 * MIB,
+    "output_bytes": 100 * MIB,
+    "head_count_kv": 8,
+    "key_length": 128,
+    "value_length": 128,
+    "embedding_length": 4096,
+    "vocab_size": 32000,
+    "context_length": 8192,
+}
+
+
+def test_kv_bytes_per_token():
+    assert kv_bytes_per_token(INFO) == 8 * (128 * 2 + 128 * 2)
+    assert kv_bytes_per_token(INFO, "q8_0", "q8_0") == 8 * 2 * 128 * 34 / 32
+    with pytest.raises(ValueError):
+        kv_bytes_per_token(INFO, "q3_0")
+
+
+def test_estimate_grows_with_context_and_layers():
+    full = estimate_memory(INFO, 4096, 11)
+    assert full >= INFO["layer_bytes"] + INFO["output_bytes"] + kv_bytes_per_token(INFO) * 4096 * 10
+    assert estimate_memory(INFO, 8192, 11) > full
+    assert estimate_memory(INFO, 4096, 5) < full
+
+
+def test_whole_model_fits():
+    available = 4 * GIB
+    plan = plan_memory(INFO, available, context_per_slot=4096)
+    assert plan["full_offload"] and plan["gpu_layers"] == INFO["layers"] + 1
+    assert 1 <= plan["parallel"] <= 4
+    assert plan["context_size"] % CONTEXT_GRANULARITY == 0
+    assert plan["context_size"] <= plan["parallel"] * INFO["context_length"]
+    assert plan["context_size"] >= plan["parallel"] * 4096
+    assert plan["total_bytes"] <= available
+    needed = estimate_memory(INFO, plan["context_size"], plan["gpu_layers"]) + DEFAULT_RESERVE_BYTES
+    assert needed <= available
+
+
+def test_partial_offload_when_the_model_does_not_fit():
+    available = int(1.2 * GIB)
+    plan = plan_memory(INFO, available, context_per_slot=8192)
+    assert not plan["full_offload"]
+    assert plan["parallel"] == 1
+    assert 0 < plan["gpu_layers"] < INFO["layers"]
+    assert estimate_memory(INFO, plan["context_size"], plan["gpu_layers"]) + DEFAULT_RESERVE_BYTES <= available
+
+
+def test_quantized_cache_leaves_room_for_more_context():
+    f16 = plan_memory(INFO, 3 * GIB, context_per_slot=2048, max_slots=8)
+    q8 = plan_memory(INFO, 3 * GIB, context_per_slot=2048, max_slots=8, cache_type_k="q8_0", cache_type_v="q8_0")
+    assert q8["context_size"] > f16["context_size"]
+
+
+def test_missing_metadata():
+    info = {key: value for key, value in INFO.items() if key != "head_count_kv"}
+    with pytest.raises(ValueError, match="head_count_kv"):
+        plan_memory(info, 8 * GIB)